@@ -0,0 +1,212 @@
+"""
+Offline end-to-end throughput benchmark for `TubeUp.archive_urls`.
+
+A fake yt-dlp extractor hands out videos whose media is served by a local
+`StubIA`, and every archive.org request is routed to that same stub, so the
+whole download/upload pipeline runs without touching the network.
+
+Usage::
+
+    python -m benchmarks.archive_urls --videos 40 --size 4 --concurrency 1,2,4
+
+``--stream`` runs the same videos through the experimental streaming upload,
+which sends the media as a multipart upload without writing it to disk.
+``--limit-download`` and ``--limit-upload`` give all the workers shared
+budgets, in MiB/s, so the throughput of each stage can be checked against
+them. ``--storage s3`` uploads to the S3-compatible store of the stub
+instead of its IA-S3 endpoint, and ``--storage local`` stages the items in
+a local directory.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+from unittest.mock import patch
+
+from internetarchive.session import ArchiveSession
+from yt_dlp import YoutubeDL
+from yt_dlp.extractor.common import InfoExtractor
+
+from tubeup.TubeUp import TubeUp
+from tubeup.bandwidth import BandwidthManager
+from tubeup.storage import LocalStorage, S3Storage
+from .stub_ia import StubIA, StubAdapter
+
+
+IA_CONFIG = '[s3]\naccess = benchAccess\nsecret = benchSecret\n'
+
+
+class BenchIE(InfoExtractor):
+    IE_NAME = 'bench'
+    _VALID_URL = r'https?://bench\.invalid/watch/(?P<id>[\w-]+)'
+
+    media_url = None
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {
+            'id': video_id,
+            'title': 'Benchmark video %s' % video_id,
+            'url': self.media_url(video_id),
+            'ext': 'mp4',
+            'uploader': 'tubeup-bench',
+            'upload_date': '20200101',
+            'description': 'Synthetic video\nused by the tubeup benchmark.',
+            'tags': ['bench', 'tubeup'],
+        }
+
+
+class BenchYoutubeDL(YoutubeDL):
+    """`YoutubeDL` that only knows about `BenchIE`."""
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(BenchIE())
+
+
+class StageTimes(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, dirs, names in os.walk(path) for name in names)
+
+
+def run_level(stub, workdir, concurrency, urls, ia_config_path,
+              stream_upload=False, bandwidth=None, storage=None):
+    stage_times = StageTimes()
+    archived = []
+    errors = []
+
+    def worker(index, worker_urls):
+        tu = TubeUp(dir_path=os.path.join(workdir, 'worker-%d' % index),
+                    ia_config_path=ia_config_path,
+                    stream_upload=stream_upload,
+                    bandwidth=bandwidth, storage=storage)
+        tu.timer.add_hook(
+            lambda span: stage_times.add(span['stage'], span['duration']))
+        try:
+            for url in worker_urls:
+                archived.extend(tu.archive_urls([url]))
+        except Exception as exc:
+            errors.append(exc)
+
+    if isinstance(storage, LocalStorage):
+        def stored_bytes():
+            return directory_size(storage.directory)
+    else:
+        def stored_bytes():
+            return stub.bytes_received
+
+    received_before = stored_bytes()
+    threads = [threading.Thread(target=worker, args=(i, urls[i::concurrency]))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    return {
+        'concurrency': concurrency,
+        'videos': len(archived),
+        'seconds': elapsed,
+        'videos_per_hour': len(archived) / elapsed * 3600,
+        'bytes_per_second': (stored_bytes() - received_before) / elapsed,
+        'stages': stage_times.samples,
+    }
+
+
+def print_report(result):
+    print('concurrency=%(concurrency)d videos=%(videos)d '
+          'elapsed=%(seconds).2fs videos/hour=%(videos_per_hour).0f '
+          'upload=%(bytes_per_second).0f B/s' % result)
+    for stage, samples in sorted(result['stages'].items()):
+        print('  %-12s n=%-4d mean=%.3fs p50=%.3fs p95=%.3fs' % (
+            stage, len(samples), sum(samples) / len(samples),
+            percentile(samples, 50), percentile(samples, 95)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--videos', type=int, default=20,
+                        help='videos to archive per concurrency level')
+    parser.add_argument('--size', type=float, default=1,
+                        help='size of each media file in MiB')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every archive.org request')
+    parser.add_argument('--concurrency', default='1,2,4',
+                        help='comma separated list of worker counts')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream the media instead of downloading it')
+    parser.add_argument('--limit-download', type=float,
+                        help='MiB/s shared by the downloads of all workers')
+    parser.add_argument('--limit-upload', type=float,
+                        help='MiB/s shared by the uploads of all workers')
+    parser.add_argument('--storage', choices=('ia', 's3', 'local'),
+                        default='ia', help='where the items are uploaded')
+    parser.add_argument('--storage-workers', type=int, default=4,
+                        help='files of an item stored at the same time by '
+                             'the s3 and local storages')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='tubeup-bench-')
+    ia_config_path = os.path.join(workdir, 'ia.ini')
+    with open(ia_config_path, 'w') as f:
+        f.write(IA_CONFIG)
+
+    with StubIA(media_size=int(args.size * 1024 * 1024),
+                latency=args.latency) as stub:
+        original_init = ArchiveSession.__init__
+
+        def stub_session_init(session, *a, **kw):
+            original_init(session, *a, **kw)
+            for prefix in ('https://archive.org', 'https://s3.us.archive.org'):
+                session.mount(prefix, StubAdapter(stub.base_url))
+
+        BenchIE.media_url = staticmethod(stub.media_url)
+        bandwidth = BandwidthManager(
+            *(limit * 1024 * 1024 if limit else None
+              for limit in (args.limit_download, args.limit_upload)))
+        storage = None
+        if args.storage == 's3':
+            storage = S3Storage(stub.s3_endpoint, 'bench', 'benchAccess',
+                                'benchSecret', workers=args.storage_workers)
+        elif args.storage == 'local':
+            storage = LocalStorage(os.path.join(workdir, 'staged'),
+                                   workers=args.storage_workers)
+        try:
+            with patch.object(ArchiveSession, '__init__', stub_session_init), \
+                    patch('tubeup.TubeUp.YoutubeDL', BenchYoutubeDL):
+                for level in (int(c) for c in args.concurrency.split(',')):
+                    urls = ['https://bench.invalid/watch/c%d-v%d' % (level, i)
+                            for i in range(args.videos)]
+                    print_report(run_level(stub, workdir, level, urls,
+                                           ia_config_path, args.stream,
+                                           bandwidth, storage))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Offline benchmark of yt-dlp's HLS downloads with the options built by
+`TubeUp`, for several ``--fragments`` values.
+
+A local stub server hands out an HLS playlist and its segments, waiting
+``--latency`` milliseconds before every segment and sending each one at
+``--rate`` MiB/s, like a CDN that is far away and throttles every
+connection. Downloading one fragment at a time is then bound by the
+latency and the per-connection rate, not by the link.
+
+Usage::
+
+    python -m benchmarks.fragments --segments 40 --segment-size 1 --fragments 1,4,8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from yt_dlp import YoutubeDL
+from yt_dlp.extractor.common import InfoExtractor
+
+from tubeup.TubeUp import TubeUp
+
+
+class StubHLS(object):
+    """
+    Serves ``/video.m3u8`` and its ``/segment-<n>.ts`` segments from a
+    daemon thread.
+    """
+    def __init__(self, segments, segment_size, latency=0.05, rate=None):
+        self.segments = segments
+        self.segment = os.urandom(segment_size)
+        self.latency = latency
+        self.rate = rate
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/video.m3u8':
+                    body = stub.playlist().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type',
+                                     'application/vnd.apple.mpegurl')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'video/mp2t')
+                self.send_header('Content-Length', str(len(stub.segment)))
+                self.end_headers()
+                stub.send(self.wfile)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/video.m3u8' % self.server.server_port
+
+    def playlist(self):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4',
+                 '#EXT-X-MEDIA-SEQUENCE:0']
+        for number in range(self.segments):
+            lines += ['#EXTINF:4.0,', 'segment-%d.ts' % number]
+        lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n'
+
+    def send(self, wfile):
+        if not self.rate:
+            wfile.write(self.segment)
+            return
+        chunk_size = 64 * 1024
+        for offset in range(0, len(self.segment), chunk_size):
+            wfile.write(self.segment[offset:offset + chunk_size])
+            time.sleep(chunk_size / self.rate)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BenchHLSIE(InfoExtractor):
+    IE_NAME = 'bench:hls'
+    _VALID_URL = r'https?://bench\.invalid/hls/(?P<id>[\w-]+)'
+
+    playlist_url = None
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {
+            'id': video_id,
+            'title': 'Benchmark video %s' % video_id,
+            'formats': [{
+                'format_id': 'hls',
+                'url': self.playlist_url,
+                'protocol': 'm3u8_native',
+                'ext': 'mp4',
+            }],
+        }
+
+
+class BenchYoutubeDL(YoutubeDL):
+    """`YoutubeDL` that only knows about `BenchHLSIE`."""
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(BenchHLSIE())
+
+
+def run_level(fragments, video_id):
+    workdir = tempfile.mkdtemp(prefix='tubeup-bench-')
+    try:
+        tu = TubeUp(verbose=False, dir_path=workdir, fragments=fragments)
+        options = tu.generate_ydl_options(lambda d: None)
+        options.update(writethumbnail=False, writesubtitles=False,
+                       fixup='never', noprogress=True, forcetitle=False)
+        start = time.perf_counter()
+        with BenchYoutubeDL(options) as ydl:
+            info = ydl.extract_info('http://bench.invalid/hls/%s' % video_id)
+        elapsed = time.perf_counter() - start
+        path = ydl.prepare_filename(info)
+        return elapsed, os.path.getsize(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--segments', type=int, default=40)
+    parser.add_argument('--segment-size', type=float, default=1,
+                        help='size of each segment in MiB')
+    parser.add_argument('--latency', type=float, default=50,
+                        help='milliseconds before each segment is sent')
+    parser.add_argument('--rate', type=float, default=8,
+                        help='MiB/s of every connection, 0 for no limit')
+    parser.add_argument('--fragments', default='1,4,8',
+                        help='comma separated --fragments values')
+    args = parser.parse_args()
+
+    stub = StubHLS(args.segments, int(args.segment_size * 1024 * 1024),
+                   args.latency / 1000.0, args.rate * 1024 * 1024)
+    BenchHLSIE.playlist_url = stub.url
+    try:
+        baseline = None
+        print('%-10s %10s %12s %8s' % ('fragments', 'seconds', 'MiB/s', 'gain'))
+        for i, fragments in enumerate(int(n) for n in args.fragments.split(',')):
+            elapsed, size = run_level(fragments, 'video%d' % i)
+            expected = args.segments * len(stub.segment)
+            if size != expected:
+                raise SystemExit('Downloaded %d bytes instead of %d.'
+                                 % (size, expected))
+            throughput = size / 1024.0 / 1024.0 / elapsed
+            baseline = baseline or throughput
+            print('%-10d %10.2f %12.1f %7.1fx'
+                  % (fragments, elapsed, throughput, throughput / baseline))
+    finally:
+        stub.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measure how long the tubeup CLI takes to import and to answer --version.
+
+Runs ``python -X importtime`` on the CLI entry point and prints the slowest
+imports, then times a few ``tubeup --version`` runs.
+
+Usage::
+
+    python -m benchmarks.import_time --top 15
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+
+def import_times(module):
+    """
+    :return:  A list of ``(cumulative_us, self_us, module)`` tuples, slowest
+              first, as reported by ``python -X importtime``.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import %s' % module],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return sorted(rows, reverse=True)
+
+
+def version_time(runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'tubeup', '--version'],
+                       capture_output=True, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='tubeup.__main__')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    print('%12s %12s  module' % ('cumulative', 'self'))
+    for cumulative_us, self_us, name in rows[:args.top]:
+        print('%10.1fms %10.1fms  %s'
+              % (cumulative_us / 1000, self_us / 1000, name))
+
+    print('\nbest of %d `tubeup --version`: %.1fms'
+          % (args.runs, version_time(args.runs) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+A local stand-in for archive.org used by the offline benchmarks.
+
+It serves the metadata API, the IA-S3 upload endpoint (plain and multipart
+uploads) and the media files that the benchmark extractor points yt-dlp at,
+all from one threaded HTTP server bound to localhost. Under ``/s3.local/``
+it also answers like a bare S3-compatible store, for `S3Storage`.
+"""
+import itertools
+import json
+import threading
+import time
+
+from hashlib import md5
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+
+class StubIA(object):
+    def __init__(self, media_size=1024 * 1024, latency=0.0):
+        """
+        :param media_size:  Size in bytes of every media file served under
+                            ``/media/``.
+        :param latency:     Seconds to sleep before answering each archive.org
+                            request, to mimic a WAN round trip.
+        """
+        self.media = b'\0' * media_size
+        self.latency = latency
+        self.items = {}
+        self.multipart = {}
+        self._upload_ids = itertools.count(1)
+        self.bytes_received = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                           self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def s3_endpoint(self):
+        return self.base_url + '/s3.local'
+
+    def media_url(self, video_id):
+        return '%s/media/%s.mp4' % (self.base_url, video_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, content_type='application/json',
+                       status=200):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path.startswith('/media/'):
+                    with stub._lock:
+                        stub.bytes_served += len(stub.media)
+                    return self._reply(stub.media, 'video/mp4')
+
+                time.sleep(stub.latency)
+                if path.startswith('/s3.local/'):
+                    return self._s3_get()
+                if path.startswith('/archive.org/metadata/'):
+                    identifier = path.rsplit('/', 1)[-1]
+                    return self._reply(
+                        json.dumps(stub.item_metadata(identifier)).encode())
+                if path.startswith('/s3.us.archive.org'):
+                    return self._reply(b'{"over_limit": 0}')
+                self._reply(b'', status=404)
+
+            def _s3_get(self):
+                bucket, key, query = self._target()
+                if 'list-type' in query:
+                    return self._reply(stub.list_objects(
+                        bucket, query.get('prefix', '')).encode(),
+                        'application/xml')
+                with stub._lock:
+                    found = key in stub.items.get(bucket, {})
+                self._reply(b'', 'application/octet-stream',
+                            status=200 if found else 404)
+
+            def _target(self):
+                url = urlsplit(self.path)
+                _, _, identifier, name = url.path.split('/', 3)
+                query = {k: v[0] for k, v in
+                         parse_qs(url.query, keep_blank_values=True).items()}
+                return identifier, name, query
+
+            def do_POST(self):
+                time.sleep(stub.latency)
+                identifier, name, query = self._target()
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if 'uploads' in query:
+                    upload_id = 'upload-%d' % next(stub._upload_ids)
+                    with stub._lock:
+                        stub.multipart[upload_id] = {}
+                    return self._reply(
+                        ('<InitiateMultipartUploadResult><UploadId>%s'
+                         '</UploadId></InitiateMultipartUploadResult>'
+                         % upload_id).encode(), 'application/xml')
+                with stub._lock:
+                    parts = stub.multipart.pop(query['uploadId'])
+                data = b''.join(parts[number] for number in sorted(parts))
+                stub.store(identifier, name, len(data), md5(data).hexdigest(),
+                           received=0)
+                self._reply(b'<CompleteMultipartUploadResult/>',
+                            'application/xml')
+
+            def do_DELETE(self):
+                identifier, name, query = self._target()
+                with stub._lock:
+                    stub.multipart.pop(query.get('uploadId'), None)
+                self._reply(b'', 'text/plain', status=204)
+
+            def do_PUT(self):
+                time.sleep(stub.latency)
+                identifier, name, query = self._target()
+                length = int(self.headers.get('Content-Length', 0))
+                if 'partNumber' in query:
+                    data = self.rfile.read(length)
+                    with stub._lock:
+                        stub.bytes_received += len(data)
+                        stub.multipart[query['uploadId']][
+                            int(query['partNumber'])] = data
+                    self.send_response(200)
+                    self.send_header('ETag', '"%s"' % md5(data).hexdigest())
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                digest = md5()
+                remaining = length
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                stub.store(identifier, name, length, digest.hexdigest())
+                self._reply(b'', 'text/plain')
+
+        return Handler
+
+    def store(self, identifier, name, size, md5sum, received=None):
+        with self._lock:
+            self.bytes_received += size if received is None else received
+            self.items.setdefault(identifier, {})[name] = (size, md5sum)
+
+    def list_objects(self, bucket, prefix):
+        with self._lock:
+            objects = sorted((key, size, md5sum) for key, (size, md5sum)
+                             in self.items.get(bucket, {}).items()
+                             if key.startswith(prefix))
+        return ('<ListBucketResult><IsTruncated>false</IsTruncated>%s'
+                '</ListBucketResult>' % ''.join(
+                    '<Contents><Key>%s</Key><Size>%d</Size><ETag>"%s"</ETag>'
+                    '</Contents>' % (escape(key), size, md5sum)
+                    for key, size, md5sum in objects))
+
+    def item_metadata(self, identifier):
+        with self._lock:
+            files = self.items.get(identifier)
+            if files is None:
+                return {}
+            return {
+                'metadata': {'identifier': identifier},
+                'files': [{'name': name, 'size': str(size), 'md5': md5sum}
+                          for name, (size, md5sum) in files.items()],
+            }
+
+
+class StubAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends every archive.org request to a `StubIA`,
+    keeping the original host as the first path segment.
+    """
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        base = urlsplit(self.base_url)
+        request.url = urlunsplit((base.scheme, base.netloc,
+                                  '/' + url.netloc + url.path,
+                                  url.query, ''))
+        return super().send(request, **kwargs)
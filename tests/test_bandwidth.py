@@ -0,0 +1,73 @@
+import io
+import unittest
+
+from unittest.mock import patch
+
+from tubeup.bandwidth import (BandwidthManager, Share, ThrottledReader,
+                              DOWNLOAD, UPLOAD)
+
+
+class BandwidthManagerTest(unittest.TestCase):
+
+    def test_budget_is_split_between_transfers(self):
+        manager = BandwidthManager(download_rate=1000, upload_rate=600)
+        changes = []
+
+        with manager.transfer(DOWNLOAD, changes.append) as first:
+            self.assertEqual(first.rate, 1000)
+            with manager.transfer(DOWNLOAD) as second, \
+                    manager.transfer(UPLOAD) as upload:
+                self.assertEqual((first.rate, second.rate), (500, 500))
+                # Uploads have their own budget.
+                self.assertEqual(upload.rate, 600)
+            self.assertEqual(first.rate, 1000)
+
+        self.assertEqual(changes, [1000, 500, 1000, None])
+
+    def test_unlimited(self):
+        manager = BandwidthManager(upload_rate=600)
+
+        with manager.transfer(DOWNLOAD) as share:
+            self.assertIsNone(share.rate)
+            with patch('time.sleep') as sleep:
+                share.consume(10 ** 9)
+            sleep.assert_not_called()
+
+
+class ShareTest(unittest.TestCase):
+
+    @patch('time.sleep')
+    @patch('time.monotonic')
+    def test_consume(self, monotonic, sleep):
+        monotonic.return_value = 0
+        share = Share()
+        share.set_rate(100)
+
+        share.consume(50)
+        sleep.assert_called_once_with(0.5)
+
+        # The debt is paid after half a second, one second worth of bytes
+        # can then be sent in a burst.
+        monotonic.return_value = 5
+        sleep.reset_mock()
+        share.consume(100)
+        sleep.assert_not_called()
+        share.consume(100)
+        sleep.assert_called_once_with(1.0)
+
+
+class ThrottledReaderTest(unittest.TestCase):
+
+    def test_read(self):
+        consumed = []
+        reader = ThrottledReader(io.BytesIO(b'x' * 10), consumed.append)
+
+        self.assertEqual(reader.read(4), b'xxxx')
+        self.assertEqual(reader.read(), b'x' * 6)
+        self.assertEqual(reader.read(), b'')
+        self.assertEqual(consumed, [4, 6])
+
+        # Everything else is the file's.
+        self.assertEqual(reader.tell(), 10)
+        reader.seek(0)
+        self.assertEqual(reader.read(), b'x' * 10)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+import requests_mock
+
+from yt_dlp import YoutubeDL
+
+from tubeup.TubeUp import TubeUp
+from tubeup.cache import MediaCache
+from tubeup.metrics import Metrics
+from tubeup.s3 import MultipartUpload
+from .test_s3 import mock_multipart
+
+
+def info_dict(video_id, path, format_id='18'):
+    return {'id': video_id, 'title': 'Video %s' % video_id,
+            'url': 'file://' + path, 'ext': 'mp4', 'format_id': format_id,
+            'extractor': 'generic', 'extractor_key': 'Generic',
+            'webpage_url': 'https://example.com/%s' % video_id}
+
+
+class MediaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache = MediaCache(os.path.join(self.tmp_dir, 'cache'), 3500)
+
+    def make_file(self, name, size):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_key(self):
+        key = MediaCache.key(info_dict('a', '/a'))
+        self.assertEqual(key, MediaCache.key(info_dict('a', '/elsewhere')))
+        self.assertNotEqual(key, MediaCache.key(info_dict('a', '/a', '22')))
+        self.assertNotEqual(key, MediaCache.key(info_dict('b', '/a')))
+        self.assertIsNone(MediaCache.key({'id': 'a', 'extractor': 'generic'}))
+
+    def test_store_and_fetch(self):
+        source = self.make_file('a.mp4', 1000)
+        self.cache.store(info_dict('a', source), source)
+        # The cached file is the same file, not a copy.
+        self.assertEqual(os.stat(source).st_nlink, 2)
+
+        destination = os.path.join(self.tmp_dir, 'b.mp4')
+        self.assertEqual(self.cache.fetch(info_dict('a', source), destination),
+                         1000)
+        self.assertTrue(os.path.samefile(source, destination))
+        self.assertIsNone(self.cache.fetch(info_dict('c', source), destination))
+
+    def test_least_recently_used_files_are_evicted(self):
+        paths = {}
+        for number, video_id in enumerate('abc'):
+            paths[video_id] = self.make_file(video_id, 1000)
+            self.cache.store(info_dict(video_id, paths[video_id]),
+                             paths[video_id])
+            os.utime(self.cache.path(MediaCache.key(info_dict(video_id, ''))),
+                     (number, number))
+        # Using `a` makes `b` the least recently used file.
+        self.cache.fetch(info_dict('a', ''), os.path.join(self.tmp_dir, 'a2'))
+
+        self.cache.store(info_dict('d', ''), self.make_file('d', 1000))
+
+        cached = [video_id for video_id in 'abcd' if os.path.exists(
+            self.cache.path(MediaCache.key(info_dict(video_id, ''))))]
+        self.assertEqual(cached, ['a', 'c', 'd'])
+        # Evicting only drops the cache's link.
+        self.assertTrue(os.path.exists(paths['b']))
+
+    def test_caching_keeps_multipart_uploads_resumable(self):
+        path = self.make_file('a b.mp4', 10)
+        state_path = os.path.join(self.tmp_dir, 'state', 'a b.mp4.json')
+
+        def upload():
+            MultipartUpload(requests.Session(), 'youtube-a', 'a b.mp4',
+                            'access', 'secret').upload_file(
+                path, part_size=3, workers=1, state_path=state_path)
+
+        with requests_mock.Mocker() as m:
+            mock_multipart(m, fail_part=4)
+            with self.assertRaises(requests.HTTPError):
+                upload()
+        # The rerun passes the downloaded file through the cache again.
+        self.cache.store(info_dict('a', path), path)
+        self.cache.store(info_dict('a', path), path)
+        self.cache.fetch(info_dict('a', path), os.path.join(self.tmp_dir, 'b'))
+        with requests_mock.Mocker() as m:
+            calls = mock_multipart(m)
+            upload()
+
+        self.assertEqual([(method, query) for method, query, body in calls],
+                         [('PUT', 'partNumber=4&uploadId=u1'),
+                          ('POST', 'uploadId=u1')])
+
+    def test_download_is_skipped_on_hit(self):
+        source = self.make_file('source.mp4', 1000)
+        metrics = Metrics()
+        options = {'outtmpl': os.path.join(self.tmp_dir, 'downloads',
+                                           '%(id)s.%(ext)s'),
+                   'enable_file_urls': True, 'quiet': True, 'noprogress': True}
+
+        def download():
+            with YoutubeDL(options) as ydl:
+                self.cache.add_to(ydl, metrics)
+                ydl.process_ie_result(info_dict('a', source), download=True)
+            return os.path.join(self.tmp_dir, 'downloads', 'a.mp4')
+
+        os.remove(download())
+        # The source is gone, only the cache has the media.
+        os.remove(source)
+        path = download()
+
+        self.assertEqual(os.path.getsize(path), 1000)
+        self.assertEqual(metrics.get('tubeup_cache_hits_total'), 1)
+        self.assertEqual(metrics.get('tubeup_cache_hit_bytes_total'), 1000)
+
+    def test_tubeup_registers_the_cache(self):
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'), cache=self.cache)
+        with tu._checkout_ydl(None, None) as ydl:
+            self.assertEqual([type(pp).__name__ for pp in ydl._pps['before_dl']],
+                             ['_CacheLookupPP'])
+            self.assertEqual([type(pp).__name__ for pp in ydl._pps['after_move']],
+                             ['_CacheStorePP'])
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tubeup.checksum import checksum_files, file_checksums, write_manifest
+
+
+class ChecksumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def make_file(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_file_checksums(self):
+        data = os.urandom(100000)
+        path = self.make_file('a.mp4', data)
+        expected = {'md5': hashlib.md5(data).hexdigest(),
+                    'sha1': hashlib.sha1(data).hexdigest()}
+
+        self.assertEqual(file_checksums(path, buffer_size=4096), expected)
+        self.assertEqual(file_checksums(path, buffer_size=4096,
+                                        use_mmap=False), expected)
+
+    def test_empty_file(self):
+        path = self.make_file('empty.mp4', b'')
+
+        self.assertEqual(file_checksums(path)['md5'],
+                         hashlib.md5(b'').hexdigest())
+
+    def test_checksum_files(self):
+        paths = [self.make_file('%d.mp4' % i, b'%d' % i) for i in range(5)]
+
+        result = checksum_files(paths, workers=3, algorithms=('md5',))
+
+        self.assertEqual(result, {path: {'md5': hashlib.md5(b'%d' % i).hexdigest()}
+                                  for i, path in enumerate(paths)})
+
+    def test_write_manifest(self):
+        manifest_path = os.path.join(self.tmp_dir, 'manifests', 'youtube-a.json')
+
+        write_manifest(manifest_path, {'a.mp4': {'size': 1, 'md5': 'x'}})
+
+        with open(manifest_path) as f:
+            self.assertEqual(json.load(f), {'a.mp4': {'size': 1, 'md5': 'x'}})
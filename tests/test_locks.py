@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tubeup.locks import FileLockBackend, SQLiteLockBackend
+
+
+class LockBackendTests(object):
+    # Shared by the backend test cases below, `make_lock(owner, ttl)` returns
+    # a backend for `owner` sharing its storage with the others.
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_lock_is_exclusive(self):
+        node_a = self.make_lock('node-a')
+        node_b = self.make_lock('node-b')
+
+        self.assertTrue(node_a.acquire('youtube-a'))
+        self.assertTrue(node_a.acquire('youtube-a'))
+        self.assertFalse(node_b.acquire('youtube-a'))
+        self.assertTrue(node_b.acquire('youtube-b'))
+
+    def test_release(self):
+        node_a = self.make_lock('node-a')
+        node_b = self.make_lock('node-b')
+        node_a.acquire('youtube-a')
+
+        # Only the owner can release a lock.
+        node_b.release('youtube-a')
+        self.assertFalse(node_b.acquire('youtube-a'))
+
+        node_a.release('youtube-a')
+        self.assertTrue(node_b.acquire('youtube-a'))
+
+    def test_expired_lock_is_taken_over(self):
+        self.make_lock('node-a', ttl=-1).acquire('youtube-a')
+
+        self.assertTrue(self.make_lock('node-b').acquire('youtube-a'))
+        self.assertFalse(self.make_lock('node-a').acquire('youtube-a'))
+
+    def test_renew(self):
+        node_a = self.make_lock('node-a', ttl=-1)
+        node_a.acquire('youtube-a')
+        node_a.ttl = 3600
+
+        self.assertTrue(node_a.renew('youtube-a'))
+        # Renewed, so it isn't abandoned anymore.
+        self.assertFalse(self.make_lock('node-b').acquire('youtube-a'))
+        self.assertFalse(self.make_lock('node-b').renew('youtube-a'))
+
+    def test_renew_from_another_thread(self):
+        # Uploads renew the locks from the threads sending the parts.
+        node_a = self.make_lock('node-a')
+        node_a.acquire('youtube-a')
+        renewed = []
+        thread = threading.Thread(
+            target=lambda: renewed.append(node_a.renew('youtube-a')))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(renewed, [True])
+
+
+class FileLockBackendTest(LockBackendTests, unittest.TestCase):
+
+    def make_lock(self, owner, ttl=3600):
+        return FileLockBackend(os.path.join(self.tmp_dir, 'locks'), owner, ttl)
+
+    def test_unreadable_lock_is_only_taken_over_once_expired(self):
+        node_a = self.make_lock('node-a')
+        path = node_a._path('youtube-a')
+        open(path, 'w').close()
+
+        self.assertFalse(node_a.acquire('youtube-a'))
+        self.assertTrue(os.path.exists(path))
+
+        os.utime(path, (0, 0))
+        self.assertTrue(node_a.acquire('youtube-a'))
+        self.assertEqual(node_a._read('youtube-a')[0], 'node-a')
+
+    def test_concurrent_acquire(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def acquire(owner):
+            lock = self.make_lock(owner)
+            barrier.wait()
+            results.append(lock.acquire('youtube-a'))
+
+        threads = [threading.Thread(target=acquire, args=('node-%d' % i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+
+class SQLiteLockBackendTest(LockBackendTests, unittest.TestCase):
+
+    def make_lock(self, owner, ttl=3600):
+        return SQLiteLockBackend(os.path.join(self.tmp_dir, 'locks.db'),
+                                 owner, ttl)
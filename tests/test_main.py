@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from tubeup import __version__
+from tubeup.__main__ import main
+
+
+class MainTest(unittest.TestCase):
+
+    def test_cli_import_does_not_load_heavy_dependencies(self):
+        # `tubeup --help` and `--version` must not pay for importing yt-dlp
+        # and internetarchive.
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, tubeup.__main__; '
+             'print(sorted(m for m in ("yt_dlp", "internetarchive") '
+             'if m in sys.modules))'],
+            capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_version(self):
+        result = subprocess.run([sys.executable, '-m', 'tubeup', '--version'],
+                                capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.strip(), __version__)
+
+    def test_batch_file_is_closed(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        batch_path = os.path.join(tmp_dir, 'urls.txt')
+        with open(batch_path, 'w', encoding='utf-8') as f:
+            f.write('https://youtu.be/a\nhttps://youtu.be/b\n')
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            opened.append(open(*args, **kwargs))
+            return opened[-1]
+
+        with patch('sys.argv', ['tubeup', 'enqueue',
+                                os.path.join(tmp_dir, 'queue.db'),
+                                '--batch-file', batch_path]), \
+                patch('tubeup.__main__.open', tracking_open, create=True):
+            main()
+
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+
+    def test_invalid_numbers_exit(self):
+        for command, option, value in (
+                ([], '--fragments', '0'),
+                ([], '--upload-workers', 'four'),
+                ([], '--stop-after-existing', '-1'),
+                (['watch'], '--interval', 'nan')):
+            with patch('sys.argv', ['tubeup'] + command +
+                       ['https://youtu.be/a', option, value]), \
+                    self.assertRaises(SystemExit) as context:
+                main()
+
+            self.assertEqual(context.exception.code,
+                             'Invalid %s: %s' % (option, value))
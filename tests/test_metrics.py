@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from urllib.request import urlopen
+
+from tubeup.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counters_and_gauges(self):
+        metrics = Metrics()
+        metrics.inc('tubeup_uploaded_bytes_total', 100)
+        metrics.inc('tubeup_uploaded_bytes_total', 23)
+        metrics.inc('tubeup_items_skipped_total', reason='item_exists')
+        metrics.set('tubeup_upload_queue_depth', 4)
+
+        rendered = metrics.render()
+
+        self.assertIn('# TYPE tubeup_uploaded_bytes_total counter\n'
+                      'tubeup_uploaded_bytes_total 123\n', rendered)
+        self.assertIn('tubeup_items_skipped_total{reason="item_exists"} 1\n',
+                      rendered)
+        self.assertIn('tubeup_upload_queue_depth 4\n', rendered)
+
+    def test_histogram_buckets(self):
+        metrics = Metrics(buckets=(1, 10))
+        metrics.observe_span({'stage': 'upload', 'duration': 0.5})
+        metrics.observe_span({'stage': 'upload', 'duration': 5})
+        metrics.observe_span({'stage': 'upload', 'duration': 50})
+
+        rendered = metrics.render()
+
+        self.assertIn('tubeup_stage_duration_seconds_bucket'
+                      '{stage="upload",le="1"} 1\n', rendered)
+        self.assertIn('tubeup_stage_duration_seconds_bucket'
+                      '{stage="upload",le="10"} 2\n', rendered)
+        self.assertIn('tubeup_stage_duration_seconds_bucket'
+                      '{stage="upload",le="+Inf"} 3\n', rendered)
+        self.assertIn('tubeup_stage_duration_seconds_sum{stage="upload"} 55.5\n',
+                      rendered)
+
+    def test_write_textfile(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'tubeup.prom')
+        metrics = Metrics()
+        metrics.inc('tubeup_items_uploaded_total')
+
+        metrics.write_textfile(path)
+
+        with open(path) as f:
+            self.assertEqual(f.read(), metrics.render())
+        self.assertEqual(os.listdir(tmp_dir), ['tubeup.prom'])
+
+    def test_serve(self):
+        metrics = Metrics()
+        metrics.inc('tubeup_items_uploaded_total', 2)
+        server = metrics.serve(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with urlopen('http://127.0.0.1:%d/metrics' % server.server_port) as r:
+            body = r.read().decode('utf-8')
+
+        self.assertIn('tubeup_items_uploaded_total 2\n', body)
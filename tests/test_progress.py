@@ -0,0 +1,54 @@
+import io
+import json
+import unittest
+
+from tubeup.progress import ProgressReporter, format_bytes
+
+
+class ProgressReporterTest(unittest.TestCase):
+
+    def test_format_bytes(self):
+        self.assertEqual(format_bytes(512), '512.00B')
+        self.assertEqual(format_bytes(3 * 1024 * 1024), '3.00MiB')
+
+    def test_updates_are_aggregated(self):
+        reporter = ProgressReporter()
+        reporter.update('a.mp4', downloaded=1024, total=2048, speed=512, eta=2)
+        reporter.update('b.mp4', downloaded=1024, total=2048, speed=512, eta=4)
+        reporter.update('youtube-a', kind='upload', total=4096)
+
+        self.assertEqual(
+            reporter.status_line(),
+            '[download] 2 active 2.00KiB of 4.00KiB (50.0%) at 1.00KiB/s '
+            'ETA 4s [upload] 1 active 0.00B of 4.00KiB (0.0%)')
+
+    def test_redraws_are_rate_limited(self):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream=stream, interval=3600)
+
+        for downloaded in range(1000):
+            reporter.ydl_hook({'status': 'downloading', 'filename': 'a.mp4',
+                               'downloaded_bytes': downloaded,
+                               'total_bytes': 1000})
+
+        self.assertEqual(stream.getvalue().count('\r'), 1)
+
+        reporter.ydl_hook({'status': 'finished', 'filename': 'a.mp4'})
+        self.assertEqual(stream.getvalue().count('\r'), 2)
+        self.assertEqual(reporter.snapshot(), {})
+
+    def test_json_stream(self):
+        json_stream = io.StringIO()
+        reporter = ProgressReporter(json_stream=json_stream, interval=0)
+
+        reporter.ydl_hook({'status': 'downloading', 'filename': 'a.mp4',
+                           'downloaded_bytes': 10, 'total_bytes': 20})
+        reporter.ydl_hook({'status': 'error', 'filename': 'a.mp4'})
+
+        events = [json.loads(line)
+                  for line in json_stream.getvalue().splitlines()]
+        self.assertEqual(events[0]['event'], 'progress')
+        self.assertEqual(events[0]['transfers']['a.mp4']['bytes'], 10)
+        self.assertEqual(events[1]['event'], 'error')
+        self.assertEqual(events[1]['key'], 'a.mp4')
+        self.assertEqual(events[-1]['transfers'], {})
@@ -0,0 +1,257 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests_mock
+
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from tubeup.TubeUp import TubeUp
+from tubeup.storage import (FileStorage, IAStorage, LocalStorage, S3Storage,
+                            Storage, open_storage)
+
+
+current_path = os.path.dirname(os.path.realpath(__file__))
+TESTFILES_DIR = os.path.join(current_path, 'test_tubeup_files',
+                             'files_for_upload_and_download_tests')
+ITEMNAME = 'youtube-KdsN9YhkDrY'
+ENDPOINT = 'http://minio:9000'
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def make_tubeup(self, storage):
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'),
+                    storage=storage)
+        self.copy_video(tu)
+        return tu
+
+    def copy_video(self, tu):
+        for name in os.listdir(TESTFILES_DIR):
+            if name.startswith('KdsN9YhkDrY'):
+                shutil.copy(os.path.join(TESTFILES_DIR, name),
+                            tu.dir_path['downloads'])
+        return os.path.join(tu.dir_path['downloads'], 'KdsN9YhkDrY')
+
+
+class LocalStorageTest(StorageTestCase):
+
+    def test_upload(self):
+        storage = LocalStorage(os.path.join(self.tmp_dir, 'staged'))
+        tu = self.make_tubeup(storage)
+        basepath = os.path.join(tu.dir_path['downloads'], 'KdsN9YhkDrY')
+        self.assertFalse(storage.exists(tu, ITEMNAME))
+
+        itemname, metadata = tu.upload(basepath, {'collection': 'test'})
+
+        self.assertEqual(itemname, ITEMNAME)
+        self.assertEqual(metadata['collection'], 'test')
+        self.assertTrue(storage.exists(tu, itemname))
+        self.assertEqual(sorted(os.listdir(os.path.join(storage.directory, itemname))),
+                         ['KdsN9YhkDrY.description', 'KdsN9YhkDrY.info.json',
+                          'KdsN9YhkDrY.mp4', 'KdsN9YhkDrY.webm',
+                          'KdsN9YhkDrY.webp', ITEMNAME + '_meta.json'])
+        with open(storage.path(storage.meta_key(itemname)), encoding='utf-8') as f:
+            self.assertEqual(json.load(f), metadata)
+        # The files are moved, not copied.
+        self.assertEqual(os.listdir(tu.dir_path['downloads']), [])
+        self.assertTrue(os.path.exists(os.path.join(
+            tu.dir_path['root'], 'manifests', itemname + '.json')))
+
+    def test_stored_files_are_skipped(self):
+        storage = LocalStorage(os.path.join(self.tmp_dir, 'staged'))
+        tu = self.make_tubeup(storage)
+        tu.upload(os.path.join(tu.dir_path['downloads'], 'KdsN9YhkDrY'))
+
+        basepath = self.copy_video(tu)
+        with patch.object(LocalStorage, 'store_file') as store_file:
+            tu.upload(basepath)
+
+        store_file.assert_not_called()
+        self.assertEqual(os.listdir(tu.dir_path['downloads']), [])
+
+    def test_stream_upload_needs_archive_org(self):
+        with self.assertRaises(ValueError):
+            TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'),
+                   stream_upload=True, storage=LocalStorage(self.tmp_dir))
+
+
+class S3StorageTest(StorageTestCase):
+
+    def make_storage(self, **kwargs):
+        return S3Storage(ENDPOINT, 'bucket', 'key', 'secret', **kwargs)
+
+    def test_exists(self):
+        storage = self.make_storage()
+        url = '%s/bucket/%s/%s_meta.json' % (ENDPOINT, ITEMNAME, ITEMNAME)
+        with requests_mock.Mocker() as m:
+            m.head(url, status_code=404)
+            self.assertFalse(storage.exists(None, ITEMNAME))
+            m.head(url, status_code=200)
+            self.assertTrue(storage.exists(None, ITEMNAME))
+
+    def test_files(self):
+        storage = self.make_storage()
+        with requests_mock.Mocker() as m:
+            m.get('%s/bucket/?list-type=2&prefix=%s%%2F' % (ENDPOINT, ITEMNAME), [
+                {'text': '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/'
+                         '2006-03-01/"><IsTruncated>true</IsTruncated>'
+                         '<NextContinuationToken>t1</NextContinuationToken>'
+                         '<Contents><Key>%s/a.mp4</Key><Size>3</Size>'
+                         '<ETag>"abc"</ETag></Contents></ListBucketResult>'
+                         % ITEMNAME},
+                {'text': '<ListBucketResult><IsTruncated>false</IsTruncated>'
+                         '<Contents><Key>%s/b.jpg</Key><Size>4</Size>'
+                         '<ETag>"def"</ETag></Contents>'
+                         '<Contents><Key>%s/c.webm</Key><Size>5</Size>'
+                         '<ETag>"ghi-2"</ETag></Contents></ListBucketResult>'
+                         % (ITEMNAME, ITEMNAME)}])
+            m.head('%s/bucket/%s/c.webm' % (ENDPOINT, ITEMNAME),
+                   headers={'x-amz-meta-md5': 'jkl'})
+            files = storage.files(ITEMNAME)
+
+        self.assertEqual(files, [{'name': 'a.mp4', 'size': '3', 'md5': 'abc'},
+                                 {'name': 'b.jpg', 'size': '4', 'md5': 'def'},
+                                 # Uploaded in parts, its ETag isn't its md5.
+                                 {'name': 'c.webm', 'size': '5', 'md5': 'jkl'}])
+        self.assertIn('continuation-token=t1', m.request_history[1].url)
+
+    def test_upload(self):
+        storage = self.make_storage(workers=2)
+        tu = self.make_tubeup(storage)
+        basepath = os.path.join(tu.dir_path['downloads'], 'KdsN9YhkDrY')
+        with open(basepath + '.info.json', 'rb') as f:
+            info_md5 = hashlib.md5(f.read()).digest()
+
+        with requests_mock.Mocker() as m:
+            m.get('%s/bucket/?list-type=2' % ENDPOINT,
+                  text='<ListBucketResult><IsTruncated>false</IsTruncated>'
+                       '</ListBucketResult>')
+            m.put(requests_mock.ANY)
+            itemname, metadata = tu.upload(basepath)
+
+        puts = [request for request in m.request_history
+                if request.method == 'PUT']
+        keys = [urlsplit(request.url).path[len('/bucket/'):] for request in puts]
+        self.assertEqual(sorted(keys[:-1]),
+                         ['%s/KdsN9YhkDrY.%s' % (ITEMNAME, ext)
+                          for ext in ('description', 'info.json', 'mp4',
+                                      'webm', 'webp')])
+        # The metadata is written last.
+        self.assertEqual(keys[-1], '%s/%s_meta.json' % (ITEMNAME, ITEMNAME))
+        self.assertEqual(json.loads(puts[-1].body), metadata)
+
+        info_put = puts[keys.index('%s/KdsN9YhkDrY.info.json' % ITEMNAME)]
+        self.assertEqual(info_put.headers['Content-MD5'],
+                         base64.b64encode(info_md5).decode('ascii'))
+        self.assertEqual(info_put.headers['x-amz-meta-md5'], info_md5.hex())
+        self.assertTrue(info_put.headers['Authorization'].startswith(
+            'AWS4-HMAC-SHA256 Credential=key/'))
+        self.assertEqual(os.listdir(tu.dir_path['downloads']), [])
+
+    def test_multipart_uploads_are_skipped_once_stored(self):
+        storage = self.make_storage(multipart_threshold=10000, part_size=10000)
+        tu = self.make_tubeup(storage)
+        basepath = os.path.join(tu.dir_path['downloads'], 'KdsN9YhkDrY')
+        info_path = basepath + '.info.json'
+        info_url = '%s/bucket/%s/KdsN9YhkDrY.info.json' % (ENDPOINT, ITEMNAME)
+        with open(info_path, 'rb') as f:
+            info_md5 = hashlib.md5(f.read()).hexdigest()
+        info_size = os.path.getsize(info_path)
+
+        with requests_mock.Mocker() as m:
+            m.get('%s/bucket/?list-type=2' % ENDPOINT,
+                  text='<ListBucketResult><IsTruncated>false</IsTruncated>'
+                       '</ListBucketResult>')
+            m.post(info_url, text='<InitiateMultipartUploadResult><UploadId>u1'
+                                  '</UploadId></InitiateMultipartUploadResult>')
+            m.put(requests_mock.ANY, headers={'ETag': '"etag"'})
+            tu.upload(basepath)
+
+        start = m.request_history[[request.method for request in m.request_history]
+                                  .index('POST')]
+        self.assertTrue(start.url.endswith('?uploads'))
+        self.assertEqual(start.headers['x-amz-meta-md5'], info_md5)
+
+        basepath = self.copy_video(tu)
+        with requests_mock.Mocker() as m, \
+                patch.object(S3Storage, 'store_file') as store_file, \
+                patch.object(S3Storage, 'store_metadata'):
+            m.get('%s/bucket/?list-type=2' % ENDPOINT,
+                  text='<ListBucketResult><IsTruncated>false</IsTruncated>'
+                       '<Contents><Key>%s/KdsN9YhkDrY.info.json</Key>'
+                       '<Size>%d</Size><ETag>"abc-4"</ETag></Contents>'
+                       '</ListBucketResult>' % (ITEMNAME, info_size))
+            m.head(info_url, headers={'x-amz-meta-md5': info_md5})
+            tu.upload(basepath)
+
+        stored = [os.path.basename(call.args[2]) for call in store_file.call_args_list]
+        self.assertEqual(len(stored), 4)
+        self.assertNotIn('KdsN9YhkDrY.info.json', stored)
+
+
+class StorageTest(unittest.TestCase):
+
+    def test_storages_implement_every_method(self):
+        with self.assertRaises(TypeError):
+            Storage()
+
+        class PartialStorage(Storage):
+            def exists(self, tubeup, identifier):
+                return False
+
+        with self.assertRaises(TypeError):
+            PartialStorage()
+
+        # Storages storing files one by one implement two more.
+        class PartialFileStorage(FileStorage):
+            def exists(self, tubeup, identifier):
+                return False
+
+            def files(self, identifier):
+                return []
+
+        with self.assertRaises(TypeError):
+            PartialFileStorage()
+        self.assertIsInstance(IAStorage(), Storage)
+
+
+class OpenStorageTest(unittest.TestCase):
+
+    def test_targets(self):
+        self.assertIsInstance(open_storage('ia'), IAStorage)
+        storage = open_storage('/tmp/staged')
+        self.assertIsInstance(storage, LocalStorage)
+        self.assertEqual(storage.directory, '/tmp/staged')
+        self.assertEqual(open_storage('./staged').directory, './staged')
+        self.assertEqual(open_storage('file:///tmp/staged').directory,
+                         '/tmp/staged')
+
+        storage = open_storage('s3://bucket', ENDPOINT, workers=8,
+                               environ={'AWS_ACCESS_KEY_ID': 'key',
+                                        'AWS_SECRET_ACCESS_KEY': 'secret',
+                                        'AWS_DEFAULT_REGION': 'eu-west-1'})
+        self.assertIsInstance(storage, S3Storage)
+        self.assertEqual((storage.bucket, storage.region, storage.workers),
+                         ('bucket', 'eu-west-1', 8))
+
+    def test_unknown_targets_are_rejected(self):
+        for target in ('IA', 'archive.org', 'staged', 'gs://bucket', 's3:/bucket'):
+            with self.assertRaises(ValueError):
+                open_storage(target)
+
+    def test_s3_needs_credentials(self):
+        with self.assertRaises(ValueError):
+            open_storage('s3://bucket', ENDPOINT, environ={})
+        with self.assertRaises(ValueError):
+            open_storage('s3://bucket', environ={'AWS_ACCESS_KEY_ID': 'key',
+                                                 'AWS_SECRET_ACCESS_KEY': 'secret'})
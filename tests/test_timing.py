@@ -0,0 +1,54 @@
+import io
+import json
+import unittest
+
+from tubeup.timing import StageTimer, json_lines_hook
+
+
+class StageTimerTest(unittest.TestCase):
+
+    def test_span_is_passed_to_hooks(self):
+        spans = []
+        timer = StageTimer(hooks=[spans.append])
+
+        with timer.span('download', 'youtube-KdsN9YhkDrY'):
+            pass
+
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]['stage'], 'download')
+        self.assertEqual(spans[0]['identifier'], 'youtube-KdsN9YhkDrY')
+        self.assertTrue(spans[0]['ok'])
+        self.assertGreaterEqual(spans[0]['duration'], 0)
+
+    def test_failed_span_is_recorded(self):
+        spans = []
+        timer = StageTimer(hooks=[spans.append])
+
+        with self.assertRaises(ValueError):
+            with timer.span('upload', 'youtube-KdsN9YhkDrY'):
+                raise ValueError
+
+        self.assertFalse(spans[0]['ok'])
+        self.assertEqual(timer.totals()['upload'][0], 1)
+
+    def test_totals_and_reset(self):
+        timer = StageTimer()
+        timer.record('upload', 'a', 0, 1.0)
+        timer.record('upload', 'b', 0, 3.0)
+
+        self.assertEqual(timer.totals(), {'upload': (2, 4.0, 3.0)})
+        self.assertIn('upload', timer.summary())
+
+        timer.reset()
+        self.assertEqual(timer.totals(), {})
+
+    def test_json_lines_hook(self):
+        output = io.StringIO()
+        timer = StageTimer(hooks=[json_lines_hook(output)])
+        timer.record('extract', 'https://example.com', 10.0, 0.5)
+        timer.record('upload', 'youtube-KdsN9YhkDrY', 11.0, 2.0)
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['stage'] for line in lines],
+                         ['extract', 'upload'])
+        self.assertEqual(lines[1]['duration'], 2.0)
@@ -5,13 +5,21 @@ import json
 import time
 import requests_mock
 import glob
+import hashlib
 import logging
+import re
+import tempfile
 
 from tubeup.TubeUp import TubeUp, DOWNLOAD_DIR_NAME
+from tubeup.locks import SQLiteLockBackend
+from tubeup.bandwidth import BandwidthManager, Share
+from tubeup.entries import VideoEntry
 from tubeup import __version__
 from yt_dlp import YoutubeDL
 from .constants import info_dict_playlist, info_dict_video
 from unittest.mock import patch
+from internetarchive.item import Item
+from internetarchive.session import ArchiveSession
 
 
 current_path = os.path.dirname(os.path.realpath(__file__))
@@ -53,7 +61,7 @@ def copy_testfiles_to_tubeup_rootdir_test():
 
 # Hijacked yt-dlp class so we don't make any real download requests.
 class MockYTDLP(YoutubeDL):
-    def extract_info(self, url, download=True):
+    def extract_info(self, url, download=True, **kwargs):
         filenames = {
             "https://www.youtube.com/watch?v=KdsN9YhkDrY": "KdsN9YhkDrY.info.json",
         }
@@ -66,18 +74,53 @@ class MockYTDLP(YoutubeDL):
         if url not in filenames:
             raise ValueError("unexpected URL")
 
-        jsonpath = os.path.join(current_path, 'test_tubeup_rootdir',
-                                'downloads', filenames[url])
+        jsonpath = os.path.join(current_path, 'test_tubeup_files',
+                                'files_for_upload_and_download_tests',
+                                filenames[url])
         with open(jsonpath, "r") as f:
             return json.load(f)
 
 
+# Hijacked yt-dlp class serving a channel of url results, newest first.
+class MockChannelYTDLP(YoutubeDL):
+    channel_url = 'https://www.youtube.com/@channel'
+    video_ids = ('new1', 'new2', 'old1', 'old2')
+    extracted = []
+
+    def extract_info(self, url, download=True, **kwargs):
+        if url == self.channel_url:
+            return {
+                '_type': 'playlist',
+                'id': 'channel',
+                'entries': ({'_type': 'url', 'ie_key': 'Youtube', 'id': video_id,
+                             'url': 'https://www.youtube.com/watch?v=' + video_id}
+                            for video_id in self.video_ids),
+            }
+
+        video_id = url.rsplit('=', 1)[1]
+        self.extracted.append((video_id, download))
+        return {'id': video_id, 'title': video_id, 'ext': 'mp4',
+                'extractor': 'youtube', 'extractor_key': 'Youtube',
+                'webpage_url': url}
+
+
+def mock_channel_items(m, archived_ids):
+    for video_id in MockChannelYTDLP.video_ids:
+        metadata = {}
+        if video_id in archived_ids:
+            metadata = {'metadata': {'identifier': 'youtube-' + video_id}}
+        m.get('https://archive.org/metadata/youtube-' + video_id, json=metadata)
+
+
 @patch("tubeup.TubeUp.YoutubeDL", MockYTDLP)
 class TubeUpTests(unittest.TestCase):
 
     def setUp(self):
         self.tu = TubeUp()
         self.maxDiff = 999999999
+        # Manifests written by the upload tests.
+        self.addCleanup(shutil.rmtree, os.path.join(
+            current_path, 'test_tubeup_rootdir', 'manifests'), True)
 
     def test_set_dir_path(self):
         root_path = os.path.join(
@@ -337,6 +380,27 @@ class TubeUpTests(unittest.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    def test_create_archive_org_metadata_from_youtubedl_meta_huge_fields(self):
+        with open(get_testfile_path(
+                'Mountain_3_-_Video_Background_HD_1080p-6iRV8liah8A.info.json')
+        ) as f:
+            vid_meta = json.load(f)
+        vid_meta['description'] = 'chat message\n' * 50000
+        vid_meta['tags'] = ['tag%d' % i for i in range(10000)]
+
+        result = TubeUp.create_archive_org_metadata_from_youtubedl_meta(
+            vid_meta
+        )
+
+        self.assertLessEqual(len(result['subject'].encode('utf-8')), 255)
+        self.assertTrue(result['subject'].startswith(
+            'Youtube;video;Entertainment;tag0;tag1;'))
+        self.assertLessEqual(len(result['description'].encode('utf-8')),
+                             32 * 1024)
+        self.assertTrue(result['description'].startswith(
+            'chat message<br>chat message<br>'))
+        self.assertIn('.description file', result['description'])
+
     def test_create_archive_org_metadata_from_youtubedl_meta_description_text_null(self):
         with open(get_testfile_path(
                 'description_text_null.json')
@@ -539,6 +603,300 @@ class TubeUpTests(unittest.TestCase):
 
             self.assertEqual(expected_result, result)
 
+    def test_upload_ia_queues_one_derive(self):
+        videobasename = os.path.join(
+            current_path, 'test_tubeup_rootdir', 'downloads',
+            'Mountain_3_-_Video_Background_HD_1080p-6iRV8liah8A')
+        s3_url = re.compile('https://s3.us.archive.org/youtube-6iRV8liah8A/.*')
+
+        def upload(multipart_threshold):
+            tu = TubeUp(dir_path=os.path.join(current_path,
+                                              'test_tubeup_rootdir'),
+                        ia_config_path=get_testfile_path('ia_config_for_test.ini'),
+                        multipart_threshold=multipart_threshold)
+            copy_testfiles_to_tubeup_rootdir_test()
+            with requests_mock.Mocker() as m:
+                m.get('https://s3.us.archive.org',
+                      content=b'{"over_limit": 0}',
+                      headers={'content-type': 'application/json'})
+                m.get('https://archive.org/metadata/youtube-6iRV8liah8A',
+                      json={})
+                m.post(s3_url, text='<InitiateMultipartUploadResult><UploadId>'
+                                    'u1</UploadId></InitiateMultipartUploadResult>')
+                m.put(s3_url, headers={'ETag': '"etag"'})
+                tu.upload_ia(videobasename)
+            return [(request.method, request.url,
+                     request.headers.get('x-archive-queue-derive'))
+                    for request in m.request_history
+                    if request.method in ('PUT', 'POST')]
+
+        # Multipart uploads first, the last small file derives the item.
+        requests = upload(multipart_threshold=1000)
+        self.assertIn('?uploads', requests[0][1])
+        self.assertEqual([derive for method, url, derive in requests],
+                         ['0'] * (len(requests) - 1) + ['1'])
+        self.assertEqual(requests[-1][0], 'PUT')
+
+        # Without small files, the last multipart upload does.
+        requests = upload(multipart_threshold=0)
+        self.assertNotIn('PUT', [method for method, url, derive in requests
+                                 if '?' not in url])
+        self.assertEqual([derive for method, url, derive in requests],
+                         ['0'] * (len(requests) - 1) + ['1'])
+        self.assertEqual(requests[-1][0], 'POST')
+        self.assertIn('?uploadId=', requests[-1][1])
+
+    def test_upload_ia_keeps_local_files(self):
+        keep_dir = os.path.join(current_path, 'test_tubeup_rootdir', 'kept')
+        self.addCleanup(shutil.rmtree, keep_dir, True)
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'),
+                    ia_config_path=get_testfile_path('ia_config_for_test.ini'),
+                    keep_local=keep_dir)
+
+        videobasename = os.path.join(
+            current_path, 'test_tubeup_rootdir', 'downloads',
+            'Mountain_3_-_Video_Background_HD_1080p-6iRV8liah8A')
+
+        copy_testfiles_to_tubeup_rootdir_test()
+        inodes = {os.path.basename(path): os.stat(path).st_ino
+                  for path in glob.glob(videobasename + '*')}
+
+        with requests_mock.Mocker() as m:
+            m.get('https://s3.us.archive.org',
+                  content=b'{"over_limit": 0}',
+                  headers={'content-type': 'application/json'})
+            m.get('https://archive.org/metadata/youtube-6iRV8liah8A',
+                  content=b'{}',
+                  headers={'content-type': 'application/json'})
+            mock_upload_response_by_videobasename(
+                m, 'youtube-6iRV8liah8A', videobasename)
+
+            tu.upload_ia(videobasename)
+
+        self.assertEqual(glob.glob(videobasename + '*'), [])
+        # The kept files are the downloaded ones, not copies.
+        kept_dir = os.path.join(keep_dir, 'youtube-6iRV8liah8A')
+        self.assertEqual({name: os.stat(os.path.join(kept_dir, name)).st_ino
+                          for name in os.listdir(kept_dir)}, inodes)
+
+    def test_generate_ydl_options_with_stream_upload(self):
+        tu = TubeUp(stream_upload=True)
+        ydl_opts = tu.generate_ydl_options(mocked_ydl_progress_hook)
+
+        self.assertEqual(ydl_opts['format'],
+                         'best[protocol=https]/best[protocol=http]')
+        self.assertTrue(ydl_opts['skip_download'])
+
+    def test_generate_ydl_options_with_download_tuning(self):
+        tu = TubeUp(fragments=8, http_chunk_size=10485760,
+                    downloader='aria2c')
+        ydl_opts = tu.generate_ydl_options(mocked_ydl_progress_hook)
+
+        self.assertEqual(ydl_opts['concurrent_fragment_downloads'], 8)
+        self.assertEqual(ydl_opts['http_chunk_size'], 10485760)
+        self.assertEqual(ydl_opts['external_downloader'],
+                         {'default': 'aria2c'})
+
+        # Changing them afterwards isn't served from the options cache.
+        tu.fragments = 1
+        ydl_opts = tu.generate_ydl_options(mocked_ydl_progress_hook)
+        self.assertNotIn('concurrent_fragment_downloads', ydl_opts)
+
+    def test_has_pending_multipart_uploads(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'))
+        upload_dir = tu.multipart_upload_dir('youtube-a')
+        self.addCleanup(shutil.rmtree, os.path.dirname(upload_dir))
+
+        self.assertFalse(tu.has_pending_multipart_uploads('youtube-a'))
+        os.makedirs(upload_dir)
+        self.assertFalse(tu.has_pending_multipart_uploads('youtube-a'))
+        open(os.path.join(upload_dir, 'a.mp4.json'), 'w').close()
+        self.assertTrue(tu.has_pending_multipart_uploads('youtube-a'))
+
+    def test_has_uploaded_media(self):
+        item = Item(ArchiveSession(), 'youtube-a', item_metadata={
+            'metadata': {'identifier': 'youtube-a'},
+            'files': [{'name': 'a.mp4', 'size': '1000', 'md5': 'x'}]})
+
+        self.assertTrue(self.tu.has_uploaded_media(item, 'a.mp4', {'filesize': 1000}))
+        self.assertFalse(self.tu.has_uploaded_media(item, 'a.mp4', {'filesize': 999}))
+        # Without a known size there is nothing to compare.
+        self.assertFalse(self.tu.has_uploaded_media(item, 'a.mp4', {}))
+        self.assertEqual(
+            self.tu.metrics.get('tubeup_upload_skipped_bytes_total'), 1000)
+
+    def test_stream_media_to_ia(self):
+        tu = TubeUp(stream_upload=True)
+        item = Item(ArchiveSession(), 'youtube-a', item_metadata={})
+        s3_url = 'https://s3.us.archive.org/youtube-a/a.mp4'
+
+        with requests_mock.Mocker() as m:
+            m.get('https://media.invalid/a.mp4', content=b'x' * 1000)
+            m.post(s3_url, text='<InitiateMultipartUploadResult><UploadId>u1'
+                                '</UploadId></InitiateMultipartUploadResult>')
+            m.put(s3_url, headers={'ETag': '"etag"'})
+
+            size = tu.stream_media_to_ia(
+                item, 'a.mp4',
+                {'url': 'https://media.invalid/a.mp4',
+                 'http_headers': {'User-Agent': 'tubeup-test'}},
+                {'title': 'a'}, 'access', 'secret')
+
+        self.assertEqual(size, 1000)
+        self.assertEqual(m.request_history[0].headers['User-Agent'], 'tubeup-test')
+        self.assertEqual([r.method for r in m.request_history],
+                         ['GET', 'POST', 'PUT', 'POST'])
+        self.assertEqual(m.request_history[2].body, b'x' * 1000)
+
+    def test_stream_media_to_ia_with_bandwidth_limits(self):
+        tu = TubeUp(stream_upload=True,
+                    bandwidth=BandwidthManager(download_rate=10 ** 9,
+                                               upload_rate=10 ** 9))
+        item = Item(ArchiveSession(), 'youtube-a', item_metadata={})
+        s3_url = 'https://s3.us.archive.org/youtube-a/a.mp4'
+        consumed = []
+
+        def consume(share, size):
+            consumed.append(size)
+
+        with requests_mock.Mocker() as m, \
+                patch.object(Share, 'consume', autospec=True, side_effect=consume):
+            m.get('https://media.invalid/a.mp4', content=b'x' * 1000)
+            m.post(s3_url, text='<InitiateMultipartUploadResult><UploadId>u1'
+                                '</UploadId></InitiateMultipartUploadResult>')
+            m.put(s3_url, headers={'ETag': '"etag"'})
+
+            tu.stream_media_to_ia(item, 'a.mp4',
+                                  {'url': 'https://media.invalid/a.mp4'},
+                                  {'title': 'a'}, 'access', 'secret')
+            self.assertEqual(consumed, [1000])
+
+            # The mock doesn't read the part, sending it would.
+            body = m.request_history[2].body
+            body.seek(0)
+            self.assertEqual(body.read(), b'x' * 1000)
+            self.assertEqual(consumed, [1000, 1000])
+
+    def test_basenames_use_fields_derived_by_yt_dlp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        media_path = os.path.join(tmp_dir, 'media')
+        with open(media_path, 'wb') as f:
+            f.write(b'x' * 1000)
+
+        class MockTimestampYTDLP(YoutubeDL):
+            def extract_info(self, url, download=True, process=True, **kwargs):
+                self.params['enable_file_urls'] = True
+                # No `upload_date` nor `ext`, yt-dlp derives them.
+                info = {'id': 'abc', 'title': 'abc', 'timestamp': 1700000000,
+                        'formats': [{'url': 'file://' + media_path,
+                                     'format_id': 'mp4', 'ext': 'mp4'}],
+                        'webpage_url': url,
+                        'extractor': 'generic', 'extractor_key': 'Generic'}
+                if not process:
+                    return info
+                return self.process_ie_result(info, download=download)
+
+        tu = TubeUp(dir_path=os.path.join(tmp_dir, 'root'),
+                    output_template='%(upload_date)s-%(id)s.%(ext)s')
+        with patch.object(tu.storage, 'exists', return_value=False), \
+                patch('tubeup.TubeUp.YoutubeDL', MockTimestampYTDLP):
+            entries = tu.get_resource_entries(['https://example.com/abc'])
+
+        basepath = os.path.join(tu.dir_path['downloads'], '20231114-abc')
+        self.assertEqual([entry.basepath for entry in entries], [basepath])
+        self.assertTrue(os.path.exists(basepath + '.info.json'))
+        self.assertTrue(os.path.exists(basepath + '.mp4'))
+
+    def test_download_budget_holds_with_concurrent_fragments(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fragment_urls = []
+        for number in range(4):
+            path = os.path.join(tmp_dir, 'fragment%d' % number)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 65536)
+            fragment_urls.append('file://' + path)
+        rate = 512 * 1024
+
+        class MockFragmentedYTDLP(YoutubeDL):
+            def extract_info(self, url, download=True, **kwargs):
+                self.params['enable_file_urls'] = True
+                return {'id': 'a', 'title': 'a', 'ext': 'mp4',
+                        'format_id': 'dash', 'protocol': 'http_dash_segments',
+                        'url': fragment_urls[0],
+                        'fragments': [{'url': url} for url in fragment_urls],
+                        'extractor': 'generic', 'extractor_key': 'Generic'}
+
+        tu = TubeUp(dir_path=os.path.join(tmp_dir, 'root'), fragments=4,
+                    bandwidth=BandwidthManager(download_rate=rate))
+        with patch.object(tu.storage, 'exists', return_value=False), \
+                patch('tubeup.TubeUp.YoutubeDL', MockFragmentedYTDLP):
+            start = time.monotonic()
+            entries = tu.get_resource_entries(['https://example.com/a'])
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(os.path.getsize(os.path.join(
+            tu.dir_path['downloads'], entries[0].basename + '.mp4')), 4 * 65536)
+        # The 4 fragments are downloaded at the same time, each at a quarter
+        # of the budget.
+        self.assertGreaterEqual(elapsed, 0.9 * 4 * 65536 / rate)
+
+    def test_upload_ia_skips_uploaded_files(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'),
+                    ia_config_path=get_testfile_path('ia_config_for_test.ini'))
+
+        videobasename = os.path.join(
+            current_path, 'test_tubeup_rootdir', 'downloads',
+            'Mountain_3_-_Video_Background_HD_1080p-6iRV8liah8A')
+
+        copy_testfiles_to_tubeup_rootdir_test()
+        description_path = videobasename + '.description'
+        with open(description_path, 'rb') as f:
+            description_md5 = hashlib.md5(f.read()).hexdigest()
+        description_size = os.path.getsize(description_path)
+
+        with requests_mock.Mocker() as m:
+            m.get('https://s3.us.archive.org',
+                  content=b'{"over_limit": 0}',
+                  headers={'content-type': 'application/json'})
+            m.get('https://archive.org/metadata/youtube-6iRV8liah8A', json={
+                'metadata': {'identifier': 'youtube-6iRV8liah8A'},
+                'files': [
+                    {'name': os.path.basename(description_path),
+                     'size': str(os.path.getsize(description_path)),
+                     'md5': description_md5},
+                    # Interrupted upload of the info json.
+                    {'name': os.path.basename(videobasename + '.info.json'),
+                     'size': '1', 'md5': 'd41d8cd98f00b204e9800998ecf8427e'},
+                ]})
+            mock_upload_response_by_videobasename(
+                m, 'youtube-6iRV8liah8A', videobasename)
+
+            tu.upload_ia(videobasename)
+
+        uploaded = {os.path.basename(r.path): r for r in m.request_history
+                    if r.method == 'PUT'}
+        info_json_name = os.path.basename(videobasename + '.info.json')
+        self.assertNotIn(os.path.basename(description_path).lower(), uploaded)
+        self.assertIn(info_json_name.lower(), uploaded)
+        self.assertFalse(os.path.exists(description_path))
+        self.assertEqual(tu.metrics.get('tubeup_upload_skipped_bytes_total'),
+                         description_size)
+
+        # The local manifest covers the skipped files too, and its md5 is
+        # the one sent with the upload.
+        with open(os.path.join(tu.dir_path['root'], 'manifests',
+                               'youtube-6iRV8liah8A.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest[os.path.basename(description_path)]['md5'],
+                         description_md5)
+        self.assertEqual(uploaded[info_json_name.lower()].headers['Content-MD5'],
+                         manifest[info_json_name]['md5'])
+
     def test_archive_urls(self):
         tu = TubeUp(dir_path=os.path.join(current_path,
                                           'test_tubeup_rootdir'),
@@ -598,3 +956,302 @@ class TubeUpTests(unittest.TestCase):
                  'scanner': SCANNER})]
 
             self.assertEqual(expected_result, result)
+            self.assertEqual(tu.metrics.get('tubeup_items_uploaded_total'), 1)
+            self.assertEqual(tu.metrics.get('tubeup_upload_queue_depth'), 0)
+
+    def test_get_resource_basenames_break_on_existing(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'))
+        MockChannelYTDLP.extracted = []
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            mock_channel_items(m, archived_ids={'old1', 'old2'})
+
+            result = tu.get_resource_basenames([MockChannelYTDLP.channel_url],
+                                               break_on_existing=True)
+
+        downloads_dir = os.path.join(current_path, 'test_tubeup_rootdir',
+                                     'downloads')
+        self.assertEqual(result, {os.path.join(downloads_dir, 'new1'),
+                                  os.path.join(downloads_dir, 'new2')})
+        # Listing stops at old1, so old2 is never extracted.
+        self.assertEqual(MockChannelYTDLP.extracted,
+                         [('new1', False), ('new1', True),
+                          ('new2', False), ('new2', True),
+                          ('old1', False)])
+
+    def test_get_resource_basenames_stop_after_existing(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'))
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            MockChannelYTDLP.extracted = []
+            mock_channel_items(m, archived_ids={'new2', 'old1'})
+            tu.get_resource_basenames([MockChannelYTDLP.channel_url],
+                                      stop_after_existing=2)
+            # Listing stops at old1, the second archived video in a row.
+            self.assertEqual(MockChannelYTDLP.extracted,
+                             [('new1', False), ('new1', True),
+                              ('new2', False), ('old1', False)])
+
+            MockChannelYTDLP.extracted = []
+            mock_channel_items(m, archived_ids={'new1', 'old1'})
+            tu.get_resource_basenames([MockChannelYTDLP.channel_url],
+                                      stop_after_existing=2)
+            # Downloading new2 ended the streak.
+            self.assertIn(('old2', True), MockChannelYTDLP.extracted)
+
+    def test_get_resource_entries(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'))
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            mock_channel_items(m, archived_ids={'old1', 'old2'})
+
+            entries = tu.get_resource_entries([MockChannelYTDLP.channel_url])
+
+        self.assertEqual([(e.id, e.extractor, e.itemname, e.basename, e.status)
+                          for e in entries],
+                         [('new1', 'youtube', 'youtube-new1', 'new1', 'downloaded'),
+                          ('new2', 'youtube', 'youtube-new2', 'new2', 'downloaded')])
+        self.assertEqual(entries[0].basepath,
+                         os.path.join(tu.dir_path['downloads'], 'new1'))
+        # The directory isn't copied for every entry.
+        self.assertIs(entries[0].directory, entries[1].directory)
+        self.assertFalse(hasattr(entries[0], '__dict__'))
+
+    def test_get_resource_basenames_lists_whole_channel(self):
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'))
+        MockChannelYTDLP.extracted = []
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            mock_channel_items(m, archived_ids={'old1'})
+
+            tu.get_resource_basenames([MockChannelYTDLP.channel_url])
+
+        self.assertIn(('old2', True), MockChannelYTDLP.extracted)
+        self.assertNotIn(('old1', True), MockChannelYTDLP.extracted)
+
+    def test_get_resource_basenames_skips_locked_items(self):
+        lock = SQLiteLockBackend(':memory:', 'node-a')
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'),
+                    lock=lock)
+        MockChannelYTDLP.extracted = []
+        lock.owner = 'node-b'
+        lock.acquire('youtube-new2')
+        lock.owner = 'node-a'
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            mock_channel_items(m, archived_ids={'old1', 'old2'})
+
+            tu.get_resource_basenames([MockChannelYTDLP.channel_url])
+
+        self.assertIn(('new1', True), MockChannelYTDLP.extracted)
+        self.assertNotIn(('new2', True), MockChannelYTDLP.extracted)
+        self.assertEqual(tu._held_locks, ['youtube-new1'])
+        self.assertEqual(tu.metrics.get('tubeup_items_skipped_total',
+                                        reason='locked'), 1)
+
+    def test_get_resource_basenames_checks_items_again_once_locked(self):
+        lock = SQLiteLockBackend(':memory:', 'node-a')
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'),
+                    lock=lock)
+        MockChannelYTDLP.extracted = []
+        checked = []
+
+        def exists(tubeup, itemname):
+            # Another worker uploads new1 while this one takes its lock.
+            checked.append(itemname)
+            if itemname == 'youtube-new1':
+                return checked.count(itemname) > 1
+            return itemname.startswith('youtube-old')
+
+        with patch.object(tu.storage, 'exists', side_effect=exists), \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            tu.get_resource_basenames([MockChannelYTDLP.channel_url])
+
+        self.assertNotIn(('new1', True), MockChannelYTDLP.extracted)
+        self.assertIn(('new2', True), MockChannelYTDLP.extracted)
+        self.assertEqual(tu._held_locks, ['youtube-new2'])
+        # The lock of new1 has been released.
+        lock.owner = 'node-b'
+        self.assertTrue(lock.acquire('youtube-new1'))
+
+    def test_renew_locks(self):
+        lock = SQLiteLockBackend(':memory:', 'node-a')
+        tu = TubeUp(dir_path=os.path.join(current_path,
+                                          'test_tubeup_rootdir'),
+                    lock=lock)
+        lock.acquire('youtube-a')
+        tu._held_locks.append('youtube-a')
+
+        with patch.object(lock, 'renew', return_value=True) as renew:
+            tu.renew_locks()
+            renew.assert_not_called()
+            tu._locks_renewed -= 3600
+            tu.renew_locks()
+            tu.renew_locks()
+        renew.assert_called_once_with('youtube-a')
+
+    def test_refresh_metadata(self):
+        tu = TubeUp(ia_config_path=get_testfile_path('ia_config_for_test.ini'))
+        MockChannelYTDLP.extracted = []
+
+        def current_metadata(video_id, **changes):
+            metadata = tu.create_archive_org_metadata_from_youtubedl_meta({
+                'id': video_id, 'title': video_id, 'extractor_key': 'Youtube',
+                'webpage_url': 'https://www.youtube.com/watch?v=' + video_id})
+            metadata.update(changes)
+            # archive.org doesn't store empty fields, e.g. `licenseurl`.
+            return {'metadata': {key: value for key, value in metadata.items()
+                                 if value not in ('', [], None)}}
+
+        with requests_mock.Mocker() as m, \
+                patch('tubeup.TubeUp.YoutubeDL', MockChannelYTDLP):
+            m.get('https://archive.org/metadata/youtube-new1', json={})
+            m.get('https://archive.org/metadata/youtube-new2', json={})
+            m.get('https://archive.org/metadata/youtube-old1',
+                  json=current_metadata('old1', title='Old title'))
+            m.get('https://archive.org/metadata/youtube-old2',
+                  json=current_metadata('old2', scanner='TubeUp 0.0.1'))
+            m.post('https://archive.org/metadata/youtube-old1',
+                   json={'success': True})
+
+            result = list(tu.refresh_metadata([MockChannelYTDLP.channel_url],
+                                              workers=2))
+
+        self.assertEqual(result, [('youtube-old1', {'title': 'old1'})])
+        # Nothing is downloaded.
+        self.assertTrue(all(not download
+                            for _, download in MockChannelYTDLP.extracted))
+        writes = [r for r in m.request_history if r.method == 'POST']
+        self.assertEqual(len(writes), 1)
+        self.assertIn('title', writes[0].text)
+        self.assertEqual(tu.metrics.get('tubeup_metadata_updates_total'), 1)
+
+    def test_base_ydl_options_are_cached(self):
+        options = self.tu.base_ydl_options(proxy_url='http://proxy:3128')
+
+        self.assertIs(options, self.tu.base_ydl_options(None, 'http://proxy:3128'))
+        self.assertNotIn('progress_hooks', options)
+        with self.assertRaises(TypeError):
+            options['proxy'] = None
+
+        # The hook is only added to a copy.
+        ydl_opts = self.tu.generate_ydl_options(mocked_ydl_progress_hook,
+                                                proxy_url='http://proxy:3128')
+        self.assertEqual(ydl_opts['progress_hooks'], [mocked_ydl_progress_hook])
+        self.assertNotIn('progress_hooks', options)
+
+    def test_changing_settings_rebuilds_ydl_options(self):
+        with self.tu._checkout_ydl(None, None) as before:
+            pass
+        self.tu.dir_path = os.path.join(current_path, 'test_tubeup_rootdir')
+        with self.tu._checkout_ydl(None, None) as after:
+            pass
+
+        self.assertIsNot(before, after)
+        self.assertTrue(after.params['outtmpl']['default'].startswith(
+            os.path.join(current_path, 'test_tubeup_rootdir')))
+
+    def test_youtubedl_instances_are_reused(self):
+        calls = []
+
+        with self.tu._checkout_ydl(calls.append, None) as first:
+            first.params['progress_hooks'][0]({'status': 'downloading'})
+        with self.tu._checkout_ydl(None, None) as second:
+            # The hooks of the previous caller are gone.
+            second.params['progress_hooks'][0]({'status': 'finished'})
+        with self.tu._checkout_ydl(None, None, None, 'http://proxy:3128') as other:
+            pass
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(other.params['proxy'], 'http://proxy:3128')
+        self.assertEqual(calls, [{'status': 'downloading'}])
+
+        # Two concurrent callers don't share an instance.
+        with self.tu._checkout_ydl(None, None) as first:
+            with self.tu._checkout_ydl(None, None) as second:
+                self.assertIsNot(first, second)
+
+        with patch.object(YoutubeDL, 'close') as close:
+            self.tu.close()
+        self.assertEqual(close.call_count, 3)
+
+    def test_reused_youtubedl_instances_reload_the_download_archive(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        tu = TubeUp(dir_path=tmp_dir)
+        self.addCleanup(tu.close)
+        video = {'id': 'a', 'extractor': 'youtube', 'extractor_key': 'Youtube'}
+
+        with tu._checkout_ydl(None, None, None, None, None, None, True) as first:
+            self.assertFalse(first.in_download_archive(video))
+        # Another worker, or the previous watch poll, archives the video.
+        with open(os.path.join(tmp_dir, '.ytdlarchive'), 'a',
+                  encoding='utf-8') as f:
+            f.write('youtube a\n')
+        with tu._checkout_ydl(None, None, None, None, None, None, True) as second:
+            self.assertIs(first, second)
+            self.assertTrue(second.in_download_archive(video))
+
+    def test_watch_urls(self):
+        results = [[('youtube-new1', {})], [], [('youtube-new2', {})]]
+
+        with patch.object(self.tu, 'archive_urls',
+                          side_effect=lambda *a, **kw: iter(results.pop(0))
+                          ) as archive_urls, \
+                patch('tubeup.TubeUp.time.sleep') as sleep:
+            uploaded = list(self.tu.watch_urls(
+                [MockChannelYTDLP.channel_url], interval=60, polls=3))
+
+        self.assertEqual(uploaded, [('youtube-new1', {}), ('youtube-new2', {})])
+        self.assertEqual(archive_urls.call_count, 3)
+        self.assertTrue(archive_urls.call_args.kwargs['break_on_existing'])
+        self.assertTrue(archive_urls.call_args.kwargs['use_download_archive'])
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_watch_urls_survives_failing_poll(self):
+        def archive_urls(*args, **kwargs):
+            raise ValueError('extractor broke')
+            yield
+
+        with patch.object(self.tu, 'archive_urls', side_effect=archive_urls), \
+                patch('tubeup.TubeUp.time.sleep'):
+            self.assertEqual(list(self.tu.watch_urls(['https://example.com'],
+                                                     polls=2)), [])
+
+    def test_archive_urls_streams_urls(self):
+        events = []
+
+        def urls():
+            for url in ('https://youtu.be/a', 'https://youtu.be/b'):
+                events.append(('read', url))
+                yield url
+
+        def get_resource_entries(urls, *args):
+            return [VideoEntry('a', 'youtube', 'youtube-a', 'downloads',
+                               'basename-' + url[-1]) for url in urls]
+
+        def upload_ia(basename, custom_meta=None):
+            events.append(('upload', basename))
+            return basename, {}
+
+        with patch.object(self.tu, 'get_resource_entries',
+                          side_effect=get_resource_entries), \
+                patch.object(self.tu, 'upload_ia', side_effect=upload_ia):
+            list(self.tu.archive_urls(urls()))
+
+        self.assertEqual(events, [('read', 'https://youtu.be/a'),
+                                  ('upload', os.path.join('downloads', 'basename-a')),
+                                  ('read', 'https://youtu.be/b'),
+                                  ('upload', os.path.join('downloads', 'basename-b'))])
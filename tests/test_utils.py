@@ -1,6 +1,25 @@
+import io
+import errno
+import shutil
+import tempfile
 import unittest
 import os
-from tubeup.utils import sanitize_identifier, check_is_file_empty
+from unittest.mock import patch
+from tubeup.utils import (sanitize_identifier, check_is_file_empty,
+                          iter_batch_urls, dedup_urls, diff_metadata,
+                          join_subject, html_description, link_file,
+                          reflink_file, DESCRIPTION_MAX_BYTES,
+                          DESCRIPTION_TRUNCATED_NOTE)
+
+
+def truncated_subject(tags):
+    # How subjects used to be built, by concatenating and re-splitting.
+    tags_string = ''.join('%s;' % tag for tag in tags)
+    while len(tags_string.encode('utf-8')) > 255:
+        tags_list = tags_string.split(';')
+        tags_list.pop()
+        tags_string = ';'.join(tags_list)
+    return tags_string
 
 
 class UtilsTest(unittest.TestCase):
@@ -48,3 +67,125 @@ class UtilsTest(unittest.TestCase):
                 FileNotFoundError,
                 r"^Path 'file_that_doesnt_exist.txt' doesn't exist$"):
             check_is_file_empty('file_that_doesnt_exist.txt')
+
+    def test_iter_batch_urls(self):
+        batch = io.StringIO('https://youtu.be/a\n'
+                            '\n'
+                            '# a comment\n'
+                            '; another comment\n'
+                            '  https://youtu.be/b  \n')
+
+        self.assertListEqual(list(iter_batch_urls(batch)),
+                             ['https://youtu.be/a', 'https://youtu.be/b'])
+
+    def test_dedup_urls(self):
+        urls = ['https://youtu.be/a', 'https://youtu.be/b',
+                'https://youtu.be/a', 'https://youtu.be/c',
+                'https://youtu.be/b']
+
+        self.assertListEqual(list(dedup_urls(urls)),
+                             ['https://youtu.be/a', 'https://youtu.be/b',
+                              'https://youtu.be/c'])
+
+    def test_dedup_urls_is_lazy(self):
+        def urls():
+            yield 'https://youtu.be/a'
+            raise AssertionError('read too far')
+
+        self.assertEqual(next(dedup_urls(urls())), 'https://youtu.be/a')
+
+    def test_diff_metadata(self):
+        current = {'title': 'Old title', 'subject': ['Youtube', 'video', 'cats'],
+                   'date': '2020-01-01', 'scanner': 'TubeUp 1.0'}
+        new = {'title': 'New title', 'subject': 'Youtube;video;cats;',
+               'date': '2020-01-01', 'scanner': 'TubeUp 2.0',
+               'channel': 'https://www.youtube.com/@channel'}
+
+        self.assertDictEqual(diff_metadata(current, new),
+                             {'title': 'New title',
+                              'channel': 'https://www.youtube.com/@channel'})
+
+        # archive.org items don't keep empty fields.
+        self.assertDictEqual(diff_metadata({'title': 'a'},
+                                           {'title': 'a', 'licenseurl': '',
+                                            'subject': [], 'tags': ()}),
+                             {})
+
+    def test_join_subject(self):
+        cases = [
+            ['Youtube', 'video'],
+            ['Youtube', 'video', 'a' * 243],
+            ['Youtube', 'video', 'a' * 242],
+            ['Youtube', 'video'] + ['tag%d' % i for i in range(5000)],
+            ['Youtube', 'video', 'semi;colon'] + ['tag'] * 100,
+            ['Youtube', 'video'] + ['\u00e9t\u00e9'] * 100,
+            ['x' * 300],
+        ]
+        for tags in cases:
+            self.assertEqual(join_subject(tags), truncated_subject(tags))
+        self.assertEqual(join_subject(['Youtube', 'video']), 'Youtube;video;')
+
+    def test_join_subject_stops_at_the_limit(self):
+        def tags():
+            yield 'Youtube'
+            yield 'x' * 300
+            raise AssertionError('read too far')
+
+        self.assertEqual(join_subject(tags()), 'Youtube')
+
+    def test_html_description(self):
+        self.assertEqual(html_description('a\r\nb\nc'), 'a<br>b<br>c')
+
+    def test_html_description_is_capped(self):
+        for text in ['a' * 500000, '\n' * 500000, '\u00e9' * 500000,
+                     ('line\n' * 100000)]:
+            description = html_description(text)
+            self.assertLessEqual(len(description.encode('utf-8')),
+                                 DESCRIPTION_MAX_BYTES)
+            self.assertTrue(description.endswith(DESCRIPTION_TRUNCATED_NOTE))
+            # No half line breaks before the note.
+            self.assertNotRegex(description[:-len(DESCRIPTION_TRUNCATED_NOTE)],
+                                '<(br?)?$')
+
+        text = 'a' * DESCRIPTION_MAX_BYTES
+        self.assertEqual(html_description(text), text)
+
+
+class LinkFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = os.path.join(self.tmp_dir, 'source')
+        with open(self.source, 'wb') as f:
+            f.write(b'data')
+        self.destination = os.path.join(self.tmp_dir, 'destination')
+
+    def test_hard_link(self):
+        link_file(self.source, self.destination)
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+        # An existing file is replaced.
+        other = os.path.join(self.tmp_dir, 'other')
+        open(other, 'w').close()
+        link_file(other, self.destination)
+        self.assertTrue(os.path.samefile(other, self.destination))
+
+    @patch('os.link', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    def test_other_file_system(self, link):
+        with patch('tubeup.utils.reflink_file',
+                   side_effect=lambda src, dst: bool(shutil.copyfile(src, dst))) as reflink:
+            link_file(self.source, self.destination)
+        reflink.assert_called_once()
+
+        with patch('tubeup.utils.reflink_file', return_value=False):
+            link_file(self.source, self.destination)
+        with open(self.destination, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['destination', 'source'])
+
+    @patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'Not supported'))
+    def test_reflink_unsupported(self, ioctl):
+        self.assertFalse(reflink_file(self.source, self.destination))
+        self.assertFalse(os.path.exists(self.destination))
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from yt_dlp import YoutubeDL
+
+from tubeup.TubeUp import TubeUp
+from tubeup.workqueue import WorkQueue
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'queue.db')
+
+    def test_enqueue_ignores_duplicates(self):
+        queue = WorkQueue(self.path)
+
+        self.assertEqual(queue.enqueue(['https://youtu.be/a',
+                                        'https://youtu.be/b']), 2)
+        self.assertEqual(queue.enqueue(['https://youtu.be/a',
+                                        'https://youtu.be/c']), 1)
+        self.assertEqual(queue.counts(), {'pending': 3})
+
+    def test_lease_is_exclusive(self):
+        WorkQueue(self.path).enqueue(['https://youtu.be/a'])
+        node_a = WorkQueue(self.path)
+        node_b = WorkQueue(self.path)
+
+        self.assertEqual(node_a.lease('node-a'), 'https://youtu.be/a')
+        self.assertIsNone(node_b.lease('node-b'))
+
+    def test_expired_lease_is_handed_out_again(self):
+        queue = WorkQueue(self.path, lease_seconds=-1)
+        queue.enqueue(['https://youtu.be/a'])
+
+        self.assertEqual(queue.lease('node-a'), 'https://youtu.be/a')
+        self.assertEqual(queue.lease('node-b'), 'https://youtu.be/a')
+        # node-a lost its lease, so its report is ignored.
+        queue.complete('https://youtu.be/a', 'node-a')
+        self.assertEqual(queue.counts(), {'leased': 1})
+        self.assertFalse(queue.renew('https://youtu.be/a', 'node-a'))
+
+    def test_renew_from_another_thread(self):
+        # Uploads renew the lease from the threads sending the parts.
+        queue = WorkQueue(self.path)
+        queue.enqueue(['https://youtu.be/a'])
+        url = queue.lease('node')
+        renewed = []
+        thread = threading.Thread(
+            target=lambda: renewed.append(queue.renew(url, 'node')))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(renewed, [True])
+
+    def test_complete_and_fail(self):
+        queue = WorkQueue(self.path, max_attempts=2)
+        queue.enqueue(['https://youtu.be/a', 'https://youtu.be/b'])
+
+        queue.complete(queue.lease('node'), 'node', ['youtube-a'])
+        queue.fail(queue.lease('node'), 'node', 'boom')
+        self.assertEqual(queue.counts(), {'done': 1, 'pending': 1})
+
+        queue.fail(queue.lease('node'), 'node', 'boom')
+        self.assertEqual(queue.counts(), {'done': 1, 'failed': 1})
+        self.assertIsNone(queue.lease('node'))
+
+    def test_concurrent_workers_never_share_a_url(self):
+        urls = ['https://youtu.be/%d' % i for i in range(200)]
+        WorkQueue(self.path).enqueue(urls)
+        leased = []
+
+        def worker(name):
+            queue = WorkQueue(self.path)
+            while True:
+                url = queue.lease(name)
+                if url is None:
+                    break
+                leased.append(url)
+                queue.complete(url, name)
+
+        threads = [threading.Thread(target=worker, args=('node-%d' % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(leased), sorted(urls))
+        self.assertEqual(WorkQueue(self.path).counts(), {'done': 200})
+
+    def test_archive_queue(self):
+        queue = WorkQueue(self.path)
+        queue.enqueue(['https://youtu.be/a', 'https://youtu.be/b'])
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'))
+
+        def archive_urls(urls, *args):
+            if urls == ['https://youtu.be/b']:
+                raise ValueError('extractor broke')
+            yield 'youtube-a', {'title': 'a'}
+
+        with patch.object(tu, 'archive_urls', side_effect=archive_urls):
+            result = list(tu.archive_queue(queue, 'node',
+                                           exit_when_empty=True))
+
+        # The broken url is retried until it runs out of attempts.
+        self.assertEqual(result, [('youtube-a', {'title': 'a'})])
+        self.assertEqual(queue.counts(), {'done': 1, 'failed': 1})
+        self.assertEqual(tu.metrics.get('tubeup_work_queue_pending'), 0)
+
+    def test_archive_queue_retries_urls_that_cant_be_extracted(self):
+        queue = WorkQueue(self.path, max_attempts=2)
+        queue.enqueue(['https://x.invalid/a'])
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'))
+        self.addCleanup(tu.close)
+
+        # yt-dlp returns None for a failed extraction with `ignoreerrors`.
+        with patch.object(YoutubeDL, 'extract_info', return_value=None):
+            result = list(tu.archive_queue(queue, 'node',
+                                           exit_when_empty=True))
+
+        self.assertEqual(result, [])
+        self.assertEqual(queue.counts(), {'failed': 1})
+
+    def test_archive_queue_stops_once_the_lease_is_lost(self):
+        queue = WorkQueue(self.path, lease_seconds=-1)
+        queue.enqueue(['https://youtu.be/a'])
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'))
+
+        def archive_urls(urls, *args):
+            # The lease expired, and another worker took the url over.
+            self.assertEqual(WorkQueue(self.path).lease('node-b'), urls[0])
+            yield 'youtube-a1', {'title': 'a1'}
+            yield 'youtube-a2', {'title': 'a2'}
+
+        with patch.object(tu, 'archive_urls', side_effect=archive_urls):
+            result = list(tu.archive_queue(queue, 'node',
+                                           exit_when_empty=True))
+
+        self.assertEqual(result, [('youtube-a1', {'title': 'a1'})])
+        # The url is left to node-b.
+        self.assertEqual(queue.counts(), {'leased': 1})
+        self.assertIsNone(tu._lease)
+
+    def test_lease_is_renewed_from_progress(self):
+        queue = WorkQueue(self.path)
+        queue.enqueue(['https://youtu.be/a'])
+        tu = TubeUp(dir_path=os.path.join(self.tmp_dir, 'root'))
+        renewals = []
+
+        def archive_urls(urls, *args):
+            tu._locks_renewed -= 3600
+            with patch.object(queue, 'renew', wraps=queue.renew) as renew:
+                tu.renew_locks()
+            renewals.extend(renew.call_args_list)
+            yield 'youtube-a', {'title': 'a'}
+
+        with patch.object(tu, 'archive_urls', side_effect=archive_urls):
+            list(tu.archive_queue(queue, 'node', exit_when_empty=True))
+
+        self.assertEqual([call.args for call in renewals],
+                         [('https://youtu.be/a', 'node')])
+        self.assertEqual(queue.counts(), {'done': 1})
@@ -5,13 +5,27 @@ import glob
 import time
 import json
 import logging
+import threading
 import internetarchive
 
 from internetarchive.config import parse_config_file
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime
+from types import MappingProxyType
 from yt_dlp import YoutubeDL
-from .utils import (get_itemname, check_is_file_empty,
+from yt_dlp.utils import DateRange, DownloadError, locked_file
+from .utils import (get_itemname, check_is_file_empty, diff_metadata,
+                    join_subject, html_description, link_file,
                     EMPTY_ANNOTATION_FILE)
+from .checksum import checksum_files, file_checksums, write_manifest
+from .timing import StageTimer
+from .metrics import Metrics
+from .progress import ProgressReporter
+from .s3 import MultipartUpload, DEFAULT_PART_SIZE, MULTIPART_THRESHOLD
+from .bandwidth import BandwidthManager, ThrottledReader, DOWNLOAD, UPLOAD
+from .entries import VideoEntry, UPLOADED
+from .storage import IAStorage
 from logging import getLogger
 from urllib.parse import urlparse
 
@@ -20,6 +34,50 @@ from tubeup import __version__
 
 DOWNLOAD_DIR_NAME = 'downloads'
 
+# Formats that are a single file served over plain HTTP, so their bytes can
+# be copied straight into an upload.
+STREAM_FORMAT = 'best[protocol=https]/best[protocol=http]'
+
+# Seconds between two renewals of the locks and the work queue lease held
+# while downloading and uploading, far below their TTL.
+LOCK_RENEW_INTERVAL = 60
+
+
+def _file_stat(path):
+    # What tells whether a file changed, None if there is no such file.
+    try:
+        stat = os.stat(path)
+    except (TypeError, FileNotFoundError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_download_archive(path):
+    # Read a yt-dlp download archive the way `YoutubeDL` does when created.
+    archive = set()
+    try:
+        with locked_file(path, 'r', encoding='utf-8') as f:
+            archive.update(line.strip() for line in f)
+    except FileNotFoundError:
+        pass
+    return archive
+
+
+class _YoutubeDLHooks(object):
+    # Hooks registered once on a pooled `YoutubeDL`, forwarding to the hooks
+    # of whoever currently borrows it.
+    def __init__(self):
+        self.progress = None
+        self.postprocessor = None
+
+    def progress_hook(self, d):
+        if self.progress is not None:
+            self.progress(d)
+
+    def postprocessor_hook(self, d):
+        if self.postprocessor is not None:
+            self.postprocessor(d)
+
 
 class TubeUp(object):
     class DirError(Exception):
@@ -29,7 +87,20 @@ class TubeUp(object):
                  verbose=False,
                  dir_path='~/.tubeup',
                  ia_config_path=None,
-                 output_template=None):
+                 output_template=None,
+                 metrics=None,
+                 lock=None,
+                 stream_upload=False,
+                 part_size=DEFAULT_PART_SIZE,
+                 upload_workers=4,
+                 multipart_threshold=MULTIPART_THRESHOLD,
+                 fragments=1,
+                 http_chunk_size=None,
+                 downloader=None,
+                 bandwidth=None,
+                 storage=None,
+                 cache=None,
+                 keep_local=None):
         """
         `tubeup` is a tool to archive YouTube by downloading the videos and
         uploading it back to the archive.org.
@@ -43,11 +114,86 @@ class TubeUp(object):
                                 be used in uploading the file.
         :param output_template: A template string that will be used to
                                 generate the output filenames.
+        :param metrics:         A `tubeup.metrics.Metrics` registry to record
+                                counters and latencies in, can be shared
+                                between several instances. A new one is
+                                created by default.
+        :param lock:            A lock backend from `tubeup.locks`, shared
+                                with other workers so only one of them
+                                downloads and uploads a given item.
+        :param stream_upload:   Experimental. Copy the media straight from
+                                its source into a multipart upload instead of
+                                downloading it first, only the metadata files
+                                are written to disk. Videos are limited to the
+                                best format that is a single HTTP file.
+        :param part_size:       Size in bytes of the parts of multipart
+                                uploads.
+        :param upload_workers:  Number of parts of a multipart upload that
+                                are sent at the same time.
+        :param multipart_threshold:
+                                Files from this size in bytes on are uploaded
+                                in parts, which are retried on their own and
+                                resumed by the next run if it is interrupted.
+        :param fragments:       Number of fragments of HLS and DASH formats
+                                that yt-dlp downloads at the same time.
+        :param http_chunk_size: Download HTTP formats in requests of this
+                                many bytes, which works around servers that
+                                throttle long requests. None downloads them
+                                in a single request.
+        :param downloader:      Name of an external downloader used by
+                                yt-dlp for every protocol it supports, e.g.
+                                ``aria2c``, which splits HTTP downloads over
+                                several connections. None uses the native
+                                downloaders.
+        :param bandwidth:       A `tubeup.bandwidth.BandwidthManager` whose
+                                download and upload budgets are shared with
+                                the other instances using it. Transfers are
+                                not limited by default.
+        :param storage:         A `tubeup.storage.Storage` the items are
+                                uploaded to, archive.org by default.
+        :param cache:           A `tubeup.cache.MediaCache` that downloaded
+                                media is kept in and linked from instead of
+                                being downloaded again. No cache by default.
+        :param keep_local:      Directory the files of every item are kept
+                                in, under the item name. They are linked
+                                there before the upload starts, so they stay
+                                in ``<keep_local>/<item>`` if the upload
+                                fails. They are hard links to the downloaded
+                                files, so keeping them copies no data.
+                                Nothing is kept by default.
         """
         self.dir_path = dir_path
         self.verbose = verbose
         self.ia_config_path = ia_config_path
         self.logger = getLogger(__name__)
+        self.timer = StageTimer()
+        self.metrics = Metrics() if metrics is None else metrics
+        self.timer.add_hook(self.metrics.observe_span)
+        self.progress = ProgressReporter(
+            stream=sys.stdout if verbose else None)
+        self.lock = lock
+        self._held_locks = []
+        self._locks_renewed = time.monotonic()
+        # The work queue lease of the url `archive_queue` is archiving, as a
+        # (queue, url, worker id) tuple.
+        self._lease = None
+        self._lease_lost = False
+        self._ydl_pool = {}
+        self._ydl_options_cache = {}
+        self._ydl_pool_lock = threading.Lock()
+        self.stream_upload = stream_upload
+        self.part_size = part_size
+        self.upload_workers = upload_workers
+        self.multipart_threshold = multipart_threshold
+        self.fragments = fragments
+        self.http_chunk_size = http_chunk_size
+        self.downloader = downloader
+        self.bandwidth = BandwidthManager() if bandwidth is None else bandwidth
+        self.storage = IAStorage() if storage is None else storage
+        self.cache = cache
+        self.keep_local = keep_local
+        if stream_upload and not isinstance(self.storage, IAStorage):
+            raise ValueError('Streaming uploads only work with archive.org.')
         if output_template is None:
             self.output_template = '%(id)s.%(ext)s'
         else:
@@ -112,13 +258,128 @@ class TubeUp(object):
             'downloads': downloads_dir_path
         }
 
-    def get_resource_basenames(self, urls,
-                               cookie_file=None, proxy_url=None,
-                               ydl_username=None, ydl_password=None,
-                               use_download_archive=False,
-                               ignore_existing_item=False):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Close the `YoutubeDL` instances kept for reuse, saving their cookies.
         """
-        Get resource basenames from an url.
+        with self._ydl_pool_lock:
+            pool, self._ydl_pool = self._ydl_pool, {}
+        for idle in pool.values():
+            for ydl, hooks, archive_stat in idle:
+                ydl.close()
+
+    @contextmanager
+    def _checkout_ydl(self, progress_hook, postprocessor_hook, *option_args):
+        """
+        Borrow a `YoutubeDL` instance built from `generate_ydl_options` with
+        `option_args`, reusing an idle one made with the same options.
+
+        Creating an instance registers every extractor and sets up the
+        cookie jar and the HTTP clients, so instances are kept until `close`
+        and shared by all the calls that use the same options. The hooks of
+        the instance are swapped for the given ones while it is borrowed.
+
+        An instance only reads the download archive when it is created, so
+        a reused one reloads it if the file changed since, e.g. because
+        another worker or an earlier watch poll archived videos meanwhile.
+        """
+        key = self._ydl_options_key(*option_args)
+        with self._ydl_pool_lock:
+            idle = self._ydl_pool.get(key)
+            entry = idle.pop() if idle else None
+        if entry is None:
+            hooks = _YoutubeDLHooks()
+            options = self.generate_ydl_options(hooks.progress_hook,
+                                                *option_args)
+            archive_stat = _file_stat(options.get('download_archive'))
+            ydl = YoutubeDL(options)
+            ydl.add_postprocessor_hook(hooks.postprocessor_hook)
+            if self.cache is not None and not self.stream_upload:
+                self.cache.add_to(ydl, self.metrics)
+        else:
+            ydl, hooks, archive_stat = entry
+            archive_path = ydl.params.get('download_archive')
+            if archive_path and _file_stat(archive_path) != archive_stat:
+                archive_stat = _file_stat(archive_path)
+                ydl.archive = _load_download_archive(archive_path)
+
+        hooks.progress, hooks.postprocessor = progress_hook, postprocessor_hook
+        try:
+            yield ydl
+        except BaseException:
+            # Don't reuse an instance that may be in an unknown state.
+            ydl.close()
+            raise
+        finally:
+            hooks.progress = hooks.postprocessor = None
+        ydl.save_cookies()
+        with self._ydl_pool_lock:
+            self._ydl_pool.setdefault(key, []).append((ydl, hooks, archive_stat))
+
+    def renew_locks(self):
+        """
+        Renew the locks of the items being archived and the work queue lease
+        of their url, so they don't expire during long downloads and uploads.
+        Called from the progress callbacks, it only renews them every
+        `LOCK_RENEW_INTERVAL` seconds.
+        """
+        held_locks = self.lock is not None and self._held_locks
+        if not held_locks and self._lease is None:
+            return
+        now = time.monotonic()
+        if now - self._locks_renewed < LOCK_RENEW_INTERVAL:
+            return
+        self._locks_renewed = now
+        if held_locks:
+            for itemname in list(self._held_locks):
+                if not self.lock.renew(itemname):
+                    self.logger.warning('Lost the lock of item "%s", another '
+                                        'worker may archive it too.' % itemname)
+        self._renew_lease()
+
+    def _renew_lease(self):
+        """
+        :return:  False once the work queue lease has been lost.
+        """
+        lease = self._lease
+        if lease is not None:
+            queue, url, worker_id = lease
+            if not queue.renew(url, worker_id):
+                self.logger.warning('Lost the lease of %s, another worker may '
+                                    'archive it too.' % url)
+                self._lease = None
+                self._lease_lost = True
+        return not self._lease_lost
+
+    def get_resource_basenames(self, urls, *args, **kwargs):
+        """
+        Download videos like `get_resource_entries`.
+
+        :return:  Set of videos basename that has been downloaded.
+        """
+        return {entry.basepath
+                for entry in self.get_resource_entries(urls, *args, **kwargs)}
+
+    def get_resource_entries(self, urls,
+                             cookie_file=None, proxy_url=None,
+                             ydl_username=None, ydl_password=None,
+                             use_download_archive=False,
+                             ignore_existing_item=False,
+                             break_on_existing=False,
+                             dateafter=None,
+                             stop_after_existing=None):
+        """
+        Download the videos of urls that are not archived yet.
+
+        Playlists are walked one video at a time and only a `VideoEntry`
+        is kept for every downloaded video, so the memory used grows
+        slowly even for channels with a huge number of videos.
 
         :param urls:                  A list of urls that will be downloaded with
                                       youtubedl.
@@ -133,58 +394,116 @@ class TubeUp(object):
                                       the archive file. Record the IDs of all
                                       downloaded videos in it.
         :param ignore_existing_item:  Ignores the check for existing items on archive.org.
-        :return:                      Set of videos basename that has been downloaded.
+        :param break_on_existing:     Stop listing a playlist at the first video that
+                                      is already archived. Channels list their newest
+                                      uploads first, so this only fetches new ones.
+        :param dateafter:             Skip videos uploaded before this date, given in
+                                      any format yt-dlp's ``--dateafter`` accepts,
+                                      e.g. ``20240101`` or ``today-2weeks``.
+        :param stop_after_existing:   Stop listing a playlist after this many videos
+                                      in a row are already archived, which also stops
+                                      yt-dlp from fetching further playlist pages.
+                                      Overrides `break_on_existing`, which stops
+                                      after one.
+        :return:                      A list of `VideoEntry` of the videos that have
+                                      been downloaded.
+        :raises DownloadError:        If a url can't be extracted at all.
         """
-        downloaded_files_basename = set()
+        downloaded_entries = []
+        seen_basenames = set()
+        date_range = DateRange(start=dateafter) if dateafter else None
+        if not stop_after_existing and break_on_existing:
+            stop_after_existing = 1
 
         def check_if_ia_item_exists(infodict):
             itemname = get_itemname(infodict)
-            item = internetarchive.get_item(itemname)
-            if item.exists and self.verbose:
-                print("\n:: Item already exists. Not downloading.")
-                print('Title: %s' % infodict['title'])
-                print('Video URL: %s\n' % infodict['webpage_url'])
+            with self.timer.span('exists_check', itemname):
+                exists = self.storage.exists(self, itemname)
+            if exists:
+                if self.verbose:
+                    print("\n:: Item already exists. Not downloading.")
+                    print('Title: %s' % infodict.get('title'))
+                    print('Video URL: %s\n' % infodict.get('webpage_url'))
                 return True
             return False
 
         def ydl_progress_each(entry):
+            """
+            Download one video unless it is already archived.
+
+            :return:  True if the video was already archived, False if it has
+                      been downloaded and None if it has been skipped.
+            """
             if not entry:
                 self.logger.warning('Video "%s" is not available. Skipping.' % url)
-                return
+                return None
             if ydl.in_download_archive(entry):
-                return
-            if not check_if_ia_item_exists(entry):
-                ydl.extract_info(entry['webpage_url'])
-                downloaded_files_basename.update(self.create_basenames_from_ydl_info_dict(ydl, entry))
+                self.metrics.inc('tubeup_items_skipped_total', reason='download_archive')
+                return True
+            if (date_range is not None and entry.get('upload_date') and
+                    entry['upload_date'] not in date_range):
+                self.logger.info('Video "%s" was uploaded before %s. Skipping.'
+                                 % (entry.get('id'), dateafter))
+                return None
+            if ignore_existing_item or not check_if_ia_item_exists(entry):
+                itemname = get_itemname(entry)
+                if self.lock is not None:
+                    if not self.lock.acquire(itemname):
+                        self.logger.info('Item "%s" is being archived by another '
+                                         'worker. Skipping.' % itemname)
+                        self.metrics.inc('tubeup_items_skipped_total', reason='locked')
+                        return None
+                    self._held_locks.append(itemname)
+                    # Another worker may have archived the item between the
+                    # check and taking the lock.
+                    if not ignore_existing_item and check_if_ia_item_exists(entry):
+                        self._held_locks.remove(itemname)
+                        self.lock.release(itemname)
+                        self.metrics.inc('tubeup_items_skipped_total', reason='item_exists')
+                        ydl.record_download_archive(entry)
+                        return True
+                with self.timer.span('download', itemname), \
+                        self.bandwidth.transfer(DOWNLOAD, set_ratelimit):
+                    if entry.get('webpage_url'):
+                        info = ydl.extract_info(entry['webpage_url'])
+                    else:
+                        info = ydl.process_ie_result(entry)
+                size = info and (info.get('filesize') or info.get('filesize_approx'))
+                # Fields yt-dlp derives while processing, e.g. `upload_date`
+                # from `timestamp`, are only in the processed info dict.
+                downloaded = info or entry
+                for basename in self.create_basenames_from_ydl_info_dict(ydl, downloaded):
+                    if basename not in seen_basenames:
+                        seen_basenames.add(basename)
+                        downloaded_entries.append(VideoEntry.from_info_dict(
+                            downloaded, self.dir_path['downloads'], basename, size))
+                return False
             else:
+                self.metrics.inc('tubeup_items_skipped_total', reason='item_exists')
                 ydl.record_download_archive(entry)
+                return True
 
-        def ydl_progress_hook(d):
-            if d['status'] == 'downloading' and self.verbose:
-                if d.get('_total_bytes_str') is not None:
-                    msg_template = ('%(_percent_str)s of %(_total_bytes_str)s '
-                                    'at %(_speed_str)s ETA %(_eta_str)s')
-                elif d.get('_total_bytes_estimate_str') is not None:
-                    msg_template = ('%(_percent_str)s of '
-                                    '~%(_total_bytes_estimate_str)s at '
-                                    '%(_speed_str)s ETA %(_eta_str)s')
-                elif d.get('_downloaded_bytes_str') is not None:
-                    if d.get('_elapsed_str'):
-                        msg_template = ('%(_downloaded_bytes_str)s at '
-                                        '%(_speed_str)s (%(_elapsed_str)s)')
-                    else:
-                        msg_template = ('%(_downloaded_bytes_str)s '
-                                        'at %(_speed_str)s')
-                else:
-                    msg_template = ('%(_percent_str)s % at '
-                                    '%(_speed_str)s ETA %(_eta_str)s')
+        def set_ratelimit(rate):
+            # yt-dlp applies the limit to each fragment, and downloads up to
+            # `self.fragments` of them at the same time. Single file downloads
+            # read the limit again for every block, so a new share applies to
+            # the download in progress. Fragmented ones copy it when they
+            # start, and external downloaders only get it at launch.
+            if rate:
+                ydl.params['ratelimit'] = rate / self.fragments
+            else:
+                ydl.params.pop('ratelimit', None)
 
-                process_msg = '\r[download] ' + (msg_template % d) + '\033[K'
-                sys.stdout.write(process_msg)
-                sys.stdout.flush()
+        def ydl_progress_hook(d):
+            # The reporter only redraws a few times per second, whatever the
+            # number of concurrent downloads and fragments.
+            self.progress.ydl_hook(d)
+            self.renew_locks()
 
             if d['status'] == 'finished':
                 msg = '\nDownloaded %s' % d['filename']
+                self.metrics.inc('tubeup_downloaded_bytes_total',
+                                 d.get('total_bytes') or d.get('downloaded_bytes') or 0)
 
                 self.logger.debug(d)
                 self.logger.info(msg)
@@ -199,31 +518,90 @@ class TubeUp(object):
                 if self.verbose:
                     print(msg)
 
-        ydl_opts = self.generate_ydl_options(ydl_progress_hook,
-                                             cookie_file, proxy_url,
-                                             ydl_username, ydl_password,
-                                             use_download_archive)
-
-        with YoutubeDL(ydl_opts) as ydl:
+        postprocess_starts = {}
+
+        def ydl_postprocessor_hook(d):
+            key = (d['postprocessor'], get_itemname(d['info_dict']))
+            if d['status'] == 'started':
+                postprocess_starts[key] = (time.time(), time.perf_counter())
+            elif key in postprocess_starts:
+                start, counter = postprocess_starts.pop(key)
+                self.timer.record('postprocess', key[1], start,
+                                  time.perf_counter() - counter)
+
+        with self._checkout_ydl(ydl_progress_hook, ydl_postprocessor_hook,
+                                cookie_file, proxy_url,
+                                ydl_username, ydl_password,
+                                use_download_archive) as ydl:
             for url in urls:
-                if not ignore_existing_item:
-                    # Get the info dict of the url
-                    info_dict = ydl.extract_info(url, download=False)
-
-                    if info_dict.get('_type', 'video') == 'playlist':
-                        for entry in info_dict['entries']:
-                            ydl_progress_each(entry)
-                    else:
-                        ydl_progress_each(info_dict)
-                else:
-                    info_dict = ydl.extract_info(url)
-                    downloaded_files_basename.update(self.create_basenames_from_ydl_info_dict(ydl, info_dict))
+                # Get the info dict of the url without resolving the
+                # playlist entries, they are resolved one at a time and
+                # dropped once downloaded.
+                with self.timer.span('extract', url):
+                    info_dict = ydl.extract_info(url, download=False,
+                                                 process=False)
+                if info_dict is None:
+                    # `ignoreerrors` turned the extraction error into None,
+                    # raise so the url is retried, e.g. by the work queue.
+                    raise DownloadError('Could not extract %s' % url)
+
+                # Archived videos in a row, videos that are skipped for
+                # other reasons don't end a streak.
+                streak = 0
+                for entry in self.iter_video_entries(ydl, info_dict):
+                    archived = ydl_progress_each(entry)
+                    if archived:
+                        streak += 1
+                    elif archived is False:
+                        streak = 0
+                    if stop_after_existing and streak >= stop_after_existing:
+                        self.logger.info('Reached %d archived videos in a row, '
+                                         'stop listing %s' % (streak, url))
+                        break
 
         self.logger.debug(
-            'Basenames obtained from url (%s): %s'
-            % (url, downloaded_files_basename))
+            'Videos downloaded from url (%s): %s'
+            % (url, downloaded_entries))
+
+        return downloaded_entries
+
+    def iter_video_entries(self, ydl, ie_result):
+        """
+        Lazily yield the videos of an unprocessed yt-dlp extraction result.
+
+        Playlists are walked entry by entry and url results are only
+        extracted when they are reached, so a caller that stops iterating
+        also stops yt-dlp from fetching further playlist pages.
 
-        return downloaded_files_basename
+        :param ydl:        A `yt_dlp.YoutubeDL` instance.
+        :param ie_result:  A result of ``ydl.extract_info(url, process=False)``.
+        :return:           A generator of video info dicts, None for entries
+                           that could not be extracted.
+        """
+        if not ie_result:
+            yield None
+            return
+
+        result_type = ie_result.get('_type', 'video')
+        if result_type in ('playlist', 'multi_video'):
+            for entry in ie_result['entries']:
+                yield from self.iter_video_entries(ydl, entry)
+        elif result_type in ('url', 'url_transparent'):
+            if ydl.in_download_archive(ie_result):
+                # Archived videos don't need to be extracted at all.
+                yield ie_result
+                return
+            with self.timer.span('extract', ie_result['url']):
+                resolved = ydl.extract_info(ie_result['url'], download=False,
+                                            ie_key=ie_result.get('ie_key'),
+                                            process=False)
+            if resolved and result_type == 'url_transparent':
+                resolved.update(
+                    (key, value) for key, value in ie_result.items()
+                    if value is not None and key not in ('_type', 'url', 'ie_key'))
+            yield from self.iter_video_entries(ydl, resolved)
+        else:
+            yield ie_result
 
     def create_basenames_from_ydl_info_dict(self, ydl, info_dict):
         """
@@ -257,6 +635,86 @@ class TubeUp(object):
 
         return basenames
 
+    def _ydl_options_key(self, cookie_file=None, proxy_url=None,
+                         ydl_username=None, ydl_password=None,
+                         use_download_archive=False):
+        # Everything the yt-dlp options depend on.
+        return (self.dir_path['root'], self.output_template, self.verbose,
+                self.stream_upload, self.fragments, self.http_chunk_size,
+                self.downloader, cookie_file, proxy_url, ydl_username,
+                ydl_password, bool(use_download_archive))
+
+    def base_ydl_options(self, cookie_file=None, proxy_url=None,
+                         ydl_username=None, ydl_password=None,
+                         use_download_archive=False):
+        """
+        The options of `generate_ydl_options` without the progress hook.
+        They are built once per set of arguments and returned as a read-only
+        mapping shared by all callers.
+        """
+        key = self._ydl_options_key(cookie_file, proxy_url, ydl_username,
+                                    ydl_password, use_download_archive)
+        options = self._ydl_options_cache.get(key)
+        if options is None:
+            ydl_opts = {
+                'outtmpl': os.path.join(self.dir_path['downloads'],
+                                        self.output_template),
+                'restrictfilenames': True,
+                'quiet': not self.verbose,
+                'verbose': self.verbose,
+                'progress_with_newline': True,
+                'forcetitle': True,
+                'continuedl': True,
+                'retries': 9001,
+                'fragment_retries': 9001,
+                'forcejson': False,
+                'writeinfojson': True,
+                'writedescription': True,
+                'writethumbnail': True,
+                'writesubtitles': True,
+                'allsubtitles': True,
+                'ignoreerrors': True,
+                'fixup': 'detect_or_warn',
+                'nooverwrites': True,
+                'consoletitle': True,
+                'logger': self.logger,
+            }
+
+            if cookie_file is not None:
+                ydl_opts['cookiefile'] = cookie_file
+
+            if proxy_url is not None:
+                ydl_opts['proxy'] = proxy_url
+
+            if ydl_username is not None:
+                ydl_opts['username'] = ydl_username
+
+            if ydl_password is not None:
+                ydl_opts['password'] = ydl_password
+
+            if use_download_archive:
+                ydl_opts['download_archive'] = os.path.join(self.dir_path['root'],
+                                                            '.ytdlarchive')
+
+            if self.fragments > 1:
+                ydl_opts['concurrent_fragment_downloads'] = self.fragments
+
+            if self.http_chunk_size:
+                ydl_opts['http_chunk_size'] = self.http_chunk_size
+
+            if self.downloader is not None:
+                # Protocols the downloader doesn't support, e.g. HLS for
+                # aria2c, keep using the native ones.
+                ydl_opts['external_downloader'] = {'default': self.downloader}
+
+            if self.stream_upload:
+                # Only write the metadata files, `upload_ia` streams the media.
+                ydl_opts['format'] = STREAM_FORMAT
+                ydl_opts['skip_download'] = True
+
+            options = self._ydl_options_cache[key] = MappingProxyType(ydl_opts)
+        return options
+
     def generate_ydl_options(self,
                              ydl_progress_hook,
                              cookie_file=None,
@@ -284,59 +742,37 @@ class TubeUp(object):
         :return:                      A dictionary that contains options that will
                                       be used by youtube_dl.
         """
-        ydl_opts = {
-            'outtmpl': os.path.join(self.dir_path['downloads'],
-                                    self.output_template),
-            'restrictfilenames': True,
-            'quiet': not self.verbose,
-            'verbose': self.verbose,
-            'progress_with_newline': True,
-            'forcetitle': True,
-            'continuedl': True,
-            'retries': 9001,
-            'fragment_retries': 9001,
-            'forcejson': False,
-            'writeinfojson': True,
-            'writedescription': True,
-            'writethumbnail': True,
-            'writesubtitles': True,
-            'allsubtitles': True,
-            'ignoreerrors': True,
-            'fixup': 'detect_or_warn',
-            'nooverwrites': True,
-            'consoletitle': True,
-            'logger': self.logger,
-            'progress_hooks': [ydl_progress_hook]
-        }
-
-        if cookie_file is not None:
-            ydl_opts['cookiefile'] = cookie_file
-
-        if proxy_url is not None:
-            ydl_opts['proxy'] = proxy_url
-
-        if ydl_username is not None:
-            ydl_opts['username'] = ydl_username
-
-        if ydl_password is not None:
-            ydl_opts['password'] = ydl_password
+        ydl_opts = dict(self.base_ydl_options(cookie_file, proxy_url,
+                                              ydl_username, ydl_password,
+                                              use_download_archive))
+        ydl_opts['progress_hooks'] = [ydl_progress_hook]
+        return ydl_opts
 
-        if use_download_archive:
-            ydl_opts['download_archive'] = os.path.join(self.dir_path['root'],
-                                                        '.ytdlarchive')
+    def upload(self, videobasename, custom_meta=None):
+        """
+        Upload a downloaded video to the storage of this instance, archive.org
+        by default.
 
-        return ydl_opts
+        :param videobasename:  A video base name.
+        :param custom_meta:    A custom meta, merged into the item metadata.
+        :return:               A tuple containing item name and metadata.
+        """
+        return self.storage.upload(self, videobasename, custom_meta)
 
-    def upload_ia(self, videobasename, custom_meta=None):
+    def prepare_upload(self, videobasename, custom_meta=None):
         """
-        Upload video to archive.org.
+        The part of uploading a downloaded video that is the same for every
+        storage: build the item metadata, drop empty sidecar files, hash
+        every file once and link the files into `keep_local`. The checksums
+        are used to skip files that are already uploaded, as Content-MD5 of
+        the uploads and for the local manifest.
 
         :param videobasename:  A video base name.
-        :param custom_meta:    A custom meta, will be used by internetarchive
-                               library when uploading to archive.org.
-        :return:               A tuple containing item name and metadata used
-                               when uploading to archive.org and whether the item
-                               already exists.
+        :param custom_meta:    A custom meta, merged into the item metadata.
+        :return:               A tuple containing the item name, the item
+                               metadata, the yt-dlp info dict, the paths of the
+                               files to upload and a dict mapping every path to
+                               its checksums and size.
         """
         json_metadata_filepath = videobasename + '.info.json'
         with open(json_metadata_filepath, 'r', encoding='utf-8') as f:
@@ -350,8 +786,9 @@ class TubeUp(object):
                 raise Exception(msg)
 
         itemname = get_itemname(vid_meta)
-        metadata = self.create_archive_org_metadata_from_youtubedl_meta(
-            vid_meta)
+        with self.timer.span('metadata', itemname):
+            metadata = self.create_archive_org_metadata_from_youtubedl_meta(
+                vid_meta)
 
         # Delete empty description file
         description_file_path = videobasename + '.description'
@@ -373,12 +810,105 @@ class TubeUp(object):
         # video.info.json, video.srt, etc.
         files_to_upload = glob.glob(videobasename + '*')
 
+        if custom_meta:
+            metadata.update(custom_meta)
+
+        with self.timer.span('checksum', itemname):
+            checksums = checksum_files(files_to_upload, self.upload_workers)
+        for path in files_to_upload:
+            checksums[path]['size'] = os.path.getsize(path)
+
+        if self.keep_local is not None:
+            # Uploading deletes the downloaded files, that only drops one of
+            # the links.
+            keep_dir = os.path.join(os.path.expanduser(self.keep_local), itemname)
+            os.makedirs(keep_dir, exist_ok=True)
+            for path in files_to_upload:
+                link_file(path, os.path.join(keep_dir, os.path.basename(path)))
+
+        return itemname, metadata, vid_meta, files_to_upload, checksums
+
+    def finish_upload(self, itemname, paths, checksums, upload_size):
+        """
+        Write the local manifest of an uploaded item and count it.
+
+        :param itemname:     Identifier of the item.
+        :param paths:        Paths of all the files of the item, as returned
+                             by `prepare_upload`.
+        :param checksums:    Their checksums, as returned by `prepare_upload`.
+        :param upload_size:  Number of bytes that have been uploaded.
+        """
+        write_manifest(os.path.join(self.dir_path['root'], 'manifests',
+                                    itemname + '.json'),
+                       {os.path.basename(path): checksums[path] for path in paths})
+        self.metrics.inc('tubeup_uploaded_bytes_total', upload_size)
+        self.metrics.inc('tubeup_items_uploaded_total')
+
+    def upload_ia(self, videobasename, custom_meta=None):
+        """
+        Upload video to archive.org.
+
+        :param videobasename:  A video base name.
+        :param custom_meta:    A custom meta, will be used by internetarchive
+                               library when uploading to archive.org.
+        :return:               A tuple containing item name and metadata used
+                               when uploading to archive.org and whether the item
+                               already exists.
+        """
+        s3_access_key, s3_secret_key = self.get_ia_s3_keys()
+        itemname, metadata, vid_meta, all_files, checksums = self.prepare_upload(
+            videobasename, custom_meta)
+
         # Upload the item to the Internet Archive
         item = internetarchive.get_item(itemname)
 
-        if custom_meta:
-            metadata.update(custom_meta)
+        # Only upload what the item doesn't have yet, so a rerun after an
+        # interrupted upload resumes where it stopped.
+        files_to_upload = self.filter_uploaded_files(itemname, item.files,
+                                                     all_files, checksums)
+
+        upload_size = sum(os.path.getsize(path) for path in files_to_upload)
+        large_files = [path for path in files_to_upload
+                       if os.path.getsize(path) >= self.multipart_threshold]
+        media_path = '%s.%s' % (videobasename, vid_meta.get('ext'))
+        stream_media = (self.stream_upload and not os.path.exists(media_path) and
+                        vid_meta.get('protocol') in ('http', 'https') and
+                        not self.has_uploaded_media(item, os.path.basename(media_path),
+                                                    vid_meta))
+        self.progress.update(itemname, 'upload', total=upload_size)
+        try:
+            small_files = [path for path in files_to_upload
+                           if path not in large_files]
+            with self.timer.span('upload', itemname):
+                # The item is derived once, after its last upload: the last
+                # small file, or else the last multipart upload.
+                if stream_media:
+                    streamed_size = self.stream_media_to_ia(
+                        item, os.path.basename(media_path), vid_meta, metadata,
+                        s3_access_key, s3_secret_key,
+                        queue_derive=not large_files and not small_files)
+                    self.metrics.inc('tubeup_downloaded_bytes_total', streamed_size)
+                    upload_size += streamed_size
+                for index, path in enumerate(large_files):
+                    self.multipart_upload_to_ia(
+                        item, path, metadata, s3_access_key, s3_secret_key,
+                        queue_derive=not small_files and index == len(large_files) - 1)
+                    os.remove(path)
+                self.upload_files_to_ia(item, small_files, checksums, metadata,
+                                        s3_access_key, s3_secret_key)
+        except Exception:
+            self.progress.finish(itemname, 'error')
+            raise
+        self.progress.finish(itemname)
+        self.finish_upload(itemname, all_files, checksums, upload_size)
+
+        return itemname, metadata
 
+    def get_ia_s3_keys(self):
+        """
+        :return:  The IA-S3 access and secret keys from the internetarchive
+                  configuration file.
+        """
         # Parse internetarchive configuration file.
         parsed_ia_s3_config = parse_config_file(self.ia_config_path)[2]['s3']
         s3_access_key = parsed_ia_s3_config['access']
@@ -393,24 +923,195 @@ class TubeUp(object):
                 print(msg)
             raise Exception(msg)
 
-        item.upload(files_to_upload, metadata=metadata, retries=9001,
-                    request_kwargs=dict(timeout=(9001, 9001)), delete=True,
-                    verbose=self.verbose, access_key=s3_access_key,
-                    secret_key=s3_secret_key)
+        return s3_access_key, s3_secret_key
 
-        return itemname, metadata
+    def upload_files_to_ia(self, item, paths, checksums, metadata,
+                           access_key, secret_key):
+        """
+        Upload files one by one and delete the local copies once uploaded.
+        This does what `item.upload(..., delete=True)` does without hashing
+        every file twice more: the md5 from the checksum stage is sent as
+        Content-MD5, so IA-S3 still rejects corrupted uploads.
+
+        :param item:        The `internetarchive.Item` to upload to.
+        :param paths:       Paths of the files.
+        :param checksums:   A dict mapping every path to its checksums, see
+                            `tubeup.checksum.checksum_files`.
+        :param metadata:    Item metadata, used if the upload creates the item.
+        :param access_key:  IA-S3 access key.
+        :param secret_key:  IA-S3 secret key.
+        """
+        size_hint = str(sum(os.path.getsize(path) for path in paths))
+        with self.bandwidth.transfer(UPLOAD) as share:
+            def consume(size):
+                share.consume(size)
+                self.renew_locks()
+
+            for index, path in enumerate(paths):
+                # `upload_file` closes the file.
+                body = ThrottledReader(open(path, 'rb'), consume)
+                item.upload_file(body, key=os.path.basename(path),
+                                 metadata=metadata,
+                                 headers={'x-archive-size-hint': size_hint,
+                                          'Content-MD5': checksums[path]['md5']},
+                                 access_key=access_key, secret_key=secret_key,
+                                 # Derive the item once, after the last file.
+                                 queue_derive=index == len(paths) - 1,
+                                 verbose=self.verbose, retries=9001,
+                                 request_kwargs=dict(timeout=(9001, 9001)))
+                os.remove(path)
+
+    def filter_uploaded_files(self, itemname, remote_files, paths,
+                              checksums=None):
+        """
+        Compare local files against the files of the item and delete the
+        local copies of files that have already been uploaded.
+
+        :param itemname:      Identifier of the item.
+        :param remote_files:  The files of the item, as dicts with a
+                              ``name``, a ``size`` and an ``md5``, e.g.
+                              `internetarchive.Item.files`.
+        :param paths:         Paths of the local files.
+        :param checksums:     A dict mapping every path to its checksums,
+                              they are computed when missing.
+        :return:              The paths of the files that are missing from the
+                              item or differ from the uploaded ones.
+        """
+        remote_files = {f.get('name'): f for f in remote_files}
+        missing = []
+        for path in paths:
+            remote = remote_files.get(os.path.basename(path))
+            size = os.path.getsize(path)
+            if (remote is not None and str(remote.get('size')) == str(size) and
+                    remote.get('md5') == (checksums[path] if checksums else
+                                          file_checksums(path, ('md5',)))['md5']):
+                self.logger.info('%s has already been uploaded to %s. Skipping.'
+                                 % (os.path.basename(path), itemname))
+                self.metrics.inc('tubeup_upload_skipped_bytes_total', size)
+                os.remove(path)
+            else:
+                missing.append(path)
+        return missing
+
+    def has_uploaded_media(self, item, key, vid_meta):
+        """
+        Whether streamed media is already in the item. Its md5 is unknown
+        before streaming it, so the name and the size reported by the site
+        have to match.
+        """
+        size = vid_meta.get('filesize')
+        for f in item.files:
+            if f.get('name') == key and size and str(f.get('size')) == str(size):
+                self.logger.info('%s has already been uploaded to %s. Skipping.'
+                                 % (key, item.identifier))
+                self.metrics.inc('tubeup_upload_skipped_bytes_total', size)
+                return True
+        return False
+
+    def multipart_upload_dir(self, itemname):
+        return os.path.join(self.dir_path['root'], 'multipart', itemname)
+
+    def has_pending_multipart_uploads(self, itemname):
+        """
+        :return:  True if a multipart upload to the item has been interrupted.
+                  IA-S3 creates the item when the upload starts, so the item
+                  exists but is incomplete.
+        """
+        try:
+            return bool(os.listdir(self.multipart_upload_dir(itemname)))
+        except FileNotFoundError:
+            return False
+
+    def _upload_progress(self, itemname, sent, total):
+        self.progress.update(itemname, 'upload', downloaded=sent, total=total)
+        self.renew_locks()
+
+    def multipart_upload_to_ia(self, item, path, metadata,
+                               access_key, secret_key, queue_derive=False):
+        """
+        Upload a large file in parts, resuming an interrupted upload of the
+        same file.
+
+        :param item:          The `internetarchive.Item` to upload to.
+        :param path:          Path of the file.
+        :param metadata:      Item metadata, used if the upload creates the
+                              item.
+        :param access_key:    IA-S3 access key.
+        :param secret_key:    IA-S3 secret key.
+        :param queue_derive:  Queue a derive of the item once the file is
+                              uploaded.
+        :return:              Number of bytes uploaded.
+        """
+        key = os.path.basename(path)
+        total = os.path.getsize(path)
+        with self.bandwidth.transfer(UPLOAD) as share:
+            upload = MultipartUpload(item.session, item.identifier, key,
+                                     access_key, secret_key, metadata=metadata,
+                                     consume=share.consume if share.rate else None,
+                                     queue_derive=queue_derive)
+            return upload.upload_file(
+                path, self.part_size, self.upload_workers,
+                state_path=os.path.join(self.multipart_upload_dir(item.identifier),
+                                        key + '.json'),
+                progress=lambda sent: self._upload_progress(
+                    item.identifier, sent, total))
+
+    def stream_media_to_ia(self, item, key, vid_meta, metadata,
+                           access_key, secret_key, queue_derive=False):
+        """
+        Copy the media of a video from its source url into a multipart IA-S3
+        upload, holding at most one part in memory.
+
+        :param item:          The `internetarchive.Item` to upload to.
+        :param key:           Name of the media file in the item.
+        :param vid_meta:      The yt-dlp info dict of the video.
+        :param metadata:      Item metadata, used if the upload creates the
+                              item.
+        :param access_key:    IA-S3 access key.
+        :param secret_key:    IA-S3 secret key.
+        :param queue_derive:  Queue a derive of the item once the media is
+                              uploaded.
+        :return:              Number of bytes uploaded.
+        """
+        def throttled(chunks, consume):
+            for chunk in chunks:
+                consume(len(chunk))
+                yield chunk
+
+        with self.bandwidth.transfer(DOWNLOAD) as download_share, \
+                self.bandwidth.transfer(UPLOAD) as upload_share, \
+                item.session.get(vid_meta['url'], stream=True, timeout=(60, 600),
+                                 headers=vid_meta.get('http_headers')) as response:
+            response.raise_for_status()
+            upload = MultipartUpload(item.session, item.identifier, key,
+                                     access_key, secret_key, metadata=metadata,
+                                     consume=upload_share.consume
+                                     if upload_share.rate else None,
+                                     queue_derive=queue_derive)
+            total = vid_meta.get('filesize') or vid_meta.get('filesize_approx')
+            return upload.upload_stream(
+                throttled(response.iter_content(1024 * 1024),
+                          download_share.consume),
+                self.part_size,
+                progress=lambda sent: self._upload_progress(
+                    item.identifier, sent, total))
 
     def archive_urls(self, urls, custom_meta=None,
                      cookie_file=None, proxy=None,
                      ydl_username=None, ydl_password=None,
                      use_download_archive=False,
-                     ignore_existing_item=False):
+                     ignore_existing_item=False,
+                     break_on_existing=False,
+                     dateafter=None,
+                     stop_after_existing=None):
         """
         Download and upload videos from youtube_dl supported sites to
         archive.org
 
         :param urls:                  List of url that will be downloaded and uploaded
-                                      to archive.org
+                                      to archive.org. Any iterable works, urls are
+                                      consumed one at a time and each one is
+                                      uploaded before the next one is read.
         :param custom_meta:           A custom metadata that will be used when
                                       uploading the file with archive.org.
         :param cookie_file:           A cookie file for YoutubeDL.
@@ -424,15 +1125,221 @@ class TubeUp(object):
                                       the archive file. Record the IDs of all
                                       downloaded videos in it.
         :param ignore_existing_item:  Ignores the check for existing items on archive.org.
+        :param break_on_existing:     Stop listing a playlist at the first video that
+                                      is already archived.
+        :param dateafter:             Skip videos uploaded before this date.
+        :param stop_after_existing:   Stop listing a playlist after this many videos
+                                      in a row are already archived.
         :return:                      Tuple containing identifier and metadata of the
                                       file that has been uploaded to archive.org.
         """
-        downloaded_file_basenames = self.get_resource_basenames(
-            urls, cookie_file, proxy, ydl_username, ydl_password, use_download_archive,
-            ignore_existing_item)
-        for basename in downloaded_file_basenames:
-            identifier, meta = self.upload_ia(basename, custom_meta)
-            yield identifier, meta
+        self.timer.reset()
+        for url in urls:
+            try:
+                downloaded_entries = self.get_resource_entries(
+                    [url], cookie_file, proxy, ydl_username, ydl_password, use_download_archive,
+                    ignore_existing_item, break_on_existing, dateafter,
+                    stop_after_existing)
+                self.metrics.set('tubeup_upload_queue_depth',
+                                 len(downloaded_entries))
+                for entry in downloaded_entries:
+                    identifier, meta = self.upload(entry.basepath, custom_meta)
+                    entry.status = UPLOADED
+                    self.metrics.inc('tubeup_upload_queue_depth', -1)
+                    yield identifier, meta
+            finally:
+                # Items stay locked until they are uploaded, or until
+                # archiving them failed and another worker may retry.
+                while self._held_locks:
+                    self.lock.release(self._held_locks.pop())
+
+        self.logger.info('Stage timings for this run:\n%s'
+                         % self.timer.summary())
+
+    def refresh_metadata(self, urls, custom_meta=None,
+                         cookie_file=None, proxy=None,
+                         ydl_username=None, ydl_password=None,
+                         workers=4):
+        """
+        Update the metadata of items that have already been archived, without
+        downloading or uploading any media.
+
+        The videos are only extracted, their archive.org metadata is rebuilt
+        and compared against the current metadata of their items, and only
+        the fields that changed are written. Items are handled `workers` at
+        a time.
+
+        :param urls:          List of url of videos, playlists or channels.
+        :param custom_meta:   A custom metadata that will be merged into the
+                              rebuilt metadata.
+        :param cookie_file:   A cookie file for YoutubeDL.
+        :param proxy:         A proxy url for YoutubeDL.
+        :param ydl_username:  Username that will be used to extract the videos.
+        :param ydl_password:  Password of the related username.
+        :param workers:       Number of items compared and written at the
+                              same time.
+        :return:              Tuple containing the identifier of every item
+                              that has been updated and the changed fields.
+        """
+        access_key, secret_key = self.get_ia_s3_keys()
+
+        def refresh(entry):
+            itemname = get_itemname(entry)
+            with self.timer.span('metadata_refresh', itemname):
+                metadata = self.create_archive_org_metadata_from_youtubedl_meta(entry)
+                if not entry.get('upload_date'):
+                    # The date would be today's, not the video's.
+                    metadata.pop('date')
+                    metadata.pop('year')
+                if custom_meta:
+                    metadata.update(custom_meta)
+
+                item = internetarchive.get_item(itemname)
+                if not item.exists:
+                    self.logger.warning('Item "%s" does not exist. Skipping.'
+                                        % itemname)
+                    return itemname, {}
+                changes = diff_metadata(item.metadata, metadata)
+                if changes:
+                    response = item.modify_metadata(changes, access_key=access_key,
+                                                    secret_key=secret_key)
+                    response.raise_for_status()
+                    self.metrics.inc('tubeup_metadata_updates_total')
+                return itemname, changes
+
+        with self._checkout_ydl(None, None, cookie_file, proxy,
+                                ydl_username, ydl_password) as ydl, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for url in urls:
+                with self.timer.span('extract', url):
+                    info_dict = ydl.extract_info(url, download=False,
+                                                 process=False)
+                for entry in self.iter_video_entries(ydl, info_dict):
+                    if not entry:
+                        continue
+                    pending.add(pool.submit(refresh, entry))
+                    # Keep extracting while the items are compared, with a
+                    # bounded number of them in flight.
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from self._refreshed(done)
+            yield from self._refreshed(pending)
+
+    def _refreshed(self, futures):
+        for future in futures:
+            try:
+                itemname, changes = future.result()
+            except Exception:
+                self.logger.exception('Refreshing metadata failed')
+                continue
+            if changes:
+                yield itemname, changes
+
+    def watch_urls(self, urls, interval=3600, custom_meta=None,
+                   cookie_file=None, proxy=None,
+                   ydl_username=None, ydl_password=None,
+                   dateafter=None, polls=None, stop_after_existing=None):
+        """
+        Keep archiving the new uploads of channels or playlists.
+
+        Every poll lists each url from the newest video on and stops at the
+        first video that is already in the download archive or on
+        archive.org, or after `stop_after_existing` of them in a row, so
+        only new uploads are extracted and downloaded.
+
+        :param urls:          List of channel or playlist urls to poll.
+        :param interval:      Seconds between the start of two polls.
+        :param custom_meta:   A custom metadata that will be used when
+                              uploading the file with archive.org.
+        :param cookie_file:   A cookie file for YoutubeDL.
+        :param proxy:         A proxy url for YoutubeDL.
+        :param ydl_username:  Username that will be used to download the
+                              resources with youtube_dl.
+        :param ydl_password:  Password of the related username.
+        :param dateafter:     Skip videos uploaded before this date.
+        :param polls:         Number of polls to run, None polls forever.
+        :param stop_after_existing:
+                              Archived videos in a row after which listing a
+                              url stops, for channels whose order isn't
+                              strictly newest first, e.g. with pinned videos.
+        :return:              Tuple containing identifier and metadata of
+                              every item that has been uploaded.
+        """
+        poll = 0
+        while polls is None or poll < polls:
+            started = time.monotonic()
+            try:
+                yield from self.archive_urls(urls, custom_meta, cookie_file,
+                                             proxy, ydl_username, ydl_password,
+                                             use_download_archive=True,
+                                             break_on_existing=True,
+                                             dateafter=dateafter,
+                                             stop_after_existing=stop_after_existing)
+            except Exception:
+                # A failing poll must not take the watcher down, the next
+                # poll picks up whatever was missed.
+                self.logger.exception('Polling %s failed' % ', '.join(urls))
+
+            poll += 1
+            if polls is None or poll < polls:
+                time.sleep(max(0, interval - (time.monotonic() - started)))
+
+    def archive_queue(self, queue, worker_id, custom_meta=None,
+                      cookie_file=None, proxy=None,
+                      ydl_username=None, ydl_password=None,
+                      use_download_archive=False,
+                      ignore_existing_item=False,
+                      poll_interval=30, exit_when_empty=False):
+        """
+        Archive urls leased from a `tubeup.workqueue.WorkQueue` shared with
+        other workers, and report every url back as done or failed.
+
+        :param queue:            A `tubeup.workqueue.WorkQueue`.
+        :param worker_id:        Name of this worker, unique among the workers
+                                 sharing the queue.
+        :param poll_interval:    Seconds to wait before asking again when the
+                                 queue is empty.
+        :param exit_when_empty:  Return once the queue has no work left instead
+                                 of waiting for more.
+        :return:                 Tuple containing identifier and metadata of
+                                 every item that has been uploaded.
+
+        The other parameters are passed to `archive_urls`.
+        """
+        while True:
+            url = queue.lease(worker_id)
+            self.metrics.set('tubeup_work_queue_pending',
+                             queue.counts().get('pending', 0))
+            if url is None:
+                if exit_when_empty:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            identifiers = []
+            # Renewed from the download and upload progress as well.
+            self._lease = (queue, url, worker_id)
+            self._lease_lost = False
+            try:
+                for identifier, meta in self.archive_urls(
+                        [url], custom_meta, cookie_file, proxy,
+                        ydl_username, ydl_password, use_download_archive,
+                        ignore_existing_item):
+                    identifiers.append(identifier)
+                    yield identifier, meta
+                    if not self._renew_lease():
+                        # Another worker archives the url now.
+                        break
+            except Exception as exc:
+                self.logger.exception('Archiving %s failed' % url)
+                if not self._lease_lost:
+                    queue.fail(url, worker_id, repr(exc))
+            else:
+                if not self._lease_lost:
+                    queue.complete(url, worker_id, identifiers)
+            finally:
+                self._lease = None
 
     @staticmethod
     def determine_collection_type(url):
@@ -509,32 +1416,24 @@ class TubeUp(object):
 
         # load up tags into an IA compatible semicolon-separated string
         # example: Youtube;video;
-        tags_string = '%s;video;' % vid_meta['extractor_key']
+        tags = [vid_meta['extractor_key'], 'video']
 
         if 'categories' in vid_meta:
             # add categories as tags as well, if they exist
             try:
                 for category in vid_meta['categories']:
-                    tags_string += '%s;' % category
+                    tags.append(category)
             except Exception:
                 print("No categories found.")
 
         if 'tags' in vid_meta:  # some video services don't have tags
             try:
-                if 'tags' in vid_meta is None:
-                    tags_string += '%s;' % vid_meta['id']
-                    tags_string += '%s;' % 'video'
-                else:
-                    for tag in vid_meta['tags']:
-                        tags_string += '%s;' % tag
+                for tag in vid_meta['tags']:
+                    tags.append(tag)
             except Exception:
                 print("Unable to process tags successfully.")
 
-        # IA's subject field has a 255 bytes length limit, so we need to truncate tags_string
-        while len(tags_string.encode('utf-8')) > 255:
-            tags_list = tags_string.split(';')
-            tags_list.pop()
-            tags_string = ';'.join(tags_list)
+        tags_string = join_subject(tags)
 
         # license
         licenseurl = TubeUp.determine_licenseurl(vid_meta)
@@ -543,8 +1442,9 @@ class TubeUp(object):
         description_text = vid_meta.get('description', '')
         if description_text is None:
             description_text = ''
-        # archive.org does not display raw newlines
-        description = re.sub('\r?\n', '<br>', description_text)
+        # Very long descriptions are truncated, the .description file keeps
+        # the full text.
+        description = html_description(description_text)
 
         metadata = dict(
             mediatype=('audio' if collection == 'opensource_audio'
@@ -18,7 +18,49 @@
 """tubeup - Download a video with Youtube-dlc, then upload to Internet Archive, passing all metadata.
 
 Usage:
-  tubeup <url>... [--username <user>] [--password <pass>]
+  tubeup enqueue <queue> (<url>... | --batch-file <file>)
+  tubeup worker <queue> [--worker-id <id>] [--exit-when-empty]
+                        [--username <user>] [--password <pass>]
+                        [--metadata=<key:value>...]
+                        [--cookies=<filename>]
+                        [--proxy <prox>]
+                        [--quiet] [--debug]
+                        [--use-download-archive]
+                        [--output <output>]
+                        [--dir <dir>]
+                        [--ignore-existing-item]
+                        [--timings <file>]
+                        [--metrics-file <file>] [--metrics-port <port>]
+                        [--progress-json <file>]
+                        [--lock-dir <dir> | --lock-db <file>]
+                        [--stream-upload]
+                        [--part-size <MiB>] [--upload-workers <n>]
+                        [--fragments <n>] [--http-chunk-size <size>]
+                        [--downloader <name>]
+                        [--limit-download <rate>] [--limit-upload <rate>]
+                        [--upload-to <target>] [--s3-endpoint <url>]
+                        [--cache-dir <dir>] [--cache-size <size>] [--keep-local <dir>]
+  tubeup watch <url>... [--interval <seconds>] [--dateafter <date>]
+                        [--stop-after-existing <n>]
+                        [--username <user>] [--password <pass>]
+                        [--metadata=<key:value>...]
+                        [--cookies=<filename>]
+                        [--proxy <prox>]
+                        [--quiet] [--debug]
+                        [--output <output>]
+                        [--dir <dir>]
+                        [--timings <file>]
+                        [--metrics-file <file>] [--metrics-port <port>]
+                        [--progress-json <file>]
+                        [--lock-dir <dir> | --lock-db <file>]
+                        [--stream-upload]
+                        [--part-size <MiB>] [--upload-workers <n>]
+                        [--fragments <n>] [--http-chunk-size <size>]
+                        [--downloader <name>]
+                        [--limit-download <rate>] [--limit-upload <rate>]
+                        [--upload-to <target>] [--s3-endpoint <url>]
+                        [--cache-dir <dir>] [--cache-size <size>] [--keep-local <dir>]
+  tubeup (<url>... | --batch-file <file>) [--username <user>] [--password <pass>]
                   [--metadata=<key:value>...]
                   [--cookies=<filename>]
                   [--proxy <prox>]
@@ -27,6 +69,19 @@ Usage:
                   [--output <output>]
                   [--dir <dir>]
                   [--ignore-existing-item]
+                  [--dateafter <date>] [--stop-after-existing <n>]
+                  [--timings <file>]
+                  [--metrics-file <file>] [--metrics-port <port>]
+                  [--progress-json <file>]
+                  [--lock-dir <dir> | --lock-db <file>]
+                  [--stream-upload]
+                  [--part-size <MiB>] [--upload-workers <n>]
+                  [--fragments <n>] [--http-chunk-size <size>]
+                  [--downloader <name>]
+                  [--limit-download <rate>] [--limit-upload <rate>]
+                  [--upload-to <target>] [--s3-endpoint <url>]
+                  [--cache-dir <dir>] [--cache-size <size>] [--keep-local <dir>]
+                  [--refresh-metadata]
   tubeup -h | --help
   tubeup --version
 
@@ -37,6 +92,12 @@ Arguments:
   --metadata=<key:value>        Custom metadata to add to the archive.org
                                 item.
   --dir <dir>                   Provide a directory for downloads and metadata.
+  enqueue                       Add urls to the work queue database <queue>.
+  worker                        Archive urls leased from the work queue
+                                database <queue>, which can be shared by
+                                workers on several machines.
+  watch                         Keep running and poll the given channels or
+                                playlists, archiving only their new uploads.
 
 Options:
   -h --help                    Show this screen.
@@ -51,23 +112,113 @@ Options:
   -d --debug                   Print all logs to stdout.
   -o --output <output>         Youtube-dlc output template.
   -i --ignore-existing-item    Don't check if an item already exists on archive.org
+  -b --batch-file <file>       Read urls from <file>, one per line, "-" reads
+                               them from stdin. Urls are read as they are
+                               needed and duplicates are skipped.
+  --worker-id <id>             Name of this worker in the work queue
+                               [default: <hostname>-<pid>].
+  --exit-when-empty            Stop the worker once the queue is empty.
+  --interval <seconds>         Seconds between two polls in watch mode
+                               [default: 3600].
+  --dateafter <date>           Skip videos uploaded before this date, e.g.
+                               20240101 or today-2weeks.
+  --stop-after-existing <n>    Stop listing a channel or playlist after <n>
+                               videos in a row that are already archived.
+                               Channels list their newest videos first, so
+                               the rest is most likely archived too.
+  --timings <file>             Write how long each stage took for every video
+                               to <file> as JSON lines.
+  --metrics-file <file>        Keep Prometheus metrics up to date in <file>,
+                               e.g. for the node_exporter textfile collector.
+  --metrics-port <port>        Serve Prometheus metrics on 127.0.0.1:<port>.
+  --progress-json <file>       Write download and upload progress to <file>
+                               as JSON lines, for supervisors.
+  --lock-dir <dir>             Lock every item in <dir> while it is downloaded
+                               and uploaded, so workers sharing <dir> never
+                               archive the same video twice.
+  --lock-db <file>             Same as --lock-dir, with the locks kept in the
+                               SQLite database <file>. Workers lock items in
+                               their <queue> database by default.
+  --stream-upload              Experimental. Upload the media while it is
+                               downloaded instead of saving it to disk first.
+                               Only formats that are a single HTTP file are
+                               used, and --proxy is not applied to the media.
+  --part-size <MiB>            Size of the parts that streamed media and files
+                               of 1GiB or more are uploaded in. Interrupted
+                               uploads of such files resume from the last
+                               uploaded part [default: 32].
+  --upload-workers <n>         Number of parts uploaded, or of items refreshed
+                               by --refresh-metadata, at the same time
+                               [default: 4].
+  --fragments <n>              Number of fragments of HLS and DASH videos
+                               downloaded at the same time [default: 1].
+  --http-chunk-size <size>     Download videos in requests of <size> bytes,
+                               e.g. 10M, for sites that throttle long
+                               downloads.
+  --downloader <name>          External downloader for the protocols it
+                               supports, e.g. aria2c to download single
+                               files over several connections.
+  --limit-download <rate>      Download at most <rate> bytes per second, e.g.
+                               5M, split evenly between the videos that are
+                               downloaded at the same time.
+  --limit-upload <rate>        Same as --limit-download, for uploads.
+  --upload-to <target>         Where items are uploaded: ia for archive.org,
+                               a local directory to stage them in, given as
+                               an absolute or ./ path or a file:// url, or
+                               s3://<bucket> for a bucket of an S3-compatible
+                               store at --s3-endpoint, with the credentials
+                               and region in AWS_ACCESS_KEY_ID,
+                               AWS_SECRET_ACCESS_KEY and AWS_DEFAULT_REGION
+                               [default: ia].
+  --s3-endpoint <url>          Url of the S3-compatible store, e.g.
+                               http://localhost:9000 for MinIO.
+  --cache-dir <dir>            Keep downloaded media in <dir>, by extractor,
+                               video id and format, and reuse it instead of
+                               downloading the same media again. Files are
+                               hard links when <dir> is on the same file
+                               system as the downloads.
+  --cache-size <size>          Size of the media cache, the least recently
+                               used files are removed beyond it [default: 50G].
+  --keep-local <dir>           Keep the files of every item in <dir>/<item>,
+                               linked there before they are uploaded, so they
+                               stay there if the upload fails. They are hard
+                               links, or clones on copy-on-write file systems,
+                               to the downloaded files, so no data is copied
+                               when <dir> is on the same file system.
+                               Streamed media isn't kept.
+  --refresh-metadata           Don't download or upload any media, only update
+                               the metadata of already archived items whose
+                               title, description, tags, ... have changed.
 """
 
 import sys
+import math
 import docopt
 import logging
 import traceback
 
-from tubeup.utils import key_value_to_dict
-from tubeup.TubeUp import TubeUp
+from contextlib import ExitStack
+
+from tubeup.utils import key_value_to_dict, iter_batch_urls, dedup_urls
+from tubeup.timing import json_lines_hook
+from tubeup.workqueue import WorkQueue, default_worker_id
+from tubeup.locks import FileLockBackend, SQLiteLockBackend
+from tubeup.bandwidth import BandwidthManager
 from tubeup import __version__
 
 
 def main():
+    # Files opened for the run are closed when it ends, however it ends.
+    with ExitStack() as files:
+        _main(files)
+
+
+def _main(files):
     # Parse arguments from file docstring
     args = docopt.docopt(__doc__, version=__version__)
 
     URLs = args['<url>']
+    batch_file = args['--batch-file']
     cookie_file = args['--cookies']
     proxy_url = args['--proxy']
     username = args['--username']
@@ -77,6 +228,25 @@ def main():
     use_download_archive = args['--use-download-archive']
     ignore_existing_item = args['--ignore-existing-item']
     dir_path = args['--dir'] or '~/.tubeup'
+    timings_path = args['--timings']
+    metrics_path = args['--metrics-file']
+    metrics_port = args['--metrics-port']
+    progress_json_path = args['--progress-json']
+    dateafter = args['--dateafter']
+
+    numbers = {}
+    for option, parse in (('--stop-after-existing', int),
+                          ('--upload-workers', int), ('--fragments', int),
+                          ('--interval', float)):
+        numbers[option] = None
+        if args[option]:
+            try:
+                numbers[option] = parse(args[option])
+            except ValueError:
+                pass
+            if not (numbers[option] and 0 < numbers[option] < math.inf):
+                sys.exit('Invalid %s: %s' % (option, args[option]))
+    stop_after_existing = numbers['--stop-after-existing']
 
     if debug_mode:
         # Display log messages.
@@ -91,12 +261,79 @@ def main():
         ch.setFormatter(formatter)
         root.addHandler(ch)
 
+    if batch_file == '-':
+        URLs = dedup_urls(iter_batch_urls(sys.stdin))
+    elif batch_file:
+        URLs = dedup_urls(iter_batch_urls(
+            files.enter_context(open(batch_file, encoding='utf-8'))))
+
+    if args['enqueue']:
+        added = WorkQueue(args['<queue>']).enqueue(URLs)
+        print(':: Added %d urls to %s' % (added, args['<queue>']))
+        return
+
     metadata = key_value_to_dict(args['--metadata'])
 
+    # yt-dlp and internetarchive take a long time to import, so only pay
+    # for them once the arguments are known to be valid and --help or
+    # --version have been handled.
+    from tubeup.TubeUp import TubeUp
+    from tubeup.storage import IAStorage, open_storage
+    from tubeup.cache import MediaCache
+    from yt_dlp.utils import parse_bytes
+
+    worker_id = args['--worker-id']
+    if worker_id == '<hostname>-<pid>':
+        worker_id = default_worker_id()
+
+    sizes = {}
+    for option in ('--http-chunk-size', '--limit-download', '--limit-upload',
+                   '--cache-size'):
+        sizes[option] = None
+        if args[option]:
+            sizes[option] = parse_bytes(args[option])
+            if sizes[option] is None:
+                sys.exit('Invalid %s: %s' % (option, args[option]))
+
+    try:
+        storage = open_storage(args['--upload-to'], args['--s3-endpoint'],
+                               numbers['--upload-workers'],
+                               int(float(args['--part-size']) * 1024 * 1024))
+    except ValueError as exc:
+        sys.exit(str(exc))
+    if args['--refresh-metadata'] and not isinstance(storage, IAStorage):
+        sys.exit('--refresh-metadata only works with archive.org items.')
+    if args['--stream-upload'] and not isinstance(storage, IAStorage):
+        sys.exit('--stream-upload only works with archive.org.')
+
+    cache = None
+    if args['--cache-dir']:
+        cache = MediaCache(args['--cache-dir'], sizes['--cache-size'])
+
+    if args['--lock-dir']:
+        lock = FileLockBackend(args['--lock-dir'], worker_id)
+    elif args['--lock-db'] or args['worker']:
+        lock = SQLiteLockBackend(args['--lock-db'] or args['<queue>'],
+                                 worker_id)
+    else:
+        lock = None
+
     try:
         tu = TubeUp(verbose=not quiet_mode,
                     dir_path=dir_path,
-                    output_template=args['--output'])
+                    output_template=args['--output'],
+                    lock=lock,
+                    stream_upload=args['--stream-upload'],
+                    part_size=int(float(args['--part-size']) * 1024 * 1024),
+                    upload_workers=numbers['--upload-workers'],
+                    fragments=numbers['--fragments'],
+                    http_chunk_size=sizes['--http-chunk-size'],
+                    downloader=args['--downloader'],
+                    bandwidth=BandwidthManager(sizes['--limit-download'],
+                                               sizes['--limit-upload']),
+                    storage=storage,
+                    cache=cache,
+                    keep_local=args['--keep-local'])
     except TubeUp.DirError as exc:
         print('\n\033[91m'
               'Cannot use download directory: %s\n'
@@ -105,15 +342,68 @@ def main():
               % (dir_path, exc))
         sys.exit(1)
 
+    if timings_path:
+        timings_file = files.enter_context(
+            open(timings_path, 'a', encoding='utf-8'))
+        tu.timer.add_hook(json_lines_hook(timings_file))
+
+    if metrics_port:
+        tu.metrics.serve(int(metrics_port))
+
+    if progress_json_path:
+        tu.progress.json_stream = files.enter_context(
+            open(progress_json_path, 'a', encoding='utf-8'))
+
+    if args['worker']:
+        results = tu.archive_queue(WorkQueue(args['<queue>']), worker_id,
+                                   metadata, cookie_file, proxy_url,
+                                   username, password,
+                                   use_download_archive,
+                                   ignore_existing_item,
+                                   exit_when_empty=args['--exit-when-empty'])
+    elif args['watch']:
+        results = tu.watch_urls(URLs, numbers['--interval'], metadata,
+                                cookie_file, proxy_url,
+                                username, password, dateafter,
+                                stop_after_existing=stop_after_existing)
+    elif args['--refresh-metadata']:
+        results = tu.refresh_metadata(URLs, metadata,
+                                      cookie_file, proxy_url,
+                                      username, password,
+                                      numbers['--upload-workers'])
+    else:
+        results = tu.archive_urls(URLs, metadata,
+                                  cookie_file, proxy_url,
+                                  username, password,
+                                  use_download_archive,
+                                  ignore_existing_item,
+                                  dateafter=dateafter,
+                                  stop_after_existing=stop_after_existing)
+
     try:
-        for identifier, meta in tu.archive_urls(URLs, metadata,
-                                                cookie_file, proxy_url,
-                                                username, password,
-                                                use_download_archive,
-                                                ignore_existing_item):
-            print('\n:: Upload Finished. Item information:')
-            print('Title: %s' % meta['title'])
-            print('Item URL: https://archive.org/details/%s\n' % identifier)
+        for identifier, meta in results:
+            if args['--refresh-metadata']:
+                print('\n:: Metadata Updated. Changed fields: %s'
+                      % ', '.join(sorted(meta)))
+            else:
+                print('\n:: Upload Finished. Item information:')
+                print('Title: %s' % meta['title'])
+            if isinstance(storage, IAStorage):
+                print('Item URL: https://archive.org/details/%s\n' % identifier)
+            else:
+                print('Item: %s\n' % identifier)
+            if metrics_path:
+                tu.metrics.write_textfile(metrics_path)
+
+        if metrics_path:
+            tu.metrics.write_textfile(metrics_path)
+
+        if not quiet_mode:
+            print(':: Stage timings:')
+            print(tu.timer.summary())
+    except KeyboardInterrupt:
+        print('\n:: Interrupted, exiting.')
+        sys.exit(130)
     except Exception:
         print('\n\033[91m'  # Start red color text
               'An exception just occured, if you found this '
@@ -0,0 +1,112 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+DOWNLOAD = 'download'
+UPLOAD = 'upload'
+
+
+class Share(object):
+    """
+    The part of a bandwidth budget given to one transfer. Its rate changes
+    as other transfers start and finish.
+    """
+    def __init__(self, on_change=None):
+        self.rate = None
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._allowance = 0.0
+        self._last = time.monotonic()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        if self.on_change is not None:
+            self.on_change(rate)
+
+    def consume(self, size):
+        """
+        Account for `size` bytes, sleeping long enough to keep the transfer
+        under its rate. Bursts of up to one second worth of bytes are let
+        through, and several threads can share the same share.
+        """
+        rate = self.rate
+        if not rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(rate, self._allowance + (now - self._last) * rate)
+            self._last = now
+            self._allowance -= size
+            wait = -self._allowance / rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BandwidthManager(object):
+    """
+    Separate download and upload budgets, each split evenly between the
+    transfers running at the same time. One manager is shared by all the
+    `TubeUp` instances of a process, so concurrent workers get a fair part
+    of the link and downloads can't starve uploads or the other way round.
+    """
+    def __init__(self, download_rate=None, upload_rate=None):
+        """
+        :param download_rate:  Bytes per second for all downloads, None for
+                               no limit.
+        :param upload_rate:    Bytes per second for all uploads, None for no
+                               limit.
+        """
+        self.rates = {DOWNLOAD: download_rate, UPLOAD: upload_rate}
+        self._shares = {DOWNLOAD: [], UPLOAD: []}
+        self._lock = threading.Lock()
+
+    def _rebalance(self, direction):
+        shares = self._shares[direction]
+        rate = self.rates[direction]
+        for share in shares:
+            share.set_rate(rate / len(shares) if rate else None)
+
+    @contextmanager
+    def transfer(self, direction, on_change=None):
+        """
+        Register a transfer for as long as the context is active.
+
+        :param direction:  `DOWNLOAD` or `UPLOAD`.
+        :param on_change:  Function called with the new rate of the transfer,
+                           in bytes per second or None, whenever it changes.
+                           It is called with None once the transfer is over.
+        :return:           The `Share` of the transfer.
+        """
+        share = Share(on_change)
+        with self._lock:
+            self._shares[direction].append(share)
+            self._rebalance(direction)
+        try:
+            yield share
+        finally:
+            with self._lock:
+                self._shares[direction].remove(share)
+                self._rebalance(direction)
+            # Lets `on_change` undo what it did.
+            share.set_rate(None)
+
+
+class ThrottledReader(object):
+    """
+    Wrap a file object so reading it is paced by `consume`, e.g.
+    `Share.consume`. Everything but `read` is passed to the file.
+    """
+    def __init__(self, f, consume):
+        self._file = f
+        self._consume = consume
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if data:
+            self._consume(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
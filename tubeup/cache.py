@@ -0,0 +1,161 @@
+import os
+import time
+import hashlib
+import threading
+
+from logging import getLogger
+
+from yt_dlp.postprocessor.common import PostProcessor
+
+from .utils import link_file
+
+
+class MediaCache(object):
+    """
+    Media files kept across runs, keyed by extractor, video id and format
+    id, so a video whose upload failed after its files were cleaned up, or
+    that is archived again, is not downloaded again.
+
+    Files are hard links to the downloaded media, so caching them costs no
+    copy as long as the cache is on the same file system as the downloads.
+    The least recently used files are evicted once the cache holds more than
+    `max_bytes`. The cache can be shared by several processes.
+
+    Uses are tracked with the access time of the files. Their modification
+    time is left alone, it is shared with the downloaded file and resuming
+    its multipart upload relies on it.
+    """
+    def __init__(self, directory, max_bytes):
+        """
+        :param directory:  Directory of the cache, created if missing.
+        :param max_bytes:  Total size of the cached files in bytes.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.logger = getLogger(__name__)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(info_dict):
+        """
+        :return:  The cache key of the media of a yt-dlp info dict, None if
+                  it can't be cached.
+        """
+        parts = (info_dict.get('extractor_key') or info_dict.get('extractor'),
+                 info_dict.get('id'), info_dict.get('format_id'))
+        if not all(parts):
+            return None
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def fetch(self, info_dict, destination):
+        """
+        Link the cached media of `info_dict` to `destination`.
+
+        :return:  The size of the media, None if it isn't cached.
+        """
+        key = self.key(info_dict)
+        if key is None:
+            return None
+        path = self.path(key)
+        try:
+            link_file(path, destination)
+            _mark_used(path)
+        except FileNotFoundError:
+            # Not cached, or evicted by another process meanwhile.
+            return None
+        return os.path.getsize(destination)
+
+    def store(self, info_dict, source):
+        """
+        Add the downloaded media of `info_dict`, then evict files if the cache
+        is over its size.
+        """
+        key = self.key(info_dict)
+        if key is None or not os.path.isfile(source):
+            return
+        path = self.path(key)
+        if os.path.exists(path) and os.path.samefile(path, source):
+            _mark_used(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        link_file(source, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache fits in
+        `max_bytes`.
+        """
+        with self._lock:
+            files = []
+            for root, dirs, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith('.tmp'):
+                        # Being linked by `link_file`.
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_atime, stat.st_size, path))
+            total = sum(size for atime, size, path in files)
+            for atime, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.logger.debug('Evicted %s from the media cache' % path)
+
+    def add_to(self, ydl, metrics=None):
+        """
+        Register the post processors that look media up before it is
+        downloaded and cache it once it is, on a `YoutubeDL`.
+
+        :param metrics:  A `tubeup.metrics.Metrics` to count the hits in.
+        """
+        ydl.add_post_processor(_CacheLookupPP(self, metrics, ydl),
+                               when='before_dl')
+        ydl.add_post_processor(_CacheStorePP(self, ydl), when='after_move')
+
+
+def _mark_used(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+
+class _CacheLookupPP(PostProcessor):
+    # yt-dlp doesn't download media whose file already exists.
+    def __init__(self, cache, metrics, downloader=None):
+        super().__init__(downloader)
+        self.cache = cache
+        self.metrics = metrics
+
+    def run(self, info):
+        destination = self._downloader.prepare_filename(info)
+        if not os.path.exists(destination):
+            size = self.cache.fetch(info, destination)
+            if size is not None:
+                self.to_screen('Linked %s from the media cache' % destination)
+                if self.metrics is not None:
+                    self.metrics.inc('tubeup_cache_hits_total')
+                    self.metrics.inc('tubeup_cache_hit_bytes_total', size)
+        return [], info
+
+
+class _CacheStorePP(PostProcessor):
+    def __init__(self, cache, downloader=None):
+        super().__init__(downloader)
+        self.cache = cache
+
+    def run(self, info):
+        if info.get('filepath'):
+            self.cache.store(info, info['filepath'])
+        return [], info
@@ -0,0 +1,82 @@
+import os
+import mmap
+import json
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+ALGORITHMS = ('md5', 'sha1')
+
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def file_checksums(path, algorithms=ALGORITHMS, buffer_size=BUFFER_SIZE,
+                   use_mmap=True):
+    """
+    Compute several checksums of a file in a single pass over its bytes.
+
+    :param path:         Path of the file.
+    :param algorithms:   Names of `hashlib` algorithms.
+    :param buffer_size:  Number of bytes handed to the hashes at once.
+    :param use_mmap:     Map the file into memory instead of reading it into
+                         a buffer, which saves copying every byte.
+    :return:             A dict mapping every algorithm to its hex digest.
+    """
+    hashes = [hashlib.new(name) for name in algorithms]
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, buffer_size):
+                        chunk = view[offset:offset + buffer_size]
+                        for h in hashes:
+                            h.update(chunk)
+                        chunk.release()
+                finally:
+                    view.release()
+        else:
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while True:
+                length = f.readinto(buffer)
+                if not length:
+                    break
+                for h in hashes:
+                    h.update(view[:length])
+    return {name: h.hexdigest() for name, h in zip(algorithms, hashes)}
+
+
+def checksum_files(paths, workers=4, **kwargs):
+    """
+    Compute the checksums of several files in a thread pool. `hashlib`
+    releases the GIL while hashing large buffers, so the files are hashed
+    in parallel.
+
+    :param paths:    Paths of the files.
+    :param workers:  Number of files hashed at the same time.
+    :param kwargs:   Passed to `file_checksums`.
+    :return:         A dict mapping every path to its checksums.
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(lambda path: file_checksums(path, **kwargs), paths)
+        return dict(zip(paths, results))
+
+
+def write_manifest(manifest_path, files):
+    """
+    Write a JSON manifest of files to `manifest_path`.
+
+    :param manifest_path:  Path of the manifest, its directory is created
+                           if needed.
+    :param files:          A dict mapping every file name to a dict with its
+                           size and checksums.
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (manifest_path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(files, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
@@ -0,0 +1,66 @@
+import os
+import sys
+
+from .utils import get_itemname
+
+
+DOWNLOADED = 'downloaded'
+UPLOADED = 'uploaded'
+
+
+class VideoEntry(object):
+    """
+    What the pipeline keeps about one downloaded video between downloading
+    and uploading it. Channels can have hundreds of thousands of videos, so
+    this replaces the yt-dlp info dict, which is read back from the
+    ``.info.json`` file next to the media when the video is uploaded.
+    """
+    __slots__ = ('id', 'extractor', 'itemname', 'directory', 'basename',
+                 'status', 'size')
+
+    def __init__(self, id, extractor, itemname, directory, basename,
+                 status=DOWNLOADED, size=None):
+        """
+        :param id:         Id of the video.
+        :param extractor:  Name of the yt-dlp extractor.
+        :param itemname:   Identifier of the archive.org item.
+        :param directory:  Directory the files of the video are in, usually
+                           the same string object for every entry.
+        :param basename:   Path of the files of the video without extension,
+                           relative to `directory`.
+        :param status:     `DOWNLOADED` or `UPLOADED`.
+        :param size:       Size of the media in bytes, None if unknown.
+        """
+        self.id = id
+        self.extractor = extractor
+        self.itemname = itemname
+        self.directory = directory
+        self.basename = basename
+        self.status = status
+        self.size = size
+
+    @classmethod
+    def from_info_dict(cls, info_dict, directory, basepath, size=None):
+        """
+        :param info_dict:  The yt-dlp info dict of the video.
+        :param directory:  Directory the files of the video are in.
+        :param basepath:   Path of the files of the video without extension.
+        :param size:       Size of the media in bytes, None if unknown.
+        """
+        extractor = info_dict.get('extractor')
+        return cls(info_dict.get('id'),
+                   # There are only a few extractors.
+                   sys.intern(extractor) if extractor else extractor,
+                   get_itemname(info_dict), directory,
+                   os.path.relpath(basepath, directory), size=size)
+
+    @property
+    def basepath(self):
+        """
+        The path of the files of the video without extension, as taken by
+        `TubeUp.upload_ia`.
+        """
+        return os.path.join(self.directory, self.basename)
+
+    def __repr__(self):
+        return '<VideoEntry %s %s>' % (self.itemname, self.status)
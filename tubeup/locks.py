@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .workqueue import default_worker_id
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where takeovers aren't serialized.
+    fcntl = None
+
+
+class FileLockBackend(object):
+    """
+    Identifier locks stored as one file per identifier in a directory, for
+    workers that run on the same machine or share a filesystem.
+    """
+    def __init__(self, directory, owner=None, ttl=6 * 3600):
+        """
+        :param directory:  Directory holding the lock files, created if needed.
+        :param owner:      Name of the worker taking the locks, defaults to
+                           ``<hostname>-<pid>``.
+        :param ttl:        Seconds after which a lock that has not been
+                           released or renewed is considered abandoned.
+                           `TubeUp` renews the locks it holds every minute
+                           while it downloads and uploads.
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.owner = owner or default_worker_id()
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.lock')
+
+    def _read(self, key):
+        """
+        :return:  The owner and the expiry time of the lock, None if there is
+                  no lock. A lock that can't be parsed expires `ttl` seconds
+                  after it was last written.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lock = json.load(f)
+            return lock.get('owner'), lock.get('expires', 0)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, AttributeError):
+            try:
+                return None, os.path.getmtime(path) + self.ttl
+            except FileNotFoundError:
+                return None
+
+    def _write(self, key, replace=False):
+        # Lock files are written aside and linked into place, so they are
+        # never seen half written. Linking fails if the lock exists.
+        path = self._path(key)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'owner': self.owner,
+                       'expires': time.time() + self.ttl}, f)
+        try:
+            if replace:
+                os.replace(tmp_path, path)
+            else:
+                os.link(tmp_path, path)
+        finally:
+            if not replace:
+                os.remove(tmp_path)
+
+    @contextmanager
+    def _guard(self):
+        # Serializes taking over, renewing and releasing locks, which all
+        # read a lock before changing it.
+        with open(os.path.join(self.directory, '.guard'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def acquire(self, key):
+        """
+        :return:  True if the lock has been taken, False if another worker
+                  holds it.
+        """
+        try:
+            self._write(key)
+            return True
+        except FileExistsError:
+            pass
+        with self._guard():
+            lock = self._read(key)
+            if lock is not None:
+                owner, expires = lock
+                if owner == self.owner:
+                    return True
+                if expires >= time.time():
+                    return False
+                # Abandoned by a worker that died.
+                os.remove(self._path(key))
+            try:
+                self._write(key)
+                return True
+            except FileExistsError:
+                return False
+
+    def renew(self, key):
+        """
+        Extend the lock by `ttl` seconds from now.
+
+        :return:  False if the lock isn't ours anymore.
+        """
+        with self._guard():
+            lock = self._read(key)
+            if lock is None or lock[0] != self.owner:
+                return False
+            self._write(key, replace=True)
+            return True
+
+    def release(self, key):
+        with self._guard():
+            lock = self._read(key)
+            if lock is not None and lock[0] == self.owner:
+                os.remove(self._path(key))
+
+
+class SQLiteLockBackend(object):
+    """
+    Identifier locks stored in a SQLite database, which can be the work
+    queue database shared by the workers.
+    """
+    def __init__(self, path, owner=None, ttl=6 * 3600, timeout=60):
+        """
+        :param path:     Path of the SQLite database, created if needed.
+        :param owner:    Name of the worker taking the locks, defaults to
+                         ``<hostname>-<pid>``.
+        :param ttl:      Seconds after which a lock that has not been
+                         released or renewed is considered abandoned.
+        :param timeout:  Seconds to wait for another worker's write
+                         transaction to finish.
+        """
+        self.path = path
+        self.owner = owner or default_worker_id()
+        self.ttl = ttl
+        # Locks are renewed from the threads uploading parts, the lock keeps
+        # them from using the connection at the same time.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._execute('CREATE TABLE IF NOT EXISTS locks ('
+                      ' key TEXT PRIMARY KEY,'
+                      ' owner TEXT NOT NULL,'
+                      ' expires REAL NOT NULL)')
+
+    def close(self):
+        self._db.close()
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._db.execute(sql, parameters)
+
+    def acquire(self, key):
+        """
+        :return:  True if the lock has been taken, False if another worker
+                  holds it.
+        """
+        now = time.time()
+        # A single upsert is atomic, the row is only taken over when its
+        # lock has expired or already belongs to us.
+        return self._execute(
+            'INSERT INTO locks (key, owner, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, '
+            'expires = excluded.expires '
+            'WHERE locks.expires < ? OR locks.owner = excluded.owner',
+            (key, self.owner, now + self.ttl, now)).rowcount == 1
+
+    def renew(self, key):
+        """
+        Extend the lock by `ttl` seconds from now.
+
+        :return:  False if the lock isn't ours anymore.
+        """
+        return self._execute(
+            'UPDATE locks SET expires = ? WHERE key = ? AND owner = ?',
+            (time.time() + self.ttl, key, self.owner)).rowcount == 1
+
+    def release(self, key):
+        self._execute('DELETE FROM locks WHERE key = ? AND owner = ?',
+                      (key, self.owner))
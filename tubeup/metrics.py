@@ -0,0 +1,152 @@
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds, in seconds, of the stage latency histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+
+METRIC_HELP = {
+    'tubeup_downloaded_bytes_total': ('counter', 'Bytes downloaded by yt-dlp.'),
+    'tubeup_uploaded_bytes_total': ('counter', 'Bytes uploaded to archive.org.'),
+    'tubeup_items_uploaded_total': ('counter', 'Items uploaded to archive.org.'),
+    'tubeup_upload_skipped_bytes_total': ('counter',
+                                          'Bytes not uploaded because the item already '
+                                          'had identical files.'),
+    'tubeup_cache_hits_total': ('counter',
+                                'Videos whose media was linked from the media cache.'),
+    'tubeup_cache_hit_bytes_total': ('counter',
+                                     'Bytes linked from the media cache instead of '
+                                     'downloaded.'),
+    'tubeup_items_skipped_total': ('counter',
+                                   'Videos skipped because they were already archived.'),
+    'tubeup_metadata_updates_total': ('counter',
+                                      'Items whose metadata has been refreshed.'),
+    'tubeup_upload_queue_depth': ('gauge', 'Downloaded videos waiting to be uploaded.'),
+    'tubeup_work_queue_pending': ('gauge', 'Urls waiting in the shared work queue.'),
+    'tubeup_stage_duration_seconds': ('histogram',
+                                      'Time spent in each pipeline stage.'),
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels)
+
+
+class Metrics(object):
+    """
+    A small thread-safe registry of counters, gauges and histograms that can
+    be rendered in the Prometheus text exposition format.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, name, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, total, count = self._histograms.get(
+                key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound)
+                      for c, bound in zip(counts, self.buckets)]
+            self._histograms[key] = (counts, total + value, count + 1)
+
+    def observe_span(self, span):
+        """
+        `StageTimer` hook that feeds the stage latency histogram.
+        """
+        self.observe('tubeup_stage_duration_seconds', span['duration'],
+                     stage=span['stage'])
+
+    def render(self):
+        """
+        :return:  All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described and name in METRIC_HELP:
+                metric_type, help_text = METRIC_HELP[name]
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s %s' % (name, metric_type))
+            described.add(name)
+
+        for (name, labels), value in values:
+            describe(name)
+            lines.append('%s%s %s' % (name, _format_labels(labels), value))
+
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('%s_bucket%s %d' % (
+                    name, _format_labels(labels + (('le', bound),)),
+                    bucket_count))
+            lines.append('%s_bucket%s %d' % (
+                name, _format_labels(labels + (('le', '+Inf'),)), count))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels), total))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        Atomically write the metrics to `path`, e.g. for the node_exporter
+        textfile collector.
+        """
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve the metrics over HTTP from a daemon thread.
+
+        :param port:  Port to listen on, 0 picks a free one.
+        :param host:  Address to bind to.
+        :return:      The running `ThreadingHTTPServer`.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
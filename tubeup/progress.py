@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+
+
+def format_bytes(num):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num) < 1024:
+            return '%.2f%s' % (num, unit)
+        num /= 1024
+    return '%.2fTiB' % num
+
+
+class ProgressReporter(object):
+    """
+    Aggregate progress of any number of concurrent downloads and uploads.
+
+    Updates only touch an in-memory table; the status line and the JSON
+    snapshot are written at most once every `interval` seconds, so progress
+    reporting costs a handful of writes per second no matter how many
+    fragments yt-dlp reports.
+    """
+    def __init__(self, stream=None, json_stream=None, interval=0.5):
+        """
+        :param stream:       Text stream the status line is drawn on, e.g.
+                             `sys.stdout`. None disables the status line.
+        :param json_stream:  Text stream that receives one JSON document per
+                             line with a snapshot of every transfer and an
+                             event for each finished one.
+        :param interval:     Minimum number of seconds between two redraws.
+        """
+        self.stream = stream
+        self.json_stream = json_stream
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}
+        self._last_draw = None
+
+    def update(self, key, kind='download', downloaded=0, total=None,
+               speed=None, eta=None):
+        """
+        Record the state of one transfer.
+
+        :param key:         Name of the transfer, e.g. a filename.
+        :param kind:        ``download`` or ``upload``.
+        :param downloaded:  Bytes transferred so far.
+        :param total:       Expected size in bytes, if known.
+        :param speed:       Current speed in bytes per second, if known.
+        :param eta:         Estimated seconds left, if known.
+        """
+        with self._lock:
+            self._active[key] = {
+                'kind': kind,
+                'bytes': downloaded or 0,
+                'total': total,
+                'speed': speed,
+                'eta': eta,
+            }
+        self._maybe_draw()
+
+    def finish(self, key, status='finished'):
+        with self._lock:
+            state = self._active.pop(key, None)
+        if state is not None:
+            self._emit(dict(state, event=status, key=key))
+        self._maybe_draw(force=True)
+
+    def ydl_hook(self, d):
+        """
+        yt-dlp progress hook that feeds the reporter.
+        """
+        if d['status'] == 'downloading':
+            self.update(d.get('filename'), 'download',
+                        d.get('downloaded_bytes'),
+                        d.get('total_bytes') or d.get('total_bytes_estimate'),
+                        d.get('speed'), d.get('eta'))
+        elif d['status'] in ('finished', 'error'):
+            self.finish(d.get('filename'), d['status'])
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(state) for key, state in self._active.items()}
+
+    def status_line(self, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        parts = []
+        for kind in ('download', 'upload'):
+            states = [s for s in snapshot.values() if s['kind'] == kind]
+            if not states:
+                continue
+            done = sum(s['bytes'] for s in states)
+            total = sum(s['total'] or 0 for s in states)
+            speed = sum(s['speed'] or 0 for s in states)
+            etas = [s['eta'] for s in states if s['eta'] is not None]
+            part = '[%s] %d active %s' % (kind, len(states), format_bytes(done))
+            if total:
+                part += ' of %s (%.1f%%)' % (format_bytes(total),
+                                             100.0 * done / total)
+            if speed:
+                part += ' at %s/s' % format_bytes(speed)
+            if etas:
+                part += ' ETA %ds' % max(etas)
+            parts.append(part)
+        return ' '.join(parts)
+
+    def _maybe_draw(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if (not force and self._last_draw is not None and
+                    now - self._last_draw < self.interval):
+                return
+            self._last_draw = now
+
+        snapshot = self.snapshot()
+        if self.stream is not None:
+            self.stream.write('\r' + self.status_line(snapshot) + '\033[K')
+            self.stream.flush()
+        self._emit({'event': 'progress', 'transfers': snapshot})
+
+    def _emit(self, document):
+        if self.json_stream is None:
+            return
+        document['time'] = time.time()
+        line = json.dumps(document) + '\n'
+        with self._lock:
+            self.json_stream.write(line)
+            self.json_stream.flush()
@@ -0,0 +1,389 @@
+import io
+import os
+import hmac
+import json
+import time
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import quote, parse_qsl, urlsplit
+
+from requests import Request
+from requests.auth import AuthBase
+from requests.exceptions import HTTPError, RequestException
+from internetarchive.iarequest import S3Request
+
+from .bandwidth import ThrottledReader
+
+
+S3_ENDPOINT = 'https://s3.us.archive.org'
+
+# S3 rejects parts smaller than 5MiB, except for the last one. The part
+# size is also the amount of media held in memory by each part upload.
+DEFAULT_PART_SIZE = 32 * 1024 * 1024
+
+# Files from this size on are uploaded in parts by `upload_ia`.
+MULTIPART_THRESHOLD = 1024 * 1024 * 1024
+
+
+def _is_retryable(exc):
+    response = getattr(exc, 'response', None)
+    return (response is None or response.status_code >= 500 or
+            response.status_code == 429)
+
+
+def send_request(session, request, retries=10, timeout=(60, 600)):
+    """
+    Send a request, retrying connection errors and server errors with an
+    exponential backoff. File bodies are rewound before every attempt.
+
+    :param session:  A `requests.Session`.
+    :param request:  A `requests.Request`, prepared again for every attempt
+                     so it can be signed again.
+    :param retries:  How often the request is retried.
+    :param timeout:  Timeout of every attempt.
+    :return:         The `requests.Response`.
+    """
+    attempt = 0
+    while True:
+        if hasattr(request.data, 'seek'):
+            request.data.seek(0)
+        try:
+            response = session.send(request.prepare(), timeout=timeout)
+            response.raise_for_status()
+            return response
+        except RequestException as exc:
+            if attempt >= retries or not _is_retryable(exc):
+                raise
+        time.sleep(min(2 ** attempt, 60))
+        attempt += 1
+
+
+class SigV4Auth(AuthBase):
+    """
+    AWS Signature Version 4 for S3-compatible stores, e.g. MinIO. Bodies
+    are not hashed, their integrity is checked with Content-MD5.
+    """
+    def __init__(self, access_key, secret_key, region='us-east-1',
+                 service='s3', payload_hash='UNSIGNED-PAYLOAD'):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+        self.payload_hash = payload_hash
+
+    def signature(self, method, url, headers, amz_date):
+        """
+        :param method:    HTTP method.
+        :param url:       Percent-encoded url of the request.
+        :param headers:   The headers to sign, with lowercase names.
+        :param amz_date:  Time of the request, as ``YYYYMMDDTHHMMSSZ``.
+        :return:          A tuple of the signed header names and the
+                          signature.
+        """
+        url = urlsplit(url)
+        query = '&'.join(sorted(
+            '%s=%s' % (quote(key, safe='-_.~'), quote(value, safe='-_.~'))
+            for key, value in parse_qsl(url.query, keep_blank_values=True)))
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method, url.path or '/', query,
+            ''.join('%s:%s\n' % (name, ' '.join(str(headers[name]).split()))
+                    for name in sorted(headers)),
+            signed_headers, self.payload_hash])
+        scope = '%s/%s/%s/aws4_request' % (amz_date[:8], self.region,
+                                           self.service)
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (amz_date[:8], self.region, self.service, 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        return signed_headers, hmac.new(key, string_to_sign.encode('utf-8'),
+                                        hashlib.sha256).hexdigest()
+
+    def __call__(self, request):
+        amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        request.headers['x-amz-date'] = amz_date
+        request.headers['x-amz-content-sha256'] = self.payload_hash
+        headers = {name.lower(): value for name, value in request.headers.items()
+                   if name.lower().startswith('x-amz-') or
+                   name.lower() in ('content-md5', 'content-type')}
+        headers['host'] = urlsplit(request.url).netloc
+        signed_headers, signature = self.signature(request.method, request.url,
+                                                   headers, amz_date)
+        request.headers['Authorization'] = (
+            'AWS4-HMAC-SHA256 Credential=%s/%s/%s/%s/aws4_request, '
+            'SignedHeaders=%s, Signature=%s'
+            % (self.access_key, amz_date[:8], self.region, self.service,
+               signed_headers, signature))
+        return request
+
+
+class MultipartUpload(object):
+    """
+    Upload one file to IA-S3 with the S3 multipart API. Parts are retried
+    on their own, so a failure late in a large upload doesn't restart it
+    from the first byte.
+    """
+    def __init__(self, session, identifier, key, access_key, secret_key,
+                 metadata=None, endpoint=S3_ENDPOINT, timeout=(60, 600),
+                 retries=10, consume=None, queue_derive=False):
+        """
+        :param session:       A `requests.Session`, usually the
+                              `internetarchive.ArchiveSession` of the item.
+        :param identifier:    Identifier of the archive.org item.
+        :param key:           Name of the file in the item.
+        :param access_key:    IA-S3 access key.
+        :param secret_key:    IA-S3 secret key.
+        :param metadata:      Item metadata, used if the upload creates the item.
+        :param endpoint:      IA-S3 endpoint.
+        :param timeout:       Timeout passed to every request.
+        :param retries:       How often a request that failed with a connection
+                              error or a server error is retried.
+        :param consume:       Function called with the size of every block of
+                              a part that is sent, which can sleep to limit
+                              the upload rate, e.g. `Share.consume`.
+        :param queue_derive:  Queue a derive of the item once the upload is
+                              complete. Only the last upload of an item
+                              should, or every file queues its own derive.
+        """
+        self.session = session
+        self.url = '%s/%s/%s' % (endpoint, identifier, quote(key))
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.metadata = metadata
+        self.timeout = timeout
+        self.retries = retries
+        self.consume = consume
+        self.queue_derive = queue_derive
+        self.upload_id = None
+        self.parts = {}
+        self._lock = threading.Lock()
+
+    def _request(self, method, url, data=None, metadata=None,
+                 queue_derive=False):
+        return S3Request(method=method, url=url, data=data, metadata=metadata,
+                         queue_derive=queue_derive,
+                         access_key=self.access_key, secret_key=self.secret_key)
+
+    def _send(self, method, url, data=None, metadata=None, queue_derive=False):
+        return send_request(self.session,
+                            self._request(method, url, data, metadata,
+                                          queue_derive),
+                            self.retries, self.timeout)
+
+    def start(self):
+        response = self._send('POST', self.url + '?uploads',
+                              metadata=self.metadata)
+        # `{*}` matches the S3 namespace as well as no namespace at all.
+        self.upload_id = ET.fromstring(response.content).findtext(
+            './/{*}UploadId')
+        self.parts = {}
+        return self.upload_id
+
+    def upload_part(self, data, number=None):
+        """
+        Upload one part of the file.
+
+        :param data:    The bytes of the part.
+        :param number:  Number of the part, starting at 1. Defaults to the
+                        part after the last one uploaded.
+        :return:        The part number.
+        """
+        with self._lock:
+            if number is None:
+                number = len(self.parts) + 1
+        data = bytes(data)
+        if self.consume is not None:
+            data = ThrottledReader(io.BytesIO(data), self.consume)
+        response = self._send('PUT', '%s?partNumber=%d&uploadId=%s'
+                              % (self.url, number, quote(self.upload_id)),
+                              data=data)
+        with self._lock:
+            self.parts[number] = response.headers.get('ETag', '')
+        return number
+
+    def complete(self):
+        body = ''.join('<Part><PartNumber>%d</PartNumber><ETag>%s</ETag></Part>'
+                       % (number, self.parts[number]) for number in sorted(self.parts))
+        self._send('POST', '%s?uploadId=%s' % (self.url, quote(self.upload_id)),
+                   data=('<CompleteMultipartUpload>%s</CompleteMultipartUpload>'
+                         % body).encode('utf-8'),
+                   queue_derive=self.queue_derive)
+
+    def abort(self):
+        self._send('DELETE', '%s?uploadId=%s'
+                   % (self.url, quote(self.upload_id)))
+
+    def upload_stream(self, chunks, part_size=DEFAULT_PART_SIZE,
+                      progress=None):
+        """
+        Upload a file read from an iterable of byte strings. At most one part
+        is held in memory; the upload is aborted if anything fails.
+
+        :param chunks:     An iterable of byte strings, e.g.
+                           `requests.Response.iter_content()`.
+        :param part_size:  Size of every part but the last one.
+        :param progress:   Function called with the number of bytes sent so
+                           far after every part.
+        :return:           Number of bytes uploaded.
+        """
+        self.start()
+        sent = 0
+        buffer = bytearray()
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= part_size:
+                    self.upload_part(buffer[:part_size])
+                    del buffer[:part_size]
+                    sent += part_size
+                    if progress is not None:
+                        progress(sent)
+            if buffer or not self.parts:
+                self.upload_part(buffer)
+                sent += len(buffer)
+                if progress is not None:
+                    progress(sent)
+            self.complete()
+        except BaseException:
+            try:
+                self.abort()
+            except Exception:
+                pass
+            raise
+        return sent
+
+    def upload_file(self, path, part_size=DEFAULT_PART_SIZE, workers=4,
+                    state_path=None, progress=None):
+        """
+        Upload a local file, several parts at a time.
+
+        The upload id and the confirmed parts are saved to `state_path` after
+        every part, so an interrupted upload of the same file resumes from
+        where it stopped. The state file is removed once the upload is
+        complete.
+
+        :param path:        Path of the file to upload.
+        :param part_size:   Size of every part but the last one.
+        :param workers:     Number of parts uploaded at the same time.
+        :param state_path:  Where to save the upload state, None disables
+                            resuming.
+        :param progress:    Function called with the number of bytes sent so
+                            far after every part.
+        :return:            Number of bytes uploaded.
+        """
+        stat = os.stat(path)
+        part_count = max(1, -(-stat.st_size // part_size))
+        fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                       'part_size': part_size}
+
+        state = _load_state(state_path)
+        resumed = state is not None and state.get('file') == fingerprint
+        if resumed:
+            self.upload_id = state['upload_id']
+            self.parts = {int(number): etag
+                          for number, etag in state['parts'].items()}
+        else:
+            self.start()
+            _save_state(state_path, fingerprint, self.upload_id, self.parts)
+
+        def part_length(number):
+            return min(part_size, stat.st_size - (number - 1) * part_size)
+
+        sent = [sum(part_length(number) for number in self.parts)]
+
+        def send(number):
+            with open(path, 'rb') as f:
+                f.seek((number - 1) * part_size)
+                data = f.read(part_size)
+            self.upload_part(data, number)
+            with self._lock:
+                sent[0] += len(data)
+                _save_state(state_path, fingerprint, self.upload_id,
+                            self.parts)
+                if progress is not None:
+                    progress(sent[0])
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for future in as_completed(
+                    [pool.submit(send, number)
+                     for number in range(1, part_count + 1)
+                     if number not in self.parts]):
+                future.result()
+            self.complete()
+        except HTTPError as exc:
+            if not resumed or exc.response is None or exc.response.status_code != 404:
+                raise
+            # The saved upload is gone from IA-S3, start over.
+            pool.shutdown(cancel_futures=True)
+            _remove_state(state_path)
+            return self.upload_file(path, part_size, workers, state_path,
+                                    progress)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+        _remove_state(state_path)
+        return stat.st_size
+
+
+class SigV4MultipartUpload(MultipartUpload):
+    """
+    `MultipartUpload` to an S3-compatible store other than IA-S3, signed
+    with `SigV4Auth`.
+    """
+    def __init__(self, session, bucket, key, access_key, secret_key, endpoint,
+                 region='us-east-1', **kwargs):
+        """
+        :param bucket:    Name of the bucket.
+        :param key:       Key of the object in the bucket.
+        :param region:    Region the requests are signed for.
+        :param metadata:  User metadata of the object, stored as
+                          ``x-amz-meta-<name>`` headers.
+
+        The other parameters are the ones of `MultipartUpload`.
+        """
+        super().__init__(session, bucket, key, access_key, secret_key,
+                         endpoint=endpoint, **kwargs)
+        self.auth = SigV4Auth(access_key, secret_key, region)
+
+    def _request(self, method, url, data=None, metadata=None,
+                 queue_derive=False):
+        headers = {'x-amz-meta-%s' % name: value
+                   for name, value in (metadata or {}).items()}
+        return Request(method, url, data=data, headers=headers, auth=self.auth)
+
+
+def _load_state(state_path):
+    if state_path is None:
+        return None
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_path, fingerprint, upload_id, parts):
+    if state_path is None:
+        return
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (state_path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'file': fingerprint, 'upload_id': upload_id,
+                   'parts': parts}, f)
+    os.replace(tmp_path, state_path)
+
+
+def _remove_state(state_path):
+    if state_path is not None:
+        try:
+            os.remove(state_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,310 @@
+import os
+import abc
+import json
+import base64
+import shutil
+import xml.etree.ElementTree as ET
+import internetarchive
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from .bandwidth import ThrottledReader, UPLOAD
+from .checksum import file_checksums
+from .s3 import (SigV4Auth, SigV4MultipartUpload, send_request,
+                 DEFAULT_PART_SIZE, MULTIPART_THRESHOLD)
+
+
+class Storage(abc.ABC):
+    """
+    Where `TubeUp` uploads the items. Every method gets the `TubeUp`
+    instance doing the upload, for its settings, timers and metrics.
+    """
+    @abc.abstractmethod
+    def exists(self, tubeup, identifier):
+        """
+        :return:  True if the item has been completely uploaded.
+        """
+
+    @abc.abstractmethod
+    def files(self, identifier):
+        """
+        :return:  The files of the item, as dicts with a ``name``, a
+                  ``size`` and an ``md5``.
+        """
+
+    @abc.abstractmethod
+    def upload(self, tubeup, videobasename, custom_meta=None):
+        """
+        Upload a downloaded video, see `TubeUp.upload`.
+        """
+
+
+class IAStorage(Storage):
+    """
+    archive.org, uploaded to with IA-S3. Its concurrency and part size are
+    the ``upload_workers``, ``part_size`` and ``multipart_threshold``
+    settings of `TubeUp`.
+    """
+    def exists(self, tubeup, identifier):
+        item = internetarchive.get_item(identifier)
+        return item.exists and not tubeup.has_pending_multipart_uploads(identifier)
+
+    def files(self, identifier):
+        return internetarchive.get_item(identifier).files
+
+    def upload(self, tubeup, videobasename, custom_meta=None):
+        return tubeup.upload_ia(videobasename, custom_meta)
+
+
+class FileStorage(Storage):
+    """
+    A storage the files of an item are stored in one by one. Every item is
+    kept under its identifier, with its metadata in
+    ``<identifier>_meta.json``. The metadata is written last, so an item
+    only exists once all its files are stored.
+    """
+    #: Number of files of an item stored at the same time.
+    workers = 1
+
+    def meta_key(self, identifier):
+        return '%s/%s_meta.json' % (identifier, identifier)
+
+    @abc.abstractmethod
+    def store_file(self, tubeup, identifier, path, checksums):
+        """
+        Store one file in the item, then delete the local copy.
+
+        :param checksums:  The checksums and size of the file.
+        """
+
+    @abc.abstractmethod
+    def store_metadata(self, identifier, metadata):
+        """
+        Write the metadata of the item, once all its files are stored.
+        """
+
+    def upload(self, tubeup, videobasename, custom_meta=None):
+        itemname, metadata, vid_meta, all_files, checksums = tubeup.prepare_upload(
+            videobasename, custom_meta)
+        files_to_upload = tubeup.filter_uploaded_files(
+            itemname, self.files(itemname), all_files, checksums)
+        upload_size = sum(checksums[path]['size'] for path in files_to_upload)
+
+        tubeup.progress.update(itemname, 'upload', total=upload_size)
+        try:
+            with tubeup.timer.span('upload', itemname), \
+                    ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for future in [pool.submit(self.store_file, tubeup, itemname,
+                                           path, checksums[path])
+                               for path in files_to_upload]:
+                    future.result()
+                    tubeup.renew_locks()
+                self.store_metadata(itemname, metadata)
+        except Exception:
+            tubeup.progress.finish(itemname, 'error')
+            raise
+        tubeup.progress.finish(itemname)
+        tubeup.finish_upload(itemname, all_files, checksums, upload_size)
+
+        return itemname, metadata
+
+
+class S3Storage(FileStorage):
+    """
+    A bucket of an S3-compatible store, e.g. MinIO or AWS S3. Items are
+    stored as ``<identifier>/<file name>`` keys, with the md5 of every file
+    in its ``x-amz-meta-md5`` metadata.
+    """
+    def __init__(self, endpoint, bucket, access_key, secret_key,
+                 region='us-east-1', workers=4, part_size=DEFAULT_PART_SIZE,
+                 part_workers=4, multipart_threshold=MULTIPART_THRESHOLD,
+                 session=None):
+        """
+        :param endpoint:             Url of the store, the bucket is
+                                     addressed in the path.
+        :param bucket:               Name of the bucket.
+        :param access_key:           Access key.
+        :param secret_key:           Secret key.
+        :param region:               Region the requests are signed for.
+        :param workers:              Number of files of an item stored at
+                                     the same time.
+        :param part_size:            Size in bytes of the parts of multipart
+                                     uploads.
+        :param part_workers:         Number of parts of a multipart upload
+                                     sent at the same time.
+        :param multipart_threshold:  Files from this size in bytes on are
+                                     uploaded in parts.
+        :param session:              A `requests.Session`.
+        """
+        self.endpoint = endpoint.rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.workers = workers
+        self.part_size = part_size
+        self.part_workers = part_workers
+        self.multipart_threshold = multipart_threshold
+        self.session = requests.Session() if session is None else session
+        self.auth = SigV4Auth(access_key, secret_key, region)
+
+    def url(self, key=''):
+        return '%s/%s/%s' % (self.endpoint, self.bucket, quote(key))
+
+    def _send(self, method, url, data=None, headers=None):
+        return send_request(self.session,
+                            requests.Request(method, url, data=data,
+                                             headers=headers, auth=self.auth))
+
+    def exists(self, tubeup, identifier):
+        try:
+            self._send('HEAD', self.url(self.meta_key(identifier)))
+        except requests.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code == 404:
+                return False
+            raise
+        return True
+
+    def files(self, identifier):
+        prefix = identifier + '/'
+        files = []
+        token = None
+        while True:
+            url = '%s?list-type=2&prefix=%s' % (self.url(), quote(prefix, safe=''))
+            if token:
+                url += '&continuation-token=%s' % quote(token, safe='')
+            root = ET.fromstring(self._send('GET', url).content)
+            # `{*}` matches the S3 namespace as well as no namespace at all.
+            for content in root.iterfind('{*}Contents'):
+                key = content.findtext('{*}Key')
+                # The ETag of objects uploaded in one request is their md5,
+                # the one of multipart uploads ends with ``-<part count>``.
+                md5 = content.findtext('{*}ETag', '').strip('"')
+                if '-' in md5:
+                    md5 = self._send('HEAD', self.url(key)).headers.get(
+                        'x-amz-meta-md5')
+                files.append({'name': key[len(prefix):],
+                              'size': content.findtext('{*}Size'),
+                              'md5': md5})
+            token = root.findtext('{*}NextContinuationToken')
+            if root.findtext('{*}IsTruncated') != 'true' or not token:
+                return files
+
+    def store_file(self, tubeup, identifier, path, checksums):
+        key = '%s/%s' % (identifier, os.path.basename(path))
+        with tubeup.bandwidth.transfer(UPLOAD) as share:
+            if checksums['size'] >= self.multipart_threshold:
+                upload = SigV4MultipartUpload(
+                    self.session, self.bucket, key, self.access_key,
+                    self.secret_key, self.endpoint, self.region,
+                    metadata={'md5': checksums['md5']},
+                    consume=share.consume if share.rate else None)
+                upload.upload_file(
+                    path, self.part_size, self.part_workers,
+                    state_path=os.path.join(tubeup.multipart_upload_dir(identifier),
+                                            os.path.basename(path) + '.json'))
+            else:
+                with open(path, 'rb') as f:
+                    md5 = base64.b64encode(bytes.fromhex(checksums['md5']))
+                    self._send('PUT', self.url(key),
+                               data=ThrottledReader(f, share.consume) if share.rate else f,
+                               headers={'Content-MD5': md5.decode('ascii'),
+                                        'x-amz-meta-md5': checksums['md5']})
+        os.remove(path)
+
+    def store_metadata(self, identifier, metadata):
+        self._send('PUT', self.url(self.meta_key(identifier)),
+                   data=json.dumps(metadata).encode('utf-8'),
+                   headers={'Content-Type': 'application/json'})
+
+
+class LocalStorage(FileStorage):
+    """
+    A local directory, e.g. to stage items on a disk before they are
+    uploaded elsewhere. Items are directories named after their identifier.
+    """
+    def __init__(self, directory, workers=1):
+        """
+        :param directory:  The directory.
+        :param workers:    Number of files of an item moved at the same time,
+                           more than one only helps when the directory is on
+                           another file system.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.workers = workers
+
+    def path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def exists(self, tubeup, identifier):
+        return os.path.exists(self.path(self.meta_key(identifier)))
+
+    def files(self, identifier):
+        try:
+            names = os.listdir(self.path(identifier))
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in names:
+            path = os.path.join(self.path(identifier), name)
+            files.append({'name': name, 'size': os.path.getsize(path),
+                          'md5': file_checksums(path, ('md5',))['md5']})
+        return files
+
+    def store_file(self, tubeup, identifier, path, checksums):
+        destination = os.path.join(self.path(identifier), os.path.basename(path))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # A rename when both are on the same file system, a copy otherwise.
+        # The temporary name keeps half copied files out of the item.
+        shutil.move(path, destination + '.part')
+        os.replace(destination + '.part', destination)
+
+    def store_metadata(self, identifier, metadata):
+        path = self.path(self.meta_key(identifier))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        os.replace(path + '.part', path)
+
+
+def open_storage(target, s3_endpoint=None, workers=4, part_size=DEFAULT_PART_SIZE,
+                 multipart_threshold=MULTIPART_THRESHOLD, environ=os.environ):
+    """
+    Create the storage for a ``--upload-to`` target.
+
+    :param target:       ``ia`` for archive.org, ``s3://<bucket>`` for a
+                         bucket of `s3_endpoint`, or a local directory given
+                         as an absolute path, a path starting with ``./``,
+                         ``../`` or ``~`` or a ``file://`` url. Anything else
+                         is rejected, so a misspelt target isn't taken for a
+                         directory.
+    :param s3_endpoint:  Url of the S3-compatible store. The credentials and
+                         the region are read from ``AWS_ACCESS_KEY_ID``,
+                         ``AWS_SECRET_ACCESS_KEY`` and ``AWS_DEFAULT_REGION``.
+    :param workers:      Number of files or parts sent at the same time.
+    :return:             A `Storage`.
+    """
+    if target in (None, 'ia'):
+        return IAStorage()
+    if target.startswith('s3://'):
+        bucket = target[len('s3://'):].strip('/')
+        access_key = environ.get('AWS_ACCESS_KEY_ID')
+        secret_key = environ.get('AWS_SECRET_ACCESS_KEY')
+        if not bucket or not s3_endpoint or not access_key or not secret_key:
+            raise ValueError('Uploading to %s needs --s3-endpoint, '
+                             'AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY.'
+                             % target)
+        return S3Storage(s3_endpoint, bucket, access_key, secret_key,
+                         region=environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+                         workers=workers, part_size=part_size,
+                         part_workers=workers,
+                         multipart_threshold=multipart_threshold)
+    if target.startswith('file://'):
+        return LocalStorage(target[len('file://'):])
+    if (os.path.isabs(target) or target.startswith(('~', '.' + os.sep, '..' + os.sep)) or
+            target in ('.', '..')):
+        return LocalStorage(target)
+    raise ValueError('Unknown upload target %s, local directories are given as '
+                     'absolute or ./ paths or file:// urls.' % target)
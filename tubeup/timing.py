@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class StageTimer(object):
+    """
+    Record how long each pipeline stage takes for every archived video.
+
+    Every finished span is passed to the registered hooks as a dict with
+    the keys ``stage``, ``identifier``, ``start``, ``duration`` and ``ok``,
+    and is folded into per-stage totals used by `summary`.
+    """
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+
+    @contextmanager
+    def span(self, stage, identifier=None):
+        """
+        Time the body of a ``with`` block as one span of `stage`.
+
+        :param stage:       Name of the pipeline stage, e.g. ``download``.
+        :param identifier:  Item name or URL the span belongs to.
+        """
+        start = time.time()
+        counter = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(stage, identifier, start,
+                        time.perf_counter() - counter, ok)
+
+    def record(self, stage, identifier, start, duration, ok=True):
+        span = {
+            'stage': stage,
+            'identifier': identifier,
+            'start': start,
+            'duration': duration,
+            'ok': ok,
+        }
+        with self._lock:
+            count, total, longest = self._totals.get(stage, (0, 0.0, 0.0))
+            self._totals[stage] = (count + 1, total + duration,
+                                   max(longest, duration))
+        for hook in self.hooks:
+            hook(span)
+
+    def totals(self):
+        """
+        :return:  A dict mapping each stage to ``(count, total, max)``.
+        """
+        with self._lock:
+            return dict(self._totals)
+
+    def summary(self):
+        """
+        :return:  A plain text table with one row per recorded stage.
+        """
+        rows = ['%-14s %6s %10s %10s %10s'
+                % ('stage', 'count', 'total', 'mean', 'max')]
+        for stage, (count, total, longest) in self.totals().items():
+            rows.append('%-14s %6d %9.2fs %9.2fs %9.2fs'
+                        % (stage, count, total, total / count, longest))
+        return '\n'.join(rows)
+
+
+def json_lines_hook(fileobj):
+    """
+    Create a `StageTimer` hook that writes every span to `fileobj` as one
+    JSON document per line.
+    """
+    lock = threading.Lock()
+
+    def hook(span):
+        with lock:
+            fileobj.write(json.dumps(span) + '\n')
+            fileobj.flush()
+
+    return hook
@@ -1,11 +1,23 @@
 import os
 import re
+import errno
+import shutil
 from collections import defaultdict
+from hashlib import blake2b
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
 
 
 EMPTY_ANNOTATION_FILE = ('<?xml version="1.0" encoding="UTF-8" ?>'
                          '<document><annotations></annotations></document>')
 
+# The ioctl that clones a file on Linux, in `fcntl` from Python 3.12 on.
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
 
 def key_value_to_dict(lst):
     """
@@ -50,3 +62,180 @@ def check_is_file_empty(filepath):
         return os.stat(filepath).st_size == 0
     else:
         raise FileNotFoundError("Path '%s' doesn't exist" % filepath)
+
+
+def reflink_file(source, destination):
+    """
+    Make `destination` a copy-on-write clone of `source`, which shares its
+    data until one of them is modified. Only works on Linux, with file
+    systems like Btrfs or XFS.
+
+    :return:  False if the file system can't clone files.
+    """
+    if fcntl is None:
+        return False
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(destination)
+    return False
+
+
+def link_file(source, destination):
+    """
+    Hard-link `source` to `destination`, replacing it atomically. Files
+    that can't be hard-linked are cloned with `reflink_file` when the file
+    system supports it, and copied otherwise.
+
+    :param source:       Path of an existing file.
+    :param destination:  Path of the link.
+    """
+    tmp_path = '%s.%d.tmp' % (destination, os.getpid())
+    try:
+        os.link(source, tmp_path)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        if not reflink_file(source, tmp_path):
+            shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def iter_batch_urls(lines):
+    """
+    Lazily read urls from a batch file, one url per line.
+
+    Blank lines and lines starting with ``#``, ``;`` or ``]`` are skipped,
+    like in yt-dlp batch files.
+
+    :param lines:  An iterable of lines, e.g. an open file or `sys.stdin`.
+    :return:       A generator of urls.
+    """
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith(('#', ';', ']')):
+            yield url
+
+
+def dedup_urls(urls):
+    """
+    Lazily drop urls that have been seen before.
+
+    Only a 64-bit digest of every url is kept, so hundreds of thousands of
+    urls cost a few megabytes of memory.
+
+    :param urls:  An iterable of urls.
+    :return:      A generator of unique urls, in their original order.
+    """
+    seen = set()
+    for url in urls:
+        digest = int.from_bytes(
+            blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+        if digest not in seen:
+            seen.add(digest)
+            yield url
+
+
+# Metadata that is only set when an item is created.
+METADATA_REFRESH_IGNORED_KEYS = ('collection', 'mediatype', 'scanner')
+
+
+def _normalize_metadata_value(key, value):
+    if value is None:
+        return None
+    if key == 'subject':
+        # Stored either as a list or as a semicolon separated string.
+        if isinstance(value, str):
+            value = value.split(';')
+        value = frozenset(v.strip() for v in value if v and v.strip())
+    elif isinstance(value, (list, tuple)):
+        value = tuple(str(v).strip() for v in value)
+    else:
+        value = str(value).strip()
+    # archive.org doesn't store empty fields, an empty value is a missing one.
+    return value or None
+
+
+def diff_metadata(current, new):
+    """
+    Compare item metadata.
+
+    :param current:  The current metadata of an item.
+    :param new:      The metadata the item should have.
+    :return:         A dict of the fields of `new` that differ from
+                     `current`.
+    """
+    return {key: value for key, value in new.items()
+            if key not in METADATA_REFRESH_IGNORED_KEYS and
+            _normalize_metadata_value(key, value) !=
+            _normalize_metadata_value(key, current.get(key))}
+
+
+# IA's subject field has a 255 bytes length limit.
+SUBJECT_MAX_BYTES = 255
+
+# Well above YouTube's limit of 5000 characters, longer descriptions, e.g.
+# the chat logs some streams carry, are only uploaded in full in the
+# .description file.
+DESCRIPTION_MAX_BYTES = 32 * 1024
+
+DESCRIPTION_TRUNCATED_NOTE = ('<br><br>[Description truncated, the full text '
+                              'is in the .description file of this item.]')
+
+
+def join_subject(tags, limit=SUBJECT_MAX_BYTES):
+    """
+    Join tags into an IA semicolon-separated subject string, e.g.
+    ``Youtube;video;``.
+
+    If the string is longer than `limit` bytes, the trailing semicolon and
+    as many tags as needed are dropped from the end. Tags after the limit
+    are never looked at, so a video with thousands of tags costs as much
+    as one with a few.
+
+    :param tags:   An iterable of tags.
+    :param limit:  Maximum length of the subject in bytes.
+    :return:       The subject string.
+    """
+    def pieces():
+        # Tags containing semicolons count as several tags.
+        for tag in tags:
+            yield from ('%s' % tag).split(';')
+        yield ''
+
+    kept = []
+    size = -1
+    for piece in pieces():
+        size += len(piece.encode('utf-8')) + 1
+        if size > limit:
+            break
+        kept.append(piece)
+    return ';'.join(kept)
+
+
+def html_description(text, limit=DESCRIPTION_MAX_BYTES,
+                     note=DESCRIPTION_TRUNCATED_NOTE):
+    """
+    Convert a description for archive.org, which does not display raw
+    newlines, and cap its size.
+
+    :param text:   The description.
+    :param limit:  Maximum length of the result in bytes.
+    :param note:   Appended to descriptions that have been truncated.
+    :return:       The description with ``<br>`` line breaks, at most
+                   `limit` bytes long.
+    """
+    # A text of more than `limit` characters is more than `limit` bytes
+    # long, only that much of it is ever copied.
+    head = text[:limit + 1]
+    description = re.sub('\r?\n', '<br>', head)
+    encoded = description.encode('utf-8')
+    if len(head) <= limit and len(encoded) <= limit:
+        return description
+
+    cut = encoded[:limit - len(note.encode('utf-8'))].decode('utf-8', 'ignore')
+    # Don't leave half of a line break behind.
+    return re.sub('<(br?)?$', '', cut) + note
@@ -0,0 +1,178 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from itertools import islice
+
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_worker_id():
+    return '%s-%d' % (socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """
+    A queue of urls shared by several tubeup workers through one SQLite
+    database file.
+
+    A worker leases a url before archiving it. While the lease is valid no
+    other worker gets the same url; if the worker dies, the lease expires
+    and the url is handed out again.
+    """
+    def __init__(self, path, lease_seconds=6 * 3600, max_attempts=3,
+                 timeout=60):
+        """
+        :param path:           Path of the SQLite database, created if needed.
+        :param lease_seconds:  How long a worker may hold a url before it is
+                               handed to another worker.
+        :param max_attempts:   Number of failed attempts after which a url is
+                               marked as failed instead of being retried.
+        :param timeout:        Seconds to wait for another worker's write
+                               transaction to finish.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Leases are renewed from the threads uploading parts, the lock keeps
+        # them from using the connection at the same time.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' url TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL DEFAULT %r,'
+            ' worker TEXT,'
+            ' lease_expires REAL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' identifiers TEXT,'
+            ' error TEXT,'
+            ' updated REAL)' % PENDING)
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_status '
+                         'ON jobs (status, lease_expires)')
+
+    def close(self):
+        self._db.close()
+
+    def enqueue(self, urls):
+        """
+        Add urls to the queue, urls that are already queued are ignored.
+
+        :param urls:  An iterable of urls.
+        :return:      Number of urls that have been added.
+        """
+        added = 0
+        urls = iter(urls)
+        # Commit in chunks so a long url stream doesn't keep the other
+        # workers locked out of the database.
+        while True:
+            chunk = list(islice(urls, 1000))
+            if not chunk:
+                return added
+            with self._transaction():
+                for url in chunk:
+                    added += self._db.execute(
+                        'INSERT OR IGNORE INTO jobs (url, updated) '
+                        'VALUES (?, ?)', (url, time.time())).rowcount
+
+    def lease(self, worker_id):
+        """
+        Lease the next pending url, or a url whose lease has expired.
+
+        :param worker_id:  Name of the worker taking the lease.
+        :return:           The leased url, None if there is nothing to do.
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._db.execute(
+                'SELECT url FROM jobs WHERE status = ? '
+                'OR (status = ? AND lease_expires < ?) '
+                'ORDER BY rowid LIMIT 1', (PENDING, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                'UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, '
+                'attempts = attempts + 1, updated = ? WHERE url = ?',
+                (LEASED, worker_id, now + self.lease_seconds, now, row[0]))
+        return row[0]
+
+    def renew(self, url, worker_id):
+        """
+        Extend the lease of a url that takes long to archive.
+
+        :return:  False if the lease has been lost to another worker.
+        """
+        now = time.time()
+        with self._transaction():
+            return self._db.execute(
+                'UPDATE jobs SET lease_expires = ?, updated = ? '
+                'WHERE url = ? AND worker = ? AND status = ?',
+                (now + self.lease_seconds, now, url, worker_id,
+                 LEASED)).rowcount == 1
+
+    def complete(self, url, worker_id, identifiers=()):
+        """
+        Report that a url has been archived.
+
+        :param identifiers:  archive.org identifiers of the uploaded items.
+        """
+        with self._transaction():
+            self._db.execute(
+                'UPDATE jobs SET status = ?, lease_expires = NULL, '
+                'identifiers = ?, error = NULL, updated = ? '
+                'WHERE url = ? AND worker = ?',
+                (DONE, ' '.join(identifiers), time.time(), url, worker_id))
+
+    def fail(self, url, worker_id, error=None):
+        """
+        Report that archiving a url failed. The url is queued again until
+        it has failed `max_attempts` times.
+        """
+        with self._transaction():
+            self._db.execute(
+                'UPDATE jobs SET status = CASE WHEN attempts >= ? '
+                'THEN ? ELSE ? END, lease_expires = NULL, error = ?, '
+                'updated = ? WHERE url = ? AND worker = ?',
+                (self.max_attempts, FAILED, PENDING, error, time.time(),
+                 url, worker_id))
+
+    def counts(self):
+        """
+        :return:  A dict mapping each status to its number of urls.
+        """
+        with self._lock:
+            return dict(self._db.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+
+class _Transaction(object):
+    # BEGIN IMMEDIATE takes the database write lock up front, so two
+    # workers can never select the same pending url.
+    def __init__(self, db, lock):
+        self.db = db
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.db.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def __exit__(self, exc_type, *args):
+        try:
+            self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.lock.release()